@@ -0,0 +1,96 @@
+"""Performance benchmarks for the caches in `genericache`
+
+Run them all via `python -m scripts.bench`. Each benchmark module exposes a `run`
+function that returns a list of `Measurement`s, which are written out as JSON so that
+results from different commits can be compared.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+import socket
+import statistics
+import tempfile
+from typing import Any, Callable, Dict, Final, Generator, Iterable, List
+
+from genericache import Cache, MemoryCache, NoopCache
+from genericache.disk_cache import DiskCache
+from tests import hash_url, start_test_server
+
+CACHE_KINDS: Final[List[str]] = ["memory", "disk", "noop"]
+
+
+@dataclass
+class Measurement:
+    """Samples of a single quantity, e.g. the latency of one `get_by_url` call"""
+
+    benchmark: str
+    cache: str
+    metric: str
+    unit: str
+    samples: List[float]
+    params: Dict[str, int] = field(default_factory=lambda: {})
+
+    def to_json(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        return {
+            "benchmark": self.benchmark,
+            "cache": self.cache,
+            "metric": self.metric,
+            "unit": self.unit,
+            "params": self.params,
+            "count": len(ordered),
+            "min": ordered[0],
+            "median": statistics.median(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+        }
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+@contextmanager
+def serving_payloads(payloads: List[bytes]) -> Generator[int, None, None]:
+    """Serves `payloads[i]` at `/i` on localhost, yielding the port"""
+    port = free_port()
+    server_proc = start_test_server(payloads, server_port=port)
+    try:
+        yield port
+    finally:
+        server_proc.kill()
+        server_proc.join()
+
+
+@contextmanager
+def make_cache(kind: str) -> Generator[Cache[str], None, None]:
+    """A new, empty cache of the given kind
+
+    `DiskCache`s get a fresh directory each, since there is only ever one cache
+    per directory in a process
+    """
+    if kind == "memory":
+        yield MemoryCache[str](url_hasher=hash_url)
+    elif kind == "noop":
+        yield NoopCache[str](url_hasher=hash_url)
+    elif kind == "disk":
+        with tempfile.TemporaryDirectory(suffix="_bench_cache") as cache_dir:
+            yield DiskCache[str].create(
+                url_type=str, cache_dir=Path(cache_dir), url_hasher=hash_url
+            )
+    else:
+        raise ValueError(f"Unknown cache kind: {kind}")
+
+
+def payload_fetcher(size: int) -> Callable[[str], Iterable[bytes]]:
+    """A fetcher that produces `size` bytes derived from the URL, without any I/O"""
+
+    def fetch(url: str) -> Iterable[bytes]:
+        seed = url.encode("utf8")
+        return [(seed * (size // len(seed) + 1))[:size]]
+
+    return fetch
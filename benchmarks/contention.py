@@ -0,0 +1,74 @@
+"""N processes with M threads each, all fetching the same URLs into one `DiskCache`
+directory"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+import secrets
+import tempfile
+import time
+from typing import List, Sequence, Tuple
+
+from benchmarks import Measurement, serving_payloads
+from genericache.disk_cache import DiskCache
+from tests import HttpxFetcher, hash_url
+
+
+def _fetch_from_process(
+    cache_dir: Path, urls: List[str], threads: int
+) -> Tuple[int, int]:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    fetcher = HttpxFetcher()
+
+    def fetch_and_read(url: str) -> int:
+        return len(cache.fetch(url, fetcher).read())
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        _ = list(pool.map(fetch_and_read, urls * threads))
+    return (cache.hits(), cache.misses())
+
+
+def run(
+    *,
+    process_counts: Sequence[int],
+    threads: int,
+    payload_count: int,
+    payload_size: int,
+    repeats: int,
+) -> List[Measurement]:
+    payloads = [secrets.token_bytes(payload_size) for _ in range(payload_count)]
+    out: List[Measurement] = []
+    with serving_payloads(payloads) as port:
+        urls = [f"http://localhost:{port}/{i}" for i in range(payload_count)]
+        for processes in process_counts:
+            wall_times: List[float] = []
+            for _ in range(repeats):
+                with tempfile.TemporaryDirectory(suffix="_bench_cache") as cache_dir:
+                    with ProcessPoolExecutor(max_workers=processes) as pool:
+                        start = time.perf_counter()
+                        futs = [
+                            pool.submit(
+                                _fetch_from_process, Path(cache_dir), urls, threads
+                            )
+                            for _ in range(processes)
+                        ]
+                        misses = sum(fut.result()[1] for fut in futs)
+                        wall_times.append(time.perf_counter() - start)
+                    assert misses == payload_count, "some URL was fetched twice"
+            out.append(
+                Measurement(
+                    "contention",
+                    "disk",
+                    "wall_time",
+                    "seconds",
+                    wall_times,
+                    {
+                        "processes": processes,
+                        "threads": threads,
+                        "payloads": payload_count,
+                        "payload_size": payload_size,
+                    },
+                )
+            )
+    return out
@@ -0,0 +1,36 @@
+"""Throughput of `fetch` from the local test server, into empty (cold) and filled
+(warm) caches"""
+
+import secrets
+import time
+from typing import List
+
+from benchmarks import CACHE_KINDS, Measurement, make_cache, serving_payloads
+from genericache import Cache
+from tests import HttpxFetcher
+
+
+def _fetch_all(cache: Cache[str], fetcher: HttpxFetcher, urls: List[str]) -> float:
+    """Returns the bytes per second achieved fetching and reading all of `urls`"""
+    start = time.perf_counter()
+    size = sum(len(cache.fetch(url, fetcher).read()) for url in urls)
+    return size / (time.perf_counter() - start)
+
+
+def run(*, payload_count: int, payload_size: int, repeats: int) -> List[Measurement]:
+    payloads = [secrets.token_bytes(payload_size) for _ in range(payload_count)]
+    out: List[Measurement] = []
+    with serving_payloads(payloads) as port:
+        urls = [f"http://localhost:{port}/{i}" for i in range(payload_count)]
+        fetcher = HttpxFetcher()
+        for kind in CACHE_KINDS:
+            cold: List[float] = []
+            warm: List[float] = []
+            for _ in range(repeats):
+                with make_cache(kind) as cache:
+                    cold.append(_fetch_all(cache, fetcher, urls))
+                    warm.append(_fetch_all(cache, fetcher, urls))
+            params = {"payloads": payload_count, "payload_size": payload_size}
+            out.append(Measurement("fetch", kind, "cold", "bytes/s", cold, params))
+            out.append(Measurement("fetch", kind, "warm", "bytes/s", warm, params))
+    return out
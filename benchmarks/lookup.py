@@ -0,0 +1,39 @@
+"""Latency of `get_by_url` and `get` as the number of entries grows"""
+
+import random
+import time
+from typing import List, Sequence
+
+from benchmarks import CACHE_KINDS, Measurement, make_cache, payload_fetcher
+from genericache.digest import ContentDigest
+
+ENTRY_SIZE = 1024
+
+
+def run(*, entry_counts: Sequence[int], lookups: int) -> List[Measurement]:
+    out: List[Measurement] = []
+    fetcher = payload_fetcher(ENTRY_SIZE)
+    for kind in CACHE_KINDS:
+        for entry_count in entry_counts:
+            with make_cache(kind) as cache:
+                urls = [f"bench://lookup/{i}" for i in range(entry_count)]
+                digests: List[ContentDigest] = [
+                    cache.fetch(url, fetcher).content_digest for url in urls
+                ]
+                rng = random.Random(entry_count)
+                by_url: List[float] = []
+                by_digest: List[float] = []
+                for _ in range(lookups):
+                    idx = rng.randrange(entry_count)
+                    start = time.perf_counter()
+                    _ = cache.get_by_url(url=urls[idx])
+                    by_url.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    _ = cache.get(digest=digests[idx])
+                    by_digest.append(time.perf_counter() - start)
+            params = {"entries": entry_count}
+            out.append(
+                Measurement("lookup", kind, "get_by_url", "seconds", by_url, params)
+            )
+            out.append(Measurement("lookup", kind, "get", "seconds", by_digest, params))
+    return out
@@ -1,17 +1,28 @@
 import logging
+import mmap
 import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from io import BufferedReader, BytesIO
 from pathlib import Path
 from typing import (
     Any,
     Callable,
+    Dict,
     Final,
     Generic,
     Iterable,
+    Iterator,
+    List,
     Optional,
     Protocol,
+    Tuple,
     Type,
     TypeVar,
+    runtime_checkable,
 )
 
 from .digest import ContentDigest, UrlDigest
@@ -20,6 +31,7 @@ logger = logging.getLogger(__name__)
 
 
 U = TypeVar("U")
+U_contra = TypeVar("U_contra", contravariant=True)
 
 
 class CacheException(Exception):
@@ -77,16 +89,147 @@ class CacheFsLinkUsageMismatch(CacheException):
         )
 
 
+class CacheLayoutMismatch(CacheException):
+    def __init__(
+        self,
+        cache_dir: Path,
+        expected_sharded: bool,
+        found_sharded: bool,
+    ) -> None:
+        self.expected_sharded = expected_sharded
+        self.found_sharded = found_sharded
+        super().__init__(
+            f"Expected cache at {cache_dir} to have sharding set to {expected_sharded}, requested {found_sharded}"
+        )
+
+
+class CacheStagingDirMismatch(CacheException):
+    def __init__(self, cache_dir: Path, staging_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self.staging_dir = staging_dir
+        super().__init__(
+            f"Staging dir {staging_dir} is not on the same filesystem as {cache_dir}"
+        )
+
+
+class CacheReadOnly(CacheException):
+    """A cache opened with `DiskCache.open_read_only` was asked to write something"""
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        super().__init__(f"Cache at {cache_dir} was opened read-only")
+
+
+@runtime_checkable
+class ResumableFetcher(Protocol[U_contra]):
+    """A fetcher that can also continue an interrupted fetch, e.g. via an HTTP Range request
+
+    `resume` must produce the contents of `url` from byte `offset` onwards. Caches
+    that support it keep the bytes fetched so far when a fetch fails, and the next
+    attempt resumes where that one stopped, assuming that the contents of `url`
+    didn't change in between.
+    """
+
+    def __call__(self, url: U_contra, /) -> Iterable[bytes]: ...
+    def resume(self, url: U_contra, offset: int, /) -> Iterable[bytes]: ...
+
+
 class BytesReaderP(Protocol):
     def read(self, size: int = -1, /) -> bytes: ...
     def readable(self) -> bool: ...
     def seek(self, offset: int, whence: int = os.SEEK_SET, /) -> int: ...
     def seekable(self) -> bool: ...
     def tell(self) -> int: ...
+    def close(self) -> None: ...
     @property
     def closed(self) -> bool: ...
 
 
+class ImmutableBytesIO(BytesIO):
+    """A BytesIO over contents that never change
+
+    `getbuffer` exposes the original `bytes` directly, whereas a plain BytesIO would
+    copy them so that the returned view could be written to.
+    """
+
+    def __init__(self, contents: bytes) -> None:
+        super().__init__(contents)
+        self._contents: Final[bytes] = contents
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._contents)
+
+
+class VerifyingReader(BytesReaderP):
+    """Hashes the bytes read from `reader` as they are read, and raises `DigestMismatch`
+    from the `read` that reaches EOF if they don't match `content_digest`
+
+    Bytes are only hashed while they are read in order from the start. Rereading
+    them after a seek back is fine, but skipping ahead leaves a gap that stops any
+    check until the consumer comes back and reads the skipped bytes.
+    """
+
+    def __init__(
+        self, reader: BytesReaderP, *, url: Any, content_digest: ContentDigest
+    ) -> None:
+        super().__init__()
+        self._reader: Final[BytesReaderP] = reader
+        self._url: Final[Any] = url
+        self._content_digest: Final[ContentDigest] = content_digest
+        self._contents_hash: Final = hasher_by_name(content_digest.algorithm).new()
+        self._hashed: int = 0
+        self._position: int = reader.tell()
+        self._error: "Optional[DigestMismatch[Any]]" = None
+        self._checked: bool = False
+
+    def read(self, size: int = -1, /) -> bytes:
+        data = self._reader.read(size)
+        start = self._position
+        self._position += len(data)
+        if not self._checked and start <= self._hashed < self._position:
+            self._contents_hash.update(data[self._hashed - start :])
+            self._hashed = self._position
+        if (size < 0 or (size > 0 and not data)) and self._hashed == self._position:
+            self._check()
+        if self._error is not None:
+            raise self._error
+        return data
+
+    def _check(self) -> None:
+        if self._checked:
+            return
+        self._checked = True
+        actual = ContentDigest(
+            self._contents_hash.digest(), algorithm=self._content_digest.algorithm
+        )
+        if actual != self._content_digest:
+            self._error = DigestMismatch(
+                url=self._url,
+                expected_content_digest=self._content_digest,
+                actual_content_digest=actual,
+            )
+
+    def readable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET, /) -> int:
+        self._position = self._reader.seek(offset, whence)
+        return self._position
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        self._reader.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._reader.closed
+
+
 class CacheEntry(BytesReaderP):
     url_digest: Final[UrlDigest]
     content_digest: Final[ContentDigest]
@@ -120,12 +263,239 @@ class CacheEntry(BytesReaderP):
     def tell(self) -> int:
         return self._reader.tell()
 
+    def close(self) -> None:
+        self._reader.close()
+
     @property
     def closed(self) -> bool:
         return self._reader.closed
 
+    def __enter__(self) -> "CacheEntry":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def getbuffer(self) -> memoryview:
+        """Returns a read-only view over the whole contents, independent of `tell()`
+
+        Entries backed by a file are memory-mapped and entries backed by memory are
+        exposed directly, so the contents are not copied. Any other reader falls back
+        to reading everything into a new buffer.
+        """
+        reader = self._reader
+        if isinstance(reader, BytesIO):
+            return reader.getbuffer().toreadonly()
+        if isinstance(reader, BufferedReader):
+            fd = reader.fileno()
+            if os.fstat(fd).st_size == 0:  # empty files can't be mapped
+                return memoryview(b"")
+            return memoryview(mmap.mmap(fd, 0, access=mmap.ACCESS_READ)).toreadonly()
+        position = reader.tell()
+        _ = reader.seek(0)
+        contents = reader.read()
+        _ = reader.seek(position)
+        return memoryview(contents)
+
+
+class _Stream(ABC):
+    """The bytes of an entry that is still being fetched, shared by its `StreamingEntry`s
+
+    The thread running the fetch reports progress via `grow` and then either `finish`es
+    or `fail`s the stream. Subclasses decide where the bytes are kept in the meantime
+    and where the finished entry can be read from; their `read_partial` and
+    `open_finished` are only ever called by readers while holding `cond`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.cond: Final[threading.Condition] = threading.Condition()
+        self.available: int = 0
+        self.content_digest: Optional[ContentDigest] = None
+        self.error: "Optional[FetchInterrupted[Any]]" = None
+
+    @abstractmethod
+    def read_partial(self, position: int, size: int) -> bytes:
+        """Returns up to `size` of the bytes fetched so far, starting at `position`"""
+        ...
+
+    @abstractmethod
+    def open_finished(self) -> BytesReaderP: ...
+
+    def grow(self, size: int) -> None:
+        with self.cond:
+            self.available += size
+            self.cond.notify_all()
+
+    def finish(self, content_digest: ContentDigest) -> None:
+        with self.cond:
+            self.content_digest = content_digest
+            self.cond.notify_all()
+
+    def fail(self, error: "FetchInterrupted[Any]") -> None:
+        with self.cond:
+            if self.content_digest is None:
+                self.error = error
+            self.cond.notify_all()
+
+    def fetch_in_background(
+        self,
+        url: U,
+        fetch: "Callable[[], CacheEntry | FetchInterrupted[U] | DigestMismatch[U]]",
+        on_done: "Callable[[], None]",
+    ) -> None:
+        """Runs `fetch` in a new thread and fails the stream if the fetch fails
+
+        `fetch` is responsible for finishing the stream when it succeeds. The entry it
+        returns is closed, since readers follow the stream instead
+        """
+
+        def run() -> None:
+            try:
+                result = fetch()
+            except Exception as e:
+                result = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            if isinstance(result, CacheEntry):
+                result.close()
+            elif isinstance(result, FetchInterrupted):
+                self.fail(result)
+            on_done()
+
+        threading.Thread(target=run, name=f"genericache-fetch-{url}").start()
+
+
+class StreamingEntry(BytesReaderP, Generic[U]):
+    """A reader over an entry that may still be being fetched
+
+    Bytes are served as soon as the fetcher produces them, so `read(size)` may return
+    fewer than `size` bytes before the end of the entry; only an empty result means
+    EOF. Reading past what has been fetched so far blocks until more bytes arrive.
+
+    The content digest is only known once the whole entry has been fetched, so
+    errors surface from `read`: `FetchInterrupted` if the fetch fails midway, and
+    `DigestMismatch` if the fetched contents don't match `expected_content_digest`.
+    """
+
+    url: Final[U]
+    url_digest: Final[UrlDigest]
+
+    def __init__(
+        self,
+        *,
+        url: U,
+        url_digest: UrlDigest,
+        stream: _Stream,
+        expected_content_digest: Optional[ContentDigest] = None,
+    ) -> None:
+        self.url = url
+        self.url_digest = url_digest
+        self._stream: Final[_Stream] = stream
+        self._expected_content_digest: Final[Optional[ContentDigest]] = (
+            expected_content_digest
+        )
+        self._position: int = 0
+        self._finished_reader: Optional[BytesReaderP] = None
+        super().__init__()
+
+    def _check_finished(self) -> Optional[BytesReaderP]:
+        """Opens the finished entry, if any. Must be called while holding `cond`"""
+        stream = self._stream
+        if stream.error is not None:
+            raise stream.error
+        if stream.content_digest is None:
+            return None
+        if (
+            self._expected_content_digest is not None
+            and stream.content_digest != self._expected_content_digest
+        ):
+            raise DigestMismatch(
+                url=self.url,
+                expected_content_digest=self._expected_content_digest,
+                actual_content_digest=stream.content_digest,
+            )
+        reader = stream.open_finished()
+        _ = reader.seek(self._position)
+        self._finished_reader = reader
+        return reader
+
+    def _wait_finished(self) -> BytesReaderP:
+        if self._finished_reader is not None:
+            return self._finished_reader
+        with self._stream.cond:
+            while True:
+                reader = self._check_finished()
+                if reader is not None:
+                    return reader
+                _ = self._stream.cond.wait()
+
+    def wait_content_digest(self) -> ContentDigest:
+        """Blocks until the whole entry has been fetched and returns its digest"""
+        _ = self._wait_finished()
+        content_digest = self._stream.content_digest
+        assert content_digest is not None
+        return content_digest
+
+    def read(self, size: int = -1, /) -> bytes:
+        if size < 0 or self._finished_reader is not None:
+            data = self._wait_finished().read(size)
+            self._position += len(data)
+            return data
+        if size == 0:
+            return b""
+        stream = self._stream
+        with stream.cond:
+            while True:
+                finished_reader = self._check_finished()
+                if finished_reader is not None:
+                    data = finished_reader.read(size)
+                    break
+                if stream.available > self._position:
+                    data = stream.read_partial(
+                        self._position, min(size, stream.available - self._position)
+                    )
+                    break
+                _ = stream.cond.wait()
+        self._position += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET, /) -> int:
+        if whence == os.SEEK_END or self._finished_reader is not None:
+            self._position = self._wait_finished().seek(offset, whence)
+        elif whence == os.SEEK_CUR:
+            self._position += offset
+        else:
+            self._position = offset
+        return self._position
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        """Closes the finished entry, if it has been opened. The fetch carries on"""
+        if self._finished_reader is not None:
+            self._finished_reader.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._finished_reader is not None and self._finished_reader.closed
+
+    def __enter__(self) -> "StreamingEntry[U]":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
 
 class Cache(Protocol[U]):
+    url_hasher: "Callable[[U], UrlDigest]"
+    freshness: "FreshnessPolicy"
+
     def hits(self) -> int: ...
     def misses(self) -> int: ...
     def get_by_url(self, *, url: U) -> Optional[CacheEntry]: ...
@@ -137,24 +507,376 @@ class Cache(Protocol[U]):
         force_refetch: "bool | ContentDigest",
     ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]": ...
 
+    def open_if_cached(self, *, url: U) -> Optional[CacheEntry]:
+        """Opens the cached entry of `url` as a hit, if that doesn't need to wait for
+        any lock or fetch, e.g. so that an event loop can serve it itself
+
+        Returns None otherwise, which is all that caches that can't tell do
+        """
+        return None
+
+    def fetched_at(self, *, url: U) -> Optional[datetime]:
+        """When the cached entry of `url` was fetched, or None if it isn't cached
+
+        Unlike `get_by_url`, this doesn't count as a use of the entry, so that its
+        freshness can be judged before deciding to serve or refetch it
+        """
+        cached = self.get_by_url(url=url)
+        if cached is None:
+            return None
+        with cached:
+            return cached.timestamp
+
+    def _must_refetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        freshness: "FreshnessPolicy",
+    ) -> bool:
+        """Whether the cached entry for `url` has expired according to `freshness`, for
+        fetches that can't judge the entry they return, e.g. because they stream it
+
+        Stale entries are revalidated in the background
+        """
+        if isinstance(freshness, NeverExpire):
+            return False
+        fetched_at = self.fetched_at(url=url)
+        if fetched_at is None:
+            return False
+        verdict = freshness.judge(age=time.time() - fetched_at.timestamp())
+        if verdict is Freshness.STALE:
+            cached = self.get_by_url(url=url)
+            if cached is not None:
+                with cached:
+                    _revalidate_in_background(
+                        self,
+                        url,
+                        fetcher,
+                        cached,
+                        retry_policy=ExponentialBackoff(),
+                        freshness=freshness,
+                    )
+        return verdict is Freshness.EXPIRED
+
     def fetch(
         self,
         url: U,
         fetcher: "Callable[[U], Iterable[bytes]]",
         force_refetch: "bool | ContentDigest" = False,
         retries: int = 3,
+        retry_policy: "Optional[RetryPolicy]" = None,
+        freshness: "Optional[FreshnessPolicy]" = None,
     ) -> "CacheEntry":
-        for _ in range(retries):
-            result = self.try_fetch(url, fetcher, force_refetch=force_refetch)
-            if isinstance(result, CacheEntry):
-                return result
-            if isinstance(result, FetchInterrupted):
-                continue
+        """Fetches `url`, retrying as told by `retry_policy`
+
+        By default, `FetchInterrupted` is retried up to `retries` times in total, with
+        an `ExponentialBackoff`. Errors that the policy doesn't retry are raised as is,
+        and `RetriesExhausted` is raised once the policy gives up.
+
+        Unless `force_refetch` is set, a cached entry is judged by `freshness` (by
+        default the cache's own `freshness`): expired entries are refetched before
+        returning, and stale ones are returned while a background thread refetches them.
+        """
+        Prefetcher.make_way_for(self, url)
+        result = _fetch_with_retries(
+            self,
+            url,
+            fetcher,
+            force_refetch=force_refetch,
+            retry_policy=retry_policy or ExponentialBackoff(max_attempts=retries),
+            freshness=freshness or self.freshness,
+            raise_errors=True,
+        )
+        if isinstance(result, Exception):
             raise result
+        return result
+
+    def fetch_streaming(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        force_refetch: "bool | ContentDigest" = False,
+        freshness: "Optional[FreshnessPolicy]" = None,
+    ) -> "CacheEntry | StreamingEntry[U]":
+        """Like `fetch`, but returns before the fetch is over, with a reader that serves
+        bytes as soon as they are fetched
+
+        Caches that can't serve partial entries fetch the whole entry first.
+        """
+        return self.fetch(
+            url, fetcher, force_refetch=force_refetch, freshness=freshness
+        )
+
+    def fetch_many(
+        self,
+        urls: Iterable[U],
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        *,
+        max_concurrency: int = 8,
+        force_refetch: bool = False,
+        retries: int = 3,
+        retry_policy: "Optional[RetryPolicy]" = None,
+        freshness: "Optional[FreshnessPolicy]" = None,
+    ) -> "Iterator[Tuple[U, CacheEntry | FetchInterrupted[U] | DigestMismatch[U]]]":
+        """Fetches many URLs with at most `max_concurrency` fetches running at a time
+
+        Repeated URLs are only fetched once. Results are yielded as they complete,
+        and a URL that fails even after retrying as in `fetch` yields its error
+        instead of aborting the whole batch. Any exception raised while fetching
+        counts as a `FetchInterrupted`.
+        """
+        policy = retry_policy or ExponentialBackoff(max_attempts=retries)
+        unique_urls: Dict[UrlDigest, U] = {}
+        for url in urls:
+            _ = unique_urls.setdefault(self.url_hasher(url), url)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            url_by_future = {
+                pool.submit(
+                    _fetch_in_foreground,
+                    self,
+                    url,
+                    fetcher,
+                    force_refetch=force_refetch,
+                    retry_policy=policy,
+                    freshness=freshness or self.freshness,
+                    raise_errors=False,
+                ): url
+                for url in unique_urls.values()
+            }
+            for future in as_completed(url_by_future):
+                yield (url_by_future[future], future.result())
+
+    def prefetch(
+        self,
+        urls: Iterable[U],
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        *,
+        priority: int = 0,
+    ) -> "Prefetcher[U]":
+        """Fetches `urls` in the background, highest `priority` first, and returns
+        right away
+
+        Returns the `Prefetcher` of this cache, which reports the progress.
+        """
+        prefetcher = Prefetcher[U].of(self)
+        prefetcher.prefetch(urls, fetcher, priority=priority)
+        return prefetcher
+
+
+def _fetch_in_foreground(
+    cache: Cache[U],
+    url: U,
+    fetcher: "Callable[[U], Iterable[bytes]]",
+    *,
+    force_refetch: "bool | ContentDigest",
+    retry_policy: "RetryPolicy",
+    freshness: "FreshnessPolicy",
+    raise_errors: bool,
+) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+    """`_fetch_with_retries`, after taking over any prefetch of `url`"""
+    Prefetcher.make_way_for(cache, url)
+    return _fetch_with_retries(
+        cache,
+        url,
+        fetcher,
+        force_refetch=force_refetch,
+        retry_policy=retry_policy,
+        freshness=freshness,
+        raise_errors=raise_errors,
+    )
+
+
+def _age(entry: CacheEntry) -> float:
+    return time.time() - entry.timestamp.timestamp()
+
+
+# the stale entries being revalidated in the background, by cache and URL digest
+_revalidations_lock: Final[threading.Lock] = threading.Lock()
+_revalidations: Dict[Tuple[int, UrlDigest], CacheEntry] = {}
+
+
+def _revalidate_in_background(
+    cache: Cache[U],
+    url: U,
+    fetcher: "Callable[[U], Iterable[bytes]]",
+    stale: CacheEntry,
+    *,
+    retry_policy: "RetryPolicy",
+    freshness: "FreshnessPolicy",
+) -> None:
+    """Refetches `url` in a new thread, unless that is already being done"""
+    key = (id(cache), stale.url_digest)
+    with _revalidations_lock:
+        if key in _revalidations:
+            return
+        _revalidations[key] = stale
 
-        raise RuntimeError("Number of retries exhausted")
+    def run() -> None:
+        try:
+            # it may have been refetched since it was found to be stale
+            current = cache.get_by_url(url=url)
+            if current and freshness.judge(age=_age(current)) is Freshness.FRESH:
+                return
+            result = _retry_try_fetch(
+                cache,
+                url,
+                fetcher,
+                force_refetch=True,
+                retry_policy=retry_policy,
+                raise_errors=False,
+            )
+            if isinstance(result, Exception):
+                logger.warning(f"Could not revalidate {url}: {result!r}")
+        finally:
+            with _revalidations_lock:
+                del _revalidations[key]
+
+    threading.Thread(target=run, name=f"genericache-revalidate-{url}").start()
+
+
+def _open_revalidating(
+    cache: Cache[U], url: U, freshness: "FreshnessPolicy"
+) -> Optional[CacheEntry]:
+    """Opens the stale entry of `url` if it is being revalidated, since fetching it
+    would wait for the revalidation
+    """
+    url_digest = cache.url_hasher(url)
+    with _revalidations_lock:
+        stale = _revalidations.get((id(cache), url_digest))
+    if stale is None or freshness.judge(age=_age(stale)) is Freshness.EXPIRED:
+        return None
+    reader = cache.get(digest=stale.content_digest)
+    if reader is None:
+        return None
+    return CacheEntry(
+        url_digest=url_digest,
+        content_digest=stale.content_digest,
+        reader=reader,
+        timestamp=stale.timestamp,
+    )
+
+
+def _fetch_with_retries(
+    cache: Cache[U],
+    url: U,
+    fetcher: "Callable[[U], Iterable[bytes]]",
+    *,
+    force_refetch: "bool | ContentDigest",
+    retry_policy: "RetryPolicy",
+    freshness: "FreshnessPolicy",
+    raise_errors: bool,
+) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+    """Like `_retry_try_fetch`, but refetches cached entries that `freshness` says are
+    too old, or revalidates them in the background if they are only stale
+    """
+    if force_refetch is False and _revalidations:
+        stale = _open_revalidating(cache, url, freshness)
+        if stale is not None:
+            return stale
+    if force_refetch is False and not isinstance(freshness, NeverExpire):
+        # judged before opening, so that an expired entry doesn't count as a hit
+        fetched_at = cache.fetched_at(url=url)
+        if (
+            fetched_at is not None
+            and freshness.judge(age=time.time() - fetched_at.timestamp())
+            is Freshness.EXPIRED
+        ):
+            force_refetch = True
+    result = _retry_try_fetch(
+        cache,
+        url,
+        fetcher,
+        force_refetch=force_refetch,
+        retry_policy=retry_policy,
+        raise_errors=raise_errors,
+    )
+    if force_refetch is not False or not isinstance(result, CacheEntry):
+        return result
+    verdict = freshness.judge(age=_age(result))
+    if verdict is Freshness.STALE:
+        _revalidate_in_background(
+            cache, url, fetcher, result, retry_policy=retry_policy, freshness=freshness
+        )
+    if verdict is not Freshness.EXPIRED:
+        return result
+    return _retry_try_fetch(
+        cache,
+        url,
+        fetcher,
+        force_refetch=True,
+        retry_policy=retry_policy,
+        raise_errors=raise_errors,
+    )
+
+
+def _retry_try_fetch(
+    cache: Cache[U],
+    url: U,
+    fetcher: "Callable[[U], Iterable[bytes]]",
+    *,
+    force_refetch: "bool | ContentDigest",
+    retry_policy: "RetryPolicy",
+    raise_errors: bool,
+) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+    """Calls `try_fetch` until it succeeds or `retry_policy` gives up
+
+    Exceptions raised by `try_fetch` are raised if `raise_errors` and the policy
+    doesn't retry them; otherwise they are handled as `FetchInterrupted`.
+    """
+    attempts: List[FetchAttempt] = []
+    first_started = time.monotonic()
+    while True:
+        started = time.monotonic()
+        raised: Optional[Exception] = None
+        try:
+            result = cache.try_fetch(url, fetcher, force_refetch=force_refetch)
+        except Exception as e:
+            raised = e
+            result = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            result.__cause__ = e
+        if isinstance(result, CacheEntry):
+            return result
+        error = raised if raise_errors and raised else result
+        now = time.monotonic()
+        attempts.append(
+            FetchAttempt(
+                error=error, started=started - first_started, duration=now - started
+            )
+        )
+        if not retry_policy.should_retry(error):
+            if error is not result:
+                raise error
+            return result
+        delay = retry_policy.next_delay(attempts=attempts, elapsed=now - first_started)
+        if delay is None:
+            exhausted = RetriesExhausted(url=url, attempts=attempts)
+            exhausted.__cause__ = error
+            return exhausted
+        time.sleep(delay)
 
 
+from .retry import ExponentialBackoff as ExponentialBackoff  # noqa: E402
+from .retry import FetchAttempt as FetchAttempt  # noqa: E402
+from .retry import RetriesExhausted as RetriesExhausted  # noqa: E402
+from .retry import RetryPolicy as RetryPolicy  # noqa: E402
+from .freshness import Freshness as Freshness  # noqa: E402
+from .freshness import FreshnessPolicy as FreshnessPolicy  # noqa: E402
+from .freshness import NeverExpire as NeverExpire  # noqa: E402
+from .freshness import Ttl as Ttl  # noqa: E402
+from .negative_caching import NegativeCaching as NegativeCaching  # noqa: E402
+from .negative_caching import RecentlyFailed as RecentlyFailed  # noqa: E402
+from .metrics import CacheMetrics as CacheMetrics  # noqa: E402
+from .metrics import render_openmetrics as render_openmetrics  # noqa: E402
+from .hashing import Blake2bHasher as Blake2bHasher  # noqa: E402
+from .hashing import Blake3Hasher as Blake3Hasher  # noqa: E402
+from .hashing import ContentHasher as ContentHasher  # noqa: E402
+from .hashing import HasherUnavailable as HasherUnavailable  # noqa: E402
+from .hashing import Sha256Hasher as Sha256Hasher  # noqa: E402
+from .hashing import hasher_by_name as hasher_by_name  # noqa: E402
 from .disk_cache import DiskCache as DiskCache  # noqa: E402
 from .memory_cache import MemoryCache as MemoryCache  # noqa: E402
 from .noop_cache import NoopCache as NoopCache  # noqa: E402
+from .tiered_cache import TieredCache as TieredCache  # noqa: E402
+from .prefetch import Prefetcher as Prefetcher  # noqa: E402
+from .peer_cache import PeerCache as PeerCache  # noqa: E402
+from .peer_cache import PeerServer as PeerServer  # noqa: E402
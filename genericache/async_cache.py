@@ -0,0 +1,303 @@
+import asyncio
+import functools
+import logging
+import queue
+import time
+from typing import (
+    AsyncIterable,
+    Callable,
+    Dict,
+    Final,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from genericache import Cache, CacheEntry, DigestMismatch, FetchInterrupted
+from genericache.digest import ContentDigest, UrlDigest
+from genericache.disk_cache import DiskCache
+from genericache.freshness import Freshness, FreshnessPolicy, NeverExpire
+from genericache.memory_cache import MemoryCache
+from genericache.retry import (
+    ExponentialBackoff,
+    FetchAttempt,
+    RetriesExhausted,
+    RetryPolicy,
+)
+
+logger = logging.getLogger(__name__)
+
+U = TypeVar("U")
+T = TypeVar("T")
+
+
+class _LoopChunks:
+    """Drains an async iterable from a worker thread
+
+    The chunks are produced by a task on the event loop, so async fetchers (e.g.
+    httpx.AsyncClient) keep running on the loop they belong to. That task runs up to
+    `max_pending` chunks ahead of the thread, which only waits when it has caught up
+    rather than for a round trip through the loop per chunk.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterable[bytes],
+        loop: asyncio.AbstractEventLoop,
+        *,
+        max_pending: int = 16,
+    ) -> None:
+        super().__init__()
+        self._loop: Final[asyncio.AbstractEventLoop] = loop
+        self._max_pending: Final[int] = max_pending
+        # chunks, then None at the end or the error that stopped the iteration
+        self._received: "queue.Queue[bytes | BaseException | None]" = queue.Queue()
+        self._room: Optional[asyncio.Semaphore] = None
+        self._pump: Final = asyncio.run_coroutine_threadsafe(self._run(chunks), loop)
+
+    async def _run(self, chunks: AsyncIterable[bytes]) -> None:
+        room = self._room = asyncio.Semaphore(self._max_pending)
+        try:
+            async for chunk in chunks:
+                _ = await room.acquire()
+                self._received.put(chunk)
+        except BaseException as e:  # including cancellation, so the thread sees it
+            self._received.put(e)
+            raise
+        self._received.put(None)
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            while True:
+                item = self._received.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                assert self._room is not None  # set before the first chunk is put
+                _ = self._loop.call_soon_threadsafe(self._room.release)
+                yield item
+        finally:
+            _ = self._pump.cancel()  # e.g. when the cache stops early
+
+
+class AsyncCache(Generic[U]):
+    """Exposes a `Cache` to asyncio code, with fetchers producing `AsyncIterable[bytes]`
+
+    Concurrent fetches of the same URL are deduplicated with asyncio Futures, so only
+    one coroutine per URL hands the work over to a worker thread, where the wrapped
+    cache takes its locks (including the inter-process `FileLock` of `DiskCache`)
+    without blocking the event loop. Every other coroutine just awaits and then opens
+    the result from the wrapped cache. Lookups in the wrapped cache, which may query
+    the index of a `DiskCache`, also run on worker threads.
+
+    An instance must only be used from a single event loop.
+    """
+
+    def __init__(self, *, cache: Cache[U], url_hasher: "Callable[[U], UrlDigest]"):
+        super().__init__()
+        self.cache: Final[Cache[U]] = cache
+        self.url_hasher: Final[Callable[[U], UrlDigest]] = url_hasher
+        self._ongoing_fetches: Dict[
+            UrlDigest, "asyncio.Future[ContentDigest | FetchInterrupted[U]]"
+        ] = {}
+        self._joined_fetches = 0
+        # strong references, so that the event loop doesn't drop the tasks
+        self._revalidations: "Set[asyncio.Task[None]]" = set()
+
+    def hits(self) -> int:
+        return self.cache.hits() + self._joined_fetches
+
+    def misses(self) -> int:
+        return self.cache.misses()
+
+    async def open_if_cached(self, *, url: U) -> Optional[CacheEntry]:
+        """Serves a cached entry if the wrapped cache can do so without waiting for a
+        lock or a fetch; see `Cache.open_if_cached`
+        """
+        if self.url_hasher(url) in self._ongoing_fetches:
+            return None
+        return await self._run_in_thread(
+            functools.partial(self.cache.open_if_cached, url=url)
+        )
+
+    async def _run_in_thread(self, func: Callable[[], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(None, func)
+
+    async def get_by_url(self, *, url: U) -> Optional[CacheEntry]:
+        return await self._run_in_thread(
+            functools.partial(self.cache.get_by_url, url=url)
+        )
+
+    async def get(self, *, digest: ContentDigest) -> Optional[CacheEntry]:
+        return await self._run_in_thread(
+            functools.partial(self.cache.get, digest=digest)
+        )
+
+    async def try_fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], AsyncIterable[bytes]]",
+        force_refetch: "bool | ContentDigest",
+    ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+        result, _ = await self._try_fetch(url, fetcher, force_refetch)
+        return result
+
+    async def _try_fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], AsyncIterable[bytes]]",
+        force_refetch: "bool | ContentDigest",
+    ) -> "Tuple[CacheEntry | FetchInterrupted[U] | DigestMismatch[U], Optional[Exception]]":
+        """Like `try_fetch`, but also returns the exception that the wrapped cache
+        raised, if any, rather than only the `FetchInterrupted` it was turned into
+        """
+        if force_refetch is False:
+            cached = await self.open_if_cached(url=url)
+            if cached is not None:
+                return (cached, None)
+        url_digest = self.url_hasher(url)
+        ongoing = self._ongoing_fetches.get(url_digest)
+        if ongoing is not None:  # some other coroutine is fetching it
+            result = await asyncio.shield(ongoing)
+            if isinstance(result, Exception):
+                return (result, None)
+            if isinstance(force_refetch, ContentDigest) and result != force_refetch:
+                mismatch = DigestMismatch(
+                    url=url,
+                    expected_content_digest=force_refetch,
+                    actual_content_digest=result,
+                )
+                return (mismatch, None)
+            entry = await self.get(digest=result)  # never waits on locks or fetches
+            if entry is not None:
+                self._joined_fetches += 1
+                return (entry, None)
+            # evicted in the meantime; fall through and fetch it again
+
+        loop = asyncio.get_running_loop()
+        ongoing = self._ongoing_fetches[url_digest] = loop.create_future()
+        raised: Optional[Exception] = None
+        try:
+            out = await self._run_in_thread(
+                lambda: self.cache.try_fetch(
+                    url,
+                    lambda url: iter(_LoopChunks(fetcher(url), loop)),
+                    force_refetch=force_refetch,
+                )
+            )
+        except asyncio.CancelledError:
+            # the worker thread carries on, but waiters must not hang on this Future
+            ongoing.set_result(FetchInterrupted(url=url))
+            raise
+        except Exception as e:
+            raised = e
+            out = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            out.__cause__ = e
+        finally:
+            del self._ongoing_fetches[url_digest]
+
+        if isinstance(out, CacheEntry):
+            ongoing.set_result(out.content_digest)
+        elif isinstance(out, DigestMismatch):
+            ongoing.set_result(out.actual_content_digest)
+        else:
+            ongoing.set_result(out)
+        return (out, raised)
+
+    async def fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], AsyncIterable[bytes]]",
+        force_refetch: "bool | ContentDigest" = False,
+        retries: int = 3,
+        retry_policy: Optional[RetryPolicy] = None,
+        freshness: Optional[FreshnessPolicy] = None,
+    ) -> CacheEntry:
+        """Like `Cache.fetch`, but waits between retries without blocking the loop
+
+        Entries that the wrapped cache can serve without waiting (see
+        `Cache.open_if_cached`) are served without taking its locks, and errors are
+        retried or raised just as `Cache.fetch` would. Stale entries are revalidated by
+        a task on the loop rather than by a thread
+        """
+        policy = retry_policy or ExponentialBackoff(max_attempts=retries)
+        freshness = freshness or self.cache.freshness
+        if force_refetch is False and not isinstance(freshness, NeverExpire):
+            # judged before opening, so that an expired entry doesn't count as a hit
+            fetched_at = await self._run_in_thread(
+                functools.partial(self.cache.fetched_at, url=url)
+            )
+            if (
+                fetched_at is not None
+                and freshness.judge(age=time.time() - fetched_at.timestamp())
+                is Freshness.EXPIRED
+            ):
+                force_refetch = True
+        entry = await self._retry_try_fetch(url, fetcher, force_refetch, policy)
+        if force_refetch is not False:
+            return entry
+        age = time.time() - entry.timestamp.timestamp()
+        verdict = freshness.judge(age=age)
+        if (
+            verdict is Freshness.STALE
+            and self.url_hasher(url) not in self._ongoing_fetches
+        ):
+            task = asyncio.ensure_future(self._revalidate(url, fetcher))
+            self._revalidations.add(task)
+            task.add_done_callback(self._revalidations.discard)
+        if verdict is not Freshness.EXPIRED:
+            return entry
+        return await self._retry_try_fetch(url, fetcher, True, policy)
+
+    async def _revalidate(
+        self, url: U, fetcher: "Callable[[U], AsyncIterable[bytes]]"
+    ) -> None:
+        result = await self.try_fetch(url, fetcher, force_refetch=True)
+        if isinstance(result, Exception):
+            logger.warning(f"Could not revalidate {url}: {result!r}")
+
+    async def _retry_try_fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], AsyncIterable[bytes]]",
+        force_refetch: "bool | ContentDigest",
+        policy: RetryPolicy,
+    ) -> CacheEntry:
+        attempts: List[FetchAttempt] = []
+        first_started = time.monotonic()
+        while True:
+            started = time.monotonic()
+            result, raised = await self._try_fetch(url, fetcher, force_refetch)
+            if isinstance(result, CacheEntry):
+                return result
+            # like `_retry_try_fetch`, errors raised by the fetcher are judged as is
+            error = raised or result
+            now = time.monotonic()
+            attempts.append(
+                FetchAttempt(
+                    error=error, started=started - first_started, duration=now - started
+                )
+            )
+            if not policy.should_retry(error):
+                raise error
+            delay = policy.next_delay(attempts=attempts, elapsed=now - first_started)
+            if delay is None:
+                raise RetriesExhausted(url=url, attempts=attempts) from error
+            await asyncio.sleep(delay)
+
+
+class AsyncMemoryCache(AsyncCache[U]):
+    def __init__(self, memory: MemoryCache[U]):
+        super().__init__(cache=memory, url_hasher=memory.url_hasher)
+        self.memory: Final[MemoryCache[U]] = memory
+
+
+class AsyncDiskCache(AsyncCache[U]):
+    def __init__(self, disk: DiskCache[U]):
+        super().__init__(cache=disk, url_hasher=disk.url_hasher)
+        self.disk: Final[DiskCache[U]] = disk
@@ -0,0 +1,324 @@
+"""Codecs for compressing `DiskCache` entries, and the framed format they are kept in
+
+Contents are split into frames of up to `FRAME_SIZE` bytes that are compressed
+independently, each preceded by a header with its compressed and uncompressed sizes.
+Finished files end with a table of the sizes of all frames, so readers can jump
+straight to the frame holding any offset and only decompress that one.
+"""
+
+import importlib
+import lzma
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from types import ModuleType
+from typing import IO, Final, Iterator, List, Optional, Protocol, Tuple
+
+from genericache import BytesReaderP, CacheException
+
+FRAME_SIZE = 256 * 1024
+_FRAME_HEADER: Final[struct.Struct] = struct.Struct("<II")
+_FOOTER: Final[struct.Struct] = struct.Struct("<I4s")
+_MAGIC = b"GCF1"
+
+
+class CodecUnavailable(CacheException):
+    def __init__(self, *, codec_name: str) -> None:
+        self.codec_name: Final[str] = codec_name
+        super().__init__(
+            f"Codec '{codec_name}' is not available. Entries compressed with zstd need"
+            " Python 3.14 or the `zstandard` package"
+        )
+
+
+class Codec(Protocol):
+    @property
+    def name(self) -> str:
+        """Identifies the codec in entry file names; see `codec_by_name`"""
+        ...
+
+    def compress(self, data: bytes) -> bytes: ...
+    def decompress(self, data: bytes) -> bytes: ...
+
+
+class ZlibCodec(Codec):
+    def __init__(self, level: int = 6) -> None:
+        super().__init__()
+        self.level: Final[int] = level
+
+    @property
+    def name(self) -> str:
+        return "zlib"
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class LzmaCodec(Codec):
+    def __init__(self, preset: int = 6) -> None:
+        super().__init__()
+        self.preset: Final[int] = preset
+
+    @property
+    def name(self) -> str:
+        return "lzma"
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self.preset)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+
+def _import_zstd() -> Optional[ModuleType]:
+    """The zstd bindings of the standard library (3.14+) or of `zstandard`, if any
+
+    Both have module-level `compress(data, level=...)` and `decompress(data)`
+    """
+    for module_name in ("compression.zstd", "zstandard"):
+        try:
+            return importlib.import_module(module_name)
+        except ImportError:
+            continue
+    return None
+
+
+class ZstdCodec(Codec):
+    """Raises `CodecUnavailable` if there are no zstd bindings installed"""
+
+    def __init__(self, level: int = 3) -> None:
+        super().__init__()
+        module = _import_zstd()
+        if module is None:
+            raise CodecUnavailable(codec_name="zstd")
+        self._module: Final[ModuleType] = module
+        self.level: Final[int] = level
+
+    @property
+    def name(self) -> str:
+        return "zstd"
+
+    def compress(self, data: bytes) -> bytes:
+        return self._module.compress(data, level=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._module.decompress(data)
+
+
+def default_codec() -> Codec:
+    """zstd if it is installed, zlib otherwise"""
+    try:
+        return ZstdCodec()
+    except CodecUnavailable:
+        return ZlibCodec()
+
+
+CODEC_NAMES = ("zlib", "lzma", "zstd")
+
+
+def codec_by_name(name: str) -> Codec:
+    """The codec to decompress entries whose file names end with `.{name}`"""
+    if name == "zlib":
+        return ZlibCodec()
+    if name == "lzma":
+        return LzmaCodec()
+    if name == "zstd":
+        return ZstdCodec()
+    raise CodecUnavailable(codec_name=name)
+
+
+class FrameTable:
+    """Where each frame of a compressed file starts, in both its compressed and
+    uncompressed forms. The last offsets are where the last frame ends
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sizes: Final[List[Tuple[int, int]]] = []
+        self.compressed_offsets: Final[List[int]] = [0]
+        self.uncompressed_offsets: Final[List[int]] = [0]
+
+    def append(self, *, compressed_size: int, uncompressed_size: int) -> None:
+        self.sizes.append((compressed_size, uncompressed_size))
+        self.compressed_offsets.append(
+            self.compressed_offsets[-1] + _FRAME_HEADER.size + compressed_size
+        )
+        self.uncompressed_offsets.append(
+            self.uncompressed_offsets[-1] + uncompressed_size
+        )
+
+    @property
+    def uncompressed_size(self) -> int:
+        return self.uncompressed_offsets[-1]
+
+    def find(self, position: int) -> int:
+        """The index of the frame holding the byte at `position`, which must exist"""
+        assert 0 <= position < self.uncompressed_size
+        return bisect_right(self.uncompressed_offsets, position) - 1
+
+    def read_frame(self, file: IO[bytes], idx: int, codec: Codec) -> bytes:
+        _ = file.seek(self.compressed_offsets[idx] + _FRAME_HEADER.size)
+        return codec.decompress(file.read(self.sizes[idx][0]))
+
+    def to_trailer(self) -> bytes:
+        table = b"".join(_FRAME_HEADER.pack(*sizes) for sizes in self.sizes)
+        return table + _FOOTER.pack(len(self.sizes), _MAGIC)
+
+    @classmethod
+    def from_trailer(cls, file: IO[bytes]) -> "FrameTable":
+        """Reads the table at the end of a finished file
+
+        Raises ValueError if the file isn't a finished compressed file
+        """
+        file_size = file.seek(0, os.SEEK_END)
+        if file_size < _FOOTER.size:
+            raise ValueError("File is too small to be compressed")
+        _ = file.seek(file_size - _FOOTER.size)
+        frame_count, magic = _FOOTER.unpack(file.read(_FOOTER.size))
+        trailer_size = frame_count * _FRAME_HEADER.size + _FOOTER.size
+        if magic != _MAGIC or trailer_size > file_size:
+            raise ValueError("File is not compressed")
+        _ = file.seek(file_size - trailer_size)
+        raw_table = file.read(trailer_size - _FOOTER.size)
+        table = FrameTable()
+        for compressed_size, uncompressed_size in _FRAME_HEADER.iter_unpack(raw_table):
+            table.append(
+                compressed_size=compressed_size, uncompressed_size=uncompressed_size
+            )
+        if table.compressed_offsets[-1] + trailer_size != file_size:
+            raise ValueError("Frame table is corrupted")
+        return table
+
+
+class FrameWriter:
+    """Compresses the bytes written to it into frames appended to `file`"""
+
+    def __init__(
+        self, file: IO[bytes], codec: Codec, *, frame_size: int = FRAME_SIZE
+    ) -> None:
+        super().__init__()
+        self.file: Final[IO[bytes]] = file
+        self.codec: Final[Codec] = codec
+        self.frame_size: Final[int] = frame_size
+        self.table: Final[FrameTable] = FrameTable()
+        self._pending: bytearray = bytearray()
+
+    def recover(self) -> Iterator[bytes]:
+        """Adopts the frames already in `file`, e.g. left by an interrupted fetch,
+        and yields their decompressed contents
+
+        A frame that was only partially written is truncated away
+        """
+        _ = self.file.seek(0)
+        while True:
+            header = self.file.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                break
+            compressed_size, uncompressed_size = _FRAME_HEADER.unpack(header)
+            try:
+                data = self.codec.decompress(self.file.read(compressed_size))
+            except Exception:
+                break
+            if len(data) != uncompressed_size:
+                break
+            self.table.append(
+                compressed_size=compressed_size, uncompressed_size=uncompressed_size
+            )
+            yield data
+        _ = self.file.truncate(self.table.compressed_offsets[-1])
+        _ = self.file.seek(self.table.compressed_offsets[-1])
+
+    def _write_frame(self, data: bytes) -> Tuple[int, int]:
+        compressed = self.codec.compress(data)
+        _ = self.file.write(_FRAME_HEADER.pack(len(compressed), len(data)))
+        _ = self.file.write(compressed)
+        self.table.append(compressed_size=len(compressed), uncompressed_size=len(data))
+        return (len(compressed), len(data))
+
+    def write(self, data: bytes) -> List[Tuple[int, int]]:
+        """Returns the compressed and uncompressed sizes of the frames that were
+        completed, if any
+        """
+        self._pending += data
+        written: List[Tuple[int, int]] = []
+        start = 0
+        while len(self._pending) - start >= self.frame_size:
+            frame = bytes(self._pending[start : start + self.frame_size])
+            written.append(self._write_frame(frame))
+            start += self.frame_size
+        del self._pending[:start]
+        return written
+
+    def finish(self) -> List[Tuple[int, int]]:
+        """Writes out the last frame and the frame table"""
+        written: List[Tuple[int, int]] = []
+        if self._pending:
+            written.append(self._write_frame(bytes(self._pending)))
+            self._pending.clear()
+        _ = self.file.write(self.table.to_trailer())
+        self.file.flush()
+        return written
+
+
+class FramedReader(BytesReaderP):
+    """Reads the uncompressed contents of a finished compressed file
+
+    Seeking is free, and reads only decompress the frames they overlap
+    """
+
+    def __init__(self, file: IO[bytes], codec: Codec) -> None:
+        super().__init__()
+        self._file: Final[IO[bytes]] = file
+        self._codec: Final[Codec] = codec
+        self._table: Final[FrameTable] = FrameTable.from_trailer(file)
+        self._position: int = 0
+        self._frame_idx: int = -1
+        self._frame: bytes = b""
+        self.size: Final[int] = self._table.uncompressed_size
+
+    def _load_frame(self, idx: int) -> bytes:
+        if idx != self._frame_idx:
+            self._frame = self._table.read_frame(self._file, idx, self._codec)
+            self._frame_idx = idx
+        return self._frame
+
+    def read(self, size: int = -1, /) -> bytes:
+        end = self.size if size < 0 else min(self.size, self._position + size)
+        parts: List[bytes] = []
+        while self._position < end:
+            idx = self._table.find(self._position)
+            offset = self._position - self._table.uncompressed_offsets[idx]
+            part = self._load_frame(idx)[offset : offset + end - self._position]
+            parts.append(part)
+            self._position += len(part)
+        return b"".join(parts)
+
+    def readable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET, /) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return self._position
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
@@ -1,4 +1,5 @@
-from typing import Final, Protocol
+import functools
+from typing import Callable, Final, Generic, Protocol, TypeVar
 from hashlib import sha256
 
 
@@ -10,7 +11,7 @@ class HashlibHash(Protocol):
 class Digest:
     def __init__(self, digest: bytes) -> None:
         super().__init__()
-        assert len(digest) == 32
+        assert 0 < len(digest) <= 64
         self.digest: Final[bytes] = digest
 
     def __hash__(self) -> int:
@@ -20,23 +21,62 @@ class Digest:
         return isinstance(value, self.__class__) and self.digest == value.digest
 
     def __str__(self) -> str:
-        return "".join(f"{byte:02x}" for byte in self.digest)
+        return self.digest.hex()
 
     @classmethod
     def parse(cls, *, hexdigest: str) -> "Digest":
         if len(hexdigest) != 64:
             raise ValueError("value should have 64 characters")
-        digest = bytearray(32)
-        for hex_idx in range(0, 64, 2):
-            digest[hex_idx // 2] = int(hexdigest[hex_idx : hex_idx + 2], 16)
-        return Digest(bytes(digest))
+        return Digest(_parse_hex(hexdigest))
+
+
+def _parse_hex(hexdigest: str) -> bytes:
+    digest = bytes.fromhex(hexdigest)
+    if len(digest) * 2 != len(hexdigest):  # fromhex skips whitespace
+        raise ValueError(f"Not a hex digest: {hexdigest}")
+    return digest
 
 
 class ContentDigest(Digest):
+    """The digest of some contents, along with the name of the algorithm that made it
+    (see `genericache.hashing`)
+
+    sha256 digests print as plain hex, as they always have. Other algorithms prefix
+    their name, e.g. `blake2b-ab12...`, which is how they appear in entry file names
+    """
+
+    DEFAULT_ALGORITHM = "sha256"
+
+    def __init__(self, digest: bytes, algorithm: str = DEFAULT_ALGORITHM) -> None:
+        super().__init__(digest)
+        assert algorithm.isalnum()
+        self.algorithm: Final[str] = algorithm
+
+    def __hash__(self) -> int:
+        return hash((self.algorithm, self.digest))
+
+    def __eq__(self, value: object, /) -> bool:
+        return (
+            isinstance(value, ContentDigest)
+            and self.algorithm == value.algorithm
+            and self.digest == value.digest
+        )
+
+    def __str__(self) -> str:
+        if self.algorithm == self.DEFAULT_ALGORITHM:
+            return self.digest.hex()
+        return f"{self.algorithm}-{self.digest.hex()}"
+
     @classmethod
     def parse(cls, *, hexdigest: str) -> "ContentDigest":
-        digest = Digest.parse(hexdigest=hexdigest).digest
-        return ContentDigest(digest)
+        """Parses the output of `str`"""
+        algorithm, sep, hexdigest = hexdigest.rpartition("-")
+        if not sep:
+            digest = Digest.parse(hexdigest=hexdigest).digest
+            return ContentDigest(digest)
+        if not algorithm.isalnum() or not 2 <= len(hexdigest) <= 128:
+            raise ValueError(f"Not a content digest: {algorithm}{sep}{hexdigest}")
+        return ContentDigest(_parse_hex(hexdigest), algorithm=algorithm)
 
 
 class UrlDigest(Digest):
@@ -48,3 +88,28 @@ class UrlDigest(Digest):
     def parse(cls, *, hexdigest: str) -> "UrlDigest":
         digest = Digest.parse(hexdigest=hexdigest).digest
         return UrlDigest(digest)
+
+
+U = TypeVar("U")
+
+
+class MemoizedUrlHasher(Generic[U]):
+    """Remembers the digests of the most recently hashed URLs
+
+    URLs that can't be used as dict keys are hashed every time
+    """
+
+    def __init__(
+        self, url_hasher: "Callable[[U], UrlDigest]", *, maxsize: int = 4096
+    ) -> None:
+        super().__init__()
+        self.url_hasher: Final[Callable[[U], UrlDigest]] = url_hasher
+        self._memoized: Final[Callable[[U], UrlDigest]] = functools.lru_cache(
+            maxsize=maxsize
+        )(url_hasher)
+
+    def __call__(self, url: U) -> UrlDigest:
+        try:
+            return self._memoized(url)
+        except TypeError:  # unhashable
+            return self.url_hasher(url)
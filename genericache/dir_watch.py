@@ -0,0 +1,107 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Final, List, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class DirWatcher(Protocol):
+    def wait(self, timeout: float) -> List[str]:
+        """Waits up to `timeout` seconds for files to land in the watched directory
+
+        Returns the names of the files that were moved into the directory or finished
+        being written to since the last call. An empty list doesn't mean that nothing
+        happened, so callers must still check the directory (or its index) themselves.
+        """
+        ...
+
+    def close(self) -> None: ...
+
+
+class PollingWatcher(DirWatcher):
+    """Never reports anything, so callers fall back to polling"""
+
+    def wait(self, timeout: float) -> List[str]:
+        time.sleep(timeout)
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_INOTIFY_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _load_libc() -> Optional[Any]:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+_libc: Final[Optional[Any]] = _load_libc()
+
+
+class InotifyWatcher(DirWatcher):
+    """Watches a directory via Linux's inotify, without any extra dependencies"""
+
+    def __init__(self, fd: int) -> None:
+        super().__init__()
+        self._fd: Final[int] = fd
+        self._poller: Final[select.poll] = select.poll()
+        self._poller.register(fd, select.POLLIN)
+
+    @classmethod
+    def try_create(cls, dir_path: Path) -> "Optional[InotifyWatcher]":
+        if _libc is None:
+            return None
+        fd: int = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:  # e.g. EMFILE once fs.inotify.max_user_instances is reached
+            logger.debug(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return None
+        watch: int = _libc.inotify_add_watch(
+            fd, os.fsencode(dir_path), _IN_MOVED_TO | _IN_CLOSE_WRITE
+        )
+        if watch < 0:
+            logger.debug(f"inotify_add_watch failed: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return None
+        return InotifyWatcher(fd)
+
+    def wait(self, timeout: float) -> List[str]:
+        if not self._poller.poll(timeout * 1000):
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names: List[str] = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_len = _INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT_HEADER.size
+            name = data[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if name:  # events without a name are e.g. queue overflows
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def watch_dir(dir_path: Path) -> DirWatcher:
+    """Watches `dir_path` as cheaply as the platform allows"""
+    return InotifyWatcher.try_create(dir_path) or PollingWatcher()
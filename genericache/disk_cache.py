@@ -1,31 +1,93 @@
 import logging
+import math
 import os
-import shutil
 import inspect
+import itertools
 import tempfile
 import threading
+import time
 from collections.abc import Iterable
-from concurrent.futures import Future
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from hashlib import sha256
+from io import BufferedReader
 from pathlib import Path
-from typing import Any, Callable, ClassVar, Dict, Final, Optional, Tuple, Type, TypeVar
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Final,
+    IO,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    cast,
+)
 
-from filelock import FileLock
+from filelock import FileLock, Timeout
 
 from genericache import (
+    BytesReaderP,
     Cache,
     CacheEntry,
     CacheFsLinkUsageMismatch,
+    CacheLayoutMismatch,
+    CacheReadOnly,
+    CacheStagingDirMismatch,
     CacheUrlTypeMismatch,
     DigestMismatch,
     FetchInterrupted,
+    ResumableFetcher,
+    StreamingEntry,
+    VerifyingReader,
+    _Stream,  # pyright: ignore[reportPrivateUsage]
+)
+from genericache.compression import (
+    CODEC_NAMES,
+    Codec,
+    FrameTable,
+    FrameWriter,
+    FramedReader,
+    codec_by_name,
 )
-from genericache.digest import ContentDigest, UrlDigest
+from genericache.digest import ContentDigest, MemoizedUrlHasher, UrlDigest
+from genericache.dir_watch import DirWatcher, watch_dir
+from genericache.disk_index import DiskIndex, IndexRow
+from genericache.eviction import EvictionPolicy, LruEviction
+from genericache.freshness import Freshness, FreshnessPolicy, NeverExpire
+from genericache.hashing import (
+    ContentHasher,
+    PipelinedHash,
+    Sha256Hasher,
+    hasher_by_name,
+    hasher_for,
+)
+from genericache.metrics import CacheMetrics
+from genericache.negative_caching import NegativeCaching, RecentlyFailed
+from genericache.retry import RetryPolicy
 
 logger = logging.getLogger(__name__)
 
 
+def _shard_dir(url_digest: UrlDigest) -> str:
+    hexdigest = str(url_digest)
+    return f"{hexdigest[0:2]}/{hexdigest[2:4]}"
+
+
+def _is_shard_dir_name(name: str) -> bool:
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+
+def _split_codec_name(file_name: str) -> Tuple[str, Optional[str]]:
+    """Splits the `.{codec}` suffix of compressed entries off `file_name`"""
+    stem, _, codec_name = file_name.partition(".")
+    return (stem, codec_name or None)
+
+
 class _EntryPath:
     """The file path used inside the cache directory
 
@@ -33,8 +95,18 @@ class _EntryPath:
     so that an entry can be searched by either of them.
 
     Because Windows doesn't allow symlinks out of "developer mode", all digests must be
-    encoded into the file name itself, and a file has to be found by iterating over the
-    directory entries
+    encoded into the file name itself. Lookups go through the `DiskIndex`, which can
+    always be rebuilt by iterating over the directory entries and parsing their names
+
+    In the sharded layout the same file name lives two directories deep, under the
+    first two bytes of the url digest (e.g. `ab/cd/entry__url_abcd..._contents_...`),
+    so that no single directory grows too large.
+
+    Entries with the same contents share their data: they are either hard links to
+    the same file or, in caches that use symlinks, links to the same blob. Either way
+    their timestamps are those of the shared file when the index is rebuilt.
+
+    Compressed entries have the name of their codec as a suffix, e.g. `...contents_ab.zlib`
     """
 
     PREFIX = "entry__url_"
@@ -47,43 +119,274 @@ class _EntryPath:
         *,
         cache_dir: Path,
         timestamp: datetime,
+        sharded: bool,
+        codec_name: Optional[str] = None,
     ) -> None:
         super().__init__()
         self.url_digest: Final[UrlDigest] = url_digest
         self.content_digest: Final[ContentDigest] = content_digest
         self.timestamp: Final[datetime] = timestamp
-        self.path: Final[Path] = (
-            cache_dir / f"{self.PREFIX}{self.url_digest}{self.INFIX}{content_digest}"
+        self.sharded: Final[bool] = sharded
+        self.codec_name: Final[Optional[str]] = codec_name
+        file_name = f"{self.PREFIX}{self.url_digest}{self.INFIX}{content_digest}"
+        if codec_name is not None:
+            file_name += f".{codec_name}"
+        self.rel_path: Final[str] = (
+            f"{_shard_dir(url_digest)}/{file_name}" if sharded else file_name
         )
+        self.path: Final[Path] = cache_dir / self.rel_path
 
     @classmethod
-    def try_from_path(cls, path: Path) -> "Optional[_EntryPath]":
-        name = path.name
-        if not name.startswith(cls.PREFIX):
+    def try_from_path(
+        cls, path: Path, *, cache_dir: Path, timestamp: Optional[datetime] = None
+    ) -> "Optional[_EntryPath]":
+        """Parses the name of an entry file. The timestamp is the modification time of
+        the file, unless given
+        """
+        name, codec_name = _split_codec_name(path.name)
+        if not name.startswith(cls.PREFIX) or (
+            codec_name is not None and codec_name not in CODEC_NAMES
+        ):
             return None
         name = name[len(cls.PREFIX) :]
         urldigest_contentsdigest = name.split(cls.INFIX)
         if urldigest_contentsdigest.__len__() != 2:
             return None
-        (url_hexdigest, contents_hexdigest) = urldigest_contentsdigest
-        if len(url_hexdigest) != 64 or len(contents_hexdigest) != 64:
+        url_hexdigest, contents_hexdigest = urldigest_contentsdigest
+        try:
+            url_digest = UrlDigest.parse(hexdigest=url_hexdigest)
+            content_digest = ContentDigest.parse(hexdigest=contents_hexdigest)
+        except ValueError:
             return None
-        mtime = os.path.getmtime(path)
+        sharded = path.parent != cache_dir
+        if sharded and path.parent != cache_dir / _shard_dir(url_digest):
+            return None  # not in the shard its url digest says it should be
+        if timestamp is None:
+            timestamp = datetime.fromtimestamp(os.path.getmtime(path))
         return _EntryPath(
-            cache_dir=path.parent,
-            url_digest=UrlDigest.parse(hexdigest=url_hexdigest),
-            content_digest=ContentDigest.parse(hexdigest=contents_hexdigest),
-            timestamp=datetime.fromtimestamp(mtime),
+            cache_dir=cache_dir,
+            url_digest=url_digest,
+            content_digest=content_digest,
+            timestamp=timestamp,
+            sharded=sharded,
+            codec_name=codec_name,
         )
 
-    def open(self) -> CacheEntry:
+    @classmethod
+    def from_index_row(cls, row: IndexRow, *, cache_dir: Path) -> "_EntryPath":
+        return _EntryPath(
+            cache_dir=cache_dir,
+            url_digest=row.url_digest,
+            content_digest=row.content_digest,
+            timestamp=datetime.fromtimestamp(row.timestamp),
+            sharded="/" in row.rel_path,
+            codec_name=_split_codec_name(row.rel_path.rpartition("/")[2])[1],
+        )
+
+    def to_index_row(
+        self, *, size: int, inode: int, last_access: float, access_count: int = 0
+    ) -> IndexRow:
+        return IndexRow(
+            url_digest=self.url_digest,
+            content_digest=self.content_digest,
+            rel_path=self.rel_path,
+            timestamp=self.timestamp.timestamp(),
+            size=size,
+            last_access=last_access,
+            access_count=access_count,
+            inode=inode,
+        )
+
+    def open_reader(self) -> "BufferedReader | FramedReader":
+        """Opens the entry file, decompressing it if needed"""
+        if self.codec_name is None:
+            return open(self.path, "rb")
+        codec = codec_by_name(self.codec_name)
+        file = open(self.path, "rb")
+        try:
+            return FramedReader(file, codec)
+        except BaseException:
+            file.close()
+            raise
+
+    def open(self, metrics: CacheMetrics, *, verify: bool = False) -> CacheEntry:
+        """With `verify`, reading the entry up to EOF raises `DigestMismatch` (with the
+        url digest as its `url`) if its contents don't match their digest
+        """
+        reader = self.open_reader()
+        if isinstance(reader, FramedReader):
+            metrics.record_served(reader.size)
+        else:
+            metrics.record_served(os.fstat(reader.fileno()).st_size)
         return CacheEntry(
             content_digest=self.content_digest,
-            reader=open(self.path, "rb"),
+            reader=(
+                VerifyingReader(
+                    reader, url=self.url_digest, content_digest=self.content_digest
+                )
+                if verify
+                else reader
+            ),
             timestamp=self.timestamp,
             url_digest=self.url_digest,
         )
 
+
+class _FileStream(_Stream):
+    """Follows the temporary file that an entry is being fetched into, and then the
+    entry file itself
+
+    Readers open the file for each read, so that it can be moved into place
+    (which Windows refuses to do with open files) whenever no read is going on
+
+    Compressed files are followed frame by frame, so bytes only become available
+    once the frame holding them has been written
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._path: Optional[Path] = None
+        self._entry: Optional[_EntryPath] = None
+        self._codec: Optional[Codec] = None
+        self._frames: Optional[FrameTable] = None
+        self._decoded_frame: Tuple[int, bytes] = (-1, b"")
+
+    def start(self, temp_path: Path, *, codec: Optional[Codec]) -> None:
+        with self.cond:
+            self._path = temp_path
+            self._codec = codec
+            self._frames = None if codec is None else FrameTable()
+
+    def grow_frames(self, sizes: Iterable[Tuple[int, int]]) -> None:
+        """Makes frames of the given compressed and uncompressed sizes available"""
+        grown = 0
+        with self.cond:
+            assert self._frames is not None
+            for compressed_size, uncompressed_size in sizes:
+                self._frames.append(
+                    compressed_size=compressed_size,
+                    uncompressed_size=uncompressed_size,
+                )
+                grown += uncompressed_size
+        self.grow(grown)
+
+    def move(self, *, src: Path, dst: Path) -> None:
+        with self.cond:
+            os.replace(src, dst)
+            self._path = dst
+            if self._frames is not None:
+                # `dst` may be linked to identical contents that were framed differently
+                with open(dst, "rb") as f:
+                    self._frames = FrameTable.from_trailer(f)
+                self._decoded_frame = (-1, b"")
+
+    def finish_at(self, entry: _EntryPath) -> None:
+        with self.cond:
+            self._path = entry.path
+            self._entry = entry
+        self.finish(entry.content_digest)
+
+    def read_partial(self, position: int, size: int) -> bytes:
+        assert self._path is not None
+        if self._frames is None or self._codec is None:
+            with open(self._path, "rb") as f:
+                _ = f.seek(position)
+                return f.read(size)
+        idx = self._frames.find(position)
+        if self._decoded_frame[0] != idx:
+            with open(self._path, "rb") as f:
+                self._decoded_frame = (
+                    idx,
+                    self._frames.read_frame(f, idx, self._codec),
+                )
+        offset = position - self._frames.uncompressed_offsets[idx]
+        return self._decoded_frame[1][offset : offset + size]
+
+    def open_finished(self) -> BytesReaderP:
+        assert self._entry is not None
+        return self._entry.open_reader()
+
+
+def _check_entry_file(
+    path: str, codec_name: Optional[str], hexdigest: str
+) -> Tuple[Optional[str], int]:
+    """Rehashes the contents of an entry file, one chunk at a time
+
+    Returns why the file is corrupt, if it is, and how many bytes were hashed. Runs
+    in the worker processes of `DiskCache.verify`, hence the plain arguments
+    """
+    content_digest = ContentDigest.parse(hexdigest=hexdigest)
+    hasher = hasher_by_name(content_digest.algorithm)
+    contents_hash = hasher.new()
+    size = 0
+    try:
+        if (
+            os.path.getsize(path) == 0
+            and content_digest.digest != hasher.new().digest()
+        ):
+            return ("empty file", 0)
+        with open(path, "rb") as file:
+            reader: BytesReaderP = file
+            if codec_name is not None:
+                reader = FramedReader(file, codec_by_name(codec_name))
+            for chunk in iter(lambda: reader.read(1024 * 1024), b""):
+                contents_hash.update(chunk)
+                size += len(chunk)
+    except FileNotFoundError:
+        raise  # deleted since it was listed, e.g. evicted
+    except Exception as e:
+        return (f"unreadable: {e!r}", size)
+    if contents_hash.digest() != content_digest.digest:
+        return ("contents don't match their digest", size)
+    return (None, size)
+
+
+class FsckReport:
+    """What `DiskCache.verify` or `DiskCache.repair` found, and did"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.checked_entries: int = 0
+        self.corrupt: Final[List[Tuple[Path, str]]] = []
+        """Corrupt entry files, and why they are deemed corrupt"""
+        self.bytes_hashed: int = 0
+        self.seconds: float = 0
+        self.removed_entries: int = 0
+        self.removed_locks: int = 0
+        self.removed_staging_files: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes hashed per second"""
+        return self.bytes_hashed / self.seconds if self.seconds else 0
+
+    def __str__(self) -> str:
+        lines = [
+            f"Checked {self.checked_entries} entries"
+            f" ({self.bytes_hashed} bytes in {self.seconds:.2f}s,"
+            f" {self.throughput / 1024 / 1024:.1f} MiB/s)"
+        ]
+        lines += [f"Corrupt: {path} ({reason})" for path, reason in self.corrupt]
+        if self.removed_entries or self.removed_locks or self.removed_staging_files:
+            lines.append(
+                f"Removed {self.removed_entries} corrupt entries,"
+                f" {self.removed_locks} stale lock files and"
+                f" {self.removed_staging_files} orphaned staging files"
+            )
+        return "\n".join(lines)
+
+
+def _fsync_dir(dir_path: Path) -> None:
+    """Makes the renames into `dir_path` durable. A no-op on Windows"""
+    if os.name == "nt":
+        return
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def _are_same_class(class1: Type[Any], class2: Type[Any]) -> bool:
     """Guess if two classes are the same.
 
@@ -108,11 +411,38 @@ class DiskCache(Cache[U]):
     class __PrivateMarker:
         pass
 
+    SHARDED_MARKER = "sharded_layout"
+    MAX_REMEMBERED_ENTRIES = 4096
+    SYMLINKS_MARKER = "symlinked_entries"
+    BLOBS_DIR_NAME = "blobs"
+    STAGING_DIR_NAME = "staging"
+    QUARANTINE_DIR_NAME = "quarantine"
+    STAGING_PREFIX = "staging_url_"
+    PARTIAL_PREFIX = "partial_url_"
+    # eviction frees this fraction of the bounds on top of what is needed, so that it
+    # runs once every so many fetches rather than after each one
+    EVICTION_HEADROOM = 0.1
+
     def __init__(
         self,
         *,
         cache_dir: Path,
         url_hasher: "Callable[[U], UrlDigest]",
+        sharded: bool,
+        max_bytes: Optional[int],
+        max_entries: Optional[int],
+        eviction_policy: EvictionPolicy,
+        wait_timeout: Optional[float],
+        staging_dir: Optional[Path],
+        fsync: bool,
+        use_symlinks: bool,
+        compression: Optional[Codec],
+        freshness: FreshnessPolicy,
+        negative_caching: Optional[NegativeCaching],
+        verify_reads: int,
+        content_hasher: ContentHasher,
+        metrics: Optional[CacheMetrics],
+        read_only: bool,
         _private_marker: __PrivateMarker,
     ):
         # FileLock is reentrant, so multiple threads would be able to acquire the lock without a threading Lock
@@ -120,12 +450,35 @@ class DiskCache(Cache[U]):
         self._ongoing_downloads: Dict[
             UrlDigest, Future["_EntryPath | FetchInterrupted[U]"]
         ] = {}
-
-        self._hits = 0
-        self._misses = 0
+        self._streams: Dict[UrlDigest, _FileStream] = {}
+        # the newest entry of recently looked up URLs, valid for one index generation
+        self._entries_lock: Final[threading.Lock] = threading.Lock()
+        self._entries_by_url: Dict[UrlDigest, Optional[_EntryPath]] = {}
+        self._entries_generation: bytes = b""
 
         self.dir_path: Final[Path] = cache_dir
         self.url_hasher: Final[Callable[[U], UrlDigest]] = url_hasher
+        self._hash_url: Final[MemoizedUrlHasher[U]] = MemoizedUrlHasher(url_hasher)
+        self.sharded: Final[bool] = sharded
+        self.max_bytes: Final[Optional[int]] = max_bytes
+        self.max_entries: Final[Optional[int]] = max_entries
+        self.eviction_policy: Final[EvictionPolicy] = eviction_policy
+        self.wait_timeout: Final[Optional[float]] = wait_timeout
+        self.staging_dir: Final[Path] = staging_dir or cache_dir / self.STAGING_DIR_NAME
+        self.fsync: Final[bool] = fsync
+        self.use_symlinks: Final[bool] = use_symlinks
+        self.blobs_dir: Final[Path] = cache_dir / self.BLOBS_DIR_NAME
+        self.compression: Final[Optional[Codec]] = compression
+        self.freshness: FreshnessPolicy = freshness
+        self.negative_caching: Final[Optional[NegativeCaching]] = negative_caching
+        self.verify_reads: Final[int] = verify_reads
+        self._opened_entries: Final[Iterator[int]] = itertools.count()
+        self.content_hasher: Final[ContentHasher] = content_hasher
+        self.metrics: Final[CacheMetrics] = metrics or CacheMetrics()
+        self.read_only: Final[bool] = read_only
+        self._index: Final[DiskIndex] = DiskIndex(
+            cache_dir=cache_dir, scan=self._scan_index_rows, read_only=read_only
+        )
         super().__init__()
 
     @classmethod
@@ -135,15 +488,115 @@ class DiskCache(Cache[U]):
         url_type: Type[U],
         cache_dir: Path,
         url_hasher: "Callable[[U], UrlDigest]",
-    ) -> "DiskCache[U] | CacheUrlTypeMismatch | CacheFsLinkUsageMismatch":
+        sharded: bool = False,
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        eviction_policy: EvictionPolicy = LruEviction(),
+        wait_timeout: Optional[float] = None,
+        staging_dir: Optional[Path] = None,
+        fsync: bool = False,
+        use_symlinks: bool = False,
+        compression: Optional[Codec] = None,
+        freshness: FreshnessPolicy = NeverExpire(),
+        negative_caching: Optional[NegativeCaching] = None,
+        verify_reads: int = 0,
+        content_hasher: ContentHasher = Sha256Hasher(),
+        metrics: Optional[CacheMetrics] = None,
+    ) -> "DiskCache[U] | CacheUrlTypeMismatch | CacheFsLinkUsageMismatch | CacheLayoutMismatch | CacheStagingDirMismatch":
+        """Gets the cache for `cache_dir`, creating it if it's not open in this process yet
+
+        With `sharded=True`, entries and lock files are fanned out into prefix
+        subdirectories, and any entries left in the flat layout are migrated once.
+        A directory that has been sharded can't be opened with `sharded=False` anymore.
+
+        If `max_bytes` and/or `max_entries` are set, entries are deleted after each
+        fetch, in the order given by `eviction_policy`, until the cache fits again.
+        The bounds of the first cache created for a directory in a process win.
+
+        A fetch that has to wait for another thread or process to fetch the same URL
+        gives up with `FetchInterrupted` after `wait_timeout` seconds, if set.
+
+        Fetched contents are written to files in `staging_dir` (by default a
+        subdirectory of `cache_dir`) and atomically renamed into place, so it must
+        be on the same filesystem as `cache_dir` (or `CacheStagingDirMismatch` is
+        returned) and must not be shared with other caches. With `fsync=True`,
+        entries are flushed to disk before they are committed, so that they survive
+        a power loss. Staging files left behind by crashed processes are deleted when
+        the cache is created.
+
+        Identical contents fetched from different URLs are stored only once: new
+        entries are hard links to an existing entry with the same contents, where the
+        filesystem allows it. With `use_symlinks=True`, contents are instead kept in
+        the `blobs` subdirectory and entries are symlinks to them, which is also
+        recorded in the directory; such a cache can't be opened with
+        `use_symlinks=False` anymore.
+
+        New entries are compressed with `compression` (e.g. `default_codec()` from
+        `genericache.compression`) while they are fetched. Their digests are still
+        those of the uncompressed contents, and readers decompress them transparently.
+        Entries compressed differently, or not at all, can be read all the same. Like
+        the bounds, the codec of the first cache created for a directory wins.
+
+        `fetch` judges cached entries by `freshness` unless told otherwise, e.g. to
+        refetch them after a `Ttl`. The policy of the first cache created for a
+        directory in a process wins too.
+
+        With `negative_caching`, fetches that fail are remembered in the index for
+        a while, and fetching the same URLs from any process returns `RecentlyFailed`
+        right away in the meantime, rather than trying again.
+
+        With `verify_reads=n`, one in `n` cached entries that are opened checks its
+        contents while they are read, and raises `DigestMismatch` from the `read`
+        that reaches the end if they have been corrupted. `verify_reads=1` checks
+        every entry, and the default of 0 none. See `verify` to check them all at once.
+
+        Contents are hashed with `content_hasher` (from `genericache.hashing`) on a
+        background thread while they are fetched. Entries hashed with other algorithms,
+        e.g. by caches created with a different hasher, are still found and served.
+        """
         with cls._caches_lock:
             url_type_and_entry = cls._caches.get(cache_dir)
             if url_type_and_entry is None:
+                dir_is_sharded = (cache_dir / cls.SHARDED_MARKER).exists()
+                if dir_is_sharded and not sharded:
+                    return CacheLayoutMismatch(
+                        cache_dir=cache_dir, expected_sharded=True, found_sharded=False
+                    )
+                if (cache_dir / cls.SYMLINKS_MARKER).exists() and not use_symlinks:
+                    return CacheFsLinkUsageMismatch(
+                        cache_dir=cache_dir, expected=True, found=False
+                    )
                 cache = DiskCache(
                     cache_dir=cache_dir,
                     url_hasher=url_hasher,
+                    sharded=sharded,
+                    max_bytes=max_bytes,
+                    max_entries=max_entries,
+                    eviction_policy=eviction_policy,
+                    wait_timeout=wait_timeout,
+                    staging_dir=staging_dir,
+                    fsync=fsync,
+                    use_symlinks=use_symlinks,
+                    compression=compression,
+                    freshness=freshness,
+                    negative_caching=negative_caching,
+                    verify_reads=verify_reads,
+                    content_hasher=content_hasher,
+                    metrics=metrics,
+                    read_only=False,
                     _private_marker=cls.__PrivateMarker(),
                 )
+                cache.staging_dir.mkdir(parents=True, exist_ok=True)
+                if os.stat(cache.staging_dir).st_dev != os.stat(cache_dir).st_dev:
+                    return CacheStagingDirMismatch(
+                        cache_dir=cache_dir, staging_dir=cache.staging_dir
+                    )
+                _ = cache.clean_staging_dir()
+                cache.blobs_dir.mkdir(exist_ok=True)
+                if use_symlinks:
+                    (cache_dir / cls.SYMLINKS_MARKER).touch()
+                if sharded and not dir_is_sharded:
+                    cache._migrate_to_sharded()
                 cls._caches[cache_dir] = (url_type, cache)
                 return cache
 
@@ -154,6 +607,16 @@ class DiskCache(Cache[U]):
                 expected_url_type=entry_url_type,
                 found_url_type=url_type,
             )
+        if entry.sharded != sharded:
+            return CacheLayoutMismatch(
+                cache_dir=cache_dir,
+                expected_sharded=entry.sharded,
+                found_sharded=sharded,
+            )
+        if entry.use_symlinks != use_symlinks:
+            return CacheFsLinkUsageMismatch(
+                cache_dir=cache_dir, expected=entry.use_symlinks, found=use_symlinks
+            )
         return entry
 
     @classmethod
@@ -163,47 +626,828 @@ class DiskCache(Cache[U]):
         url_type: Type[U],
         cache_dir: Path,
         url_hasher: "Callable[[U], UrlDigest]",
+        sharded: bool = False,
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        eviction_policy: EvictionPolicy = LruEviction(),
+        wait_timeout: Optional[float] = None,
+        staging_dir: Optional[Path] = None,
+        fsync: bool = False,
+        use_symlinks: bool = False,
+        compression: Optional[Codec] = None,
+        freshness: FreshnessPolicy = NeverExpire(),
+        negative_caching: Optional[NegativeCaching] = None,
+        verify_reads: int = 0,
+        content_hasher: ContentHasher = Sha256Hasher(),
+        metrics: Optional[CacheMetrics] = None,
     ) -> "DiskCache[U]":
         out = cls.try_create(
-            url_type=url_type, cache_dir=cache_dir, url_hasher=url_hasher
+            url_type=url_type,
+            cache_dir=cache_dir,
+            url_hasher=url_hasher,
+            sharded=sharded,
+            max_bytes=max_bytes,
+            max_entries=max_entries,
+            eviction_policy=eviction_policy,
+            wait_timeout=wait_timeout,
+            staging_dir=staging_dir,
+            fsync=fsync,
+            use_symlinks=use_symlinks,
+            compression=compression,
+            freshness=freshness,
+            negative_caching=negative_caching,
+            verify_reads=verify_reads,
+            content_hasher=content_hasher,
+            metrics=metrics,
         )
         if isinstance(out, Exception):
             raise out
         return out
 
-    def hits(self) -> int:
-        return self._hits
+    @classmethod
+    def open_read_only(
+        cls, *, cache_dir: Path, url_hasher: "Callable[[U], UrlDigest]"
+    ) -> "DiskCache[U]":
+        """Opens `cache_dir` without changing anything in it, e.g. to `verify` it
 
-    def misses(self) -> int:
-        return self._misses
-
-    def _get_entry_by_url(self, *, url: U) -> Optional[_EntryPath]:
-        url_digest = self.url_hasher(url)
-        out: "None | _EntryPath" = None
-        for entry_path in self.dir_path.iterdir():
-            entry = _EntryPath.try_from_path(entry_path)
-            if not entry:
+        Unlike `try_create`, this creates no directories, lock files or index, cleans
+        nothing up and migrates nothing; the layout is the one found in the directory.
+        Anything that would write, which includes looking entries up in the index,
+        raises `CacheReadOnly`. The cache is not shared with `try_create`.
+        """
+        return DiskCache(
+            cache_dir=cache_dir,
+            url_hasher=url_hasher,
+            sharded=(cache_dir / cls.SHARDED_MARKER).exists(),
+            max_bytes=None,
+            max_entries=None,
+            eviction_policy=LruEviction(),
+            wait_timeout=None,
+            staging_dir=None,
+            fsync=False,
+            use_symlinks=(cache_dir / cls.SYMLINKS_MARKER).exists(),
+            compression=None,
+            freshness=NeverExpire(),
+            negative_caching=None,
+            verify_reads=0,
+            content_hasher=Sha256Hasher(),
+            metrics=None,
+            read_only=True,
+            _private_marker=cls.__PrivateMarker(),
+        )
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise CacheReadOnly(self.dir_path)
+
+    def _lock_path(self, url_digest: UrlDigest) -> Path:
+        self._check_writable()
+        lock_name = f"downloading_url_{url_digest}.lock"
+        if not self.sharded:
+            return self.dir_path / lock_name
+        shard_dir = self.dir_path / _shard_dir(url_digest)
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        return shard_dir / lock_name
+
+    def _migrate_to_sharded(self) -> None:
+        """Moves every entry of the flat layout into its shard directory
+
+        Each entry is moved while holding the flat-layout lock for its URL, so that
+        processes that still use the flat layout never see a half-migrated entry.
+        """
+        with FileLock(self.dir_path / "migration.lock"):
+            marker = self.dir_path / self.SHARDED_MARKER
+            if marker.exists():
+                return
+            for path in self.dir_path.iterdir():
+                flat_entry = _EntryPath.try_from_path(path, cache_dir=self.dir_path)
+                if flat_entry is None or flat_entry.sharded:
+                    continue
+                with FileLock(
+                    self.dir_path / f"downloading_url_{flat_entry.url_digest}.lock"
+                ):
+                    if not flat_entry.path.exists():
+                        continue
+                    sharded_entry = _EntryPath(
+                        flat_entry.url_digest,
+                        flat_entry.content_digest,
+                        cache_dir=self.dir_path,
+                        timestamp=flat_entry.timestamp,
+                        sharded=True,
+                        codec_name=flat_entry.codec_name,
+                    )
+                    sharded_entry.path.parent.mkdir(parents=True, exist_ok=True)
+                    if flat_entry.path.is_symlink():
+                        # relative link targets don't survive the move into a shard
+                        os.symlink(self._blob_target(sharded_entry), sharded_entry.path)
+                        os.remove(flat_entry.path)
+                    else:
+                        os.replace(flat_entry.path, sharded_entry.path)
+                    if not self._index.rename(
+                        flat_entry.rel_path, sharded_entry.rel_path
+                    ):
+                        stat = sharded_entry.path.stat()
+                        self._index.insert(
+                            sharded_entry.to_index_row(
+                                size=stat.st_size,
+                                inode=stat.st_ino,
+                                last_access=stat.st_atime,
+                            )
+                        )
+            marker.touch()
+            logger.info(f"Migrated cache at {self.dir_path} to the sharded layout")
+
+    def _partial_path(self, url_digest: UrlDigest) -> Path:
+        """Where a `ResumableFetcher` keeps the bytes it has fetched so far"""
+        name = f"{self.PARTIAL_PREFIX}{url_digest}"
+        if self.compression is not None:
+            name += f".{self.compression.name}"
+        return self.staging_dir / name
+
+    def _link_path(self, url_digest: UrlDigest) -> Path:
+        """Where a link to existing contents is made before it is moved into place"""
+        return self.staging_dir / f"{self.STAGING_PREFIX}{url_digest}_link"
+
+    def _blob_path(self, entry: _EntryPath) -> Path:
+        """Where the contents of `entry` are kept, compressed like `entry` is"""
+        name = str(entry.content_digest)
+        if entry.codec_name is not None:
+            name += f".{entry.codec_name}"
+        return self.blobs_dir / name
+
+    def _blob_target(self, entry: _EntryPath) -> str:
+        """The symlink target for `entry`, relative so the cache dir can be moved"""
+        return os.path.relpath(self._blob_path(entry), entry.path.parent)
+
+    def _move(self, src: Path, dst: Path, *, stream: Optional[_FileStream]) -> None:
+        if stream is None:
+            os.replace(src, dst)
+        else:
+            stream.move(src=src, dst=dst)
+
+    def _content_lock(self, content_digest: ContentDigest) -> FileLock:
+        self._check_writable()
+        return FileLock(self.blobs_dir / f"{content_digest}.lock")
+
+    def _link_to_identical(self, entry: _EntryPath, link: Path) -> bool:
+        """Makes `link` a hard link to an indexed entry with the same contents as `entry`,
+        compressed the same way
+
+        Returns False if there is no such entry or the filesystem has no hard links
+        """
+        while True:
+            existing = next(
+                (
+                    row
+                    for row in self._index.all_by_content(entry.content_digest)
+                    if row.rel_path != entry.rel_path
+                    and _EntryPath.from_index_row(
+                        row, cache_dir=self.dir_path
+                    ).codec_name
+                    == entry.codec_name
+                ),
+                None,
+            )
+            if existing is None:
+                return False
+            try:
+                os.link(self.dir_path / existing.rel_path, link)
+                return True
+            except FileNotFoundError:
+                # evicted since it was indexed; the evicting process drops the row too
+                self._index.remove(existing.rel_path)
+            except OSError:
+                return False
+
+    def _commit(
+        self,
+        staged: Path,
+        entry: _EntryPath,
+        *,
+        size: int,
+        stream: Optional[_FileStream],
+    ) -> None:
+        """Moves a fully fetched staging file into place as `entry` and indexes it
+
+        Contents that are already in the cache are not stored again; see `try_create`.
+        Entries are committed while holding the lock for their contents, and indexed
+        before it is released, so that concurrent commits of the same contents find
+        each other and `_collect_blob` never deletes a blob that is being linked to.
+
+        Must be called while holding the lock for the URL of `entry`
+        """
+        link = self._link_path(entry.url_digest)
+        try:
+            os.remove(link)  # left behind by a process that died mid-commit
+        except FileNotFoundError:
+            pass
+        with self._content_lock(entry.content_digest):
+            if self.use_symlinks:
+                blob = self._blob_path(entry)
+                if blob.exists():
+                    os.symlink(self._blob_target(entry), link)
+                    self._move(link, entry.path, stream=stream)
+                    os.remove(staged)
+                else:
+                    self._move(staged, blob, stream=stream)
+                    os.symlink(self._blob_target(entry), link)
+                    self._move(link, entry.path, stream=stream)
+            elif self._link_to_identical(entry, link):
+                self._move(link, entry.path, stream=stream)
+                os.remove(staged)
+            else:
+                self._move(staged, entry.path, stream=stream)
+            # a copy where linking failed has a file of its own, counted in full
+            inode = entry.path.stat().st_ino
+            self._index.insert(
+                entry.to_index_row(size=size, inode=inode, last_access=time.time())
+            )
+
+    def _collect_blob(self, entry: _EntryPath) -> None:
+        """Deletes the blob of a deleted `entry` if no other entry links to it anymore"""
+        blob = self._blob_path(entry)
+        with self._content_lock(entry.content_digest):
+            if any(
+                _EntryPath.from_index_row(row, cache_dir=self.dir_path).codec_name
+                == entry.codec_name
+                for row in self._index.all_by_content(entry.content_digest)
+            ):
+                return
+            try:
+                os.remove(blob)
+            except FileNotFoundError:
+                pass
+            except PermissionError:
+                logger.debug(f"Could not delete blob {blob}, which is still open")
+
+    def clean_staging_dir(self, *, stale_partial_age: float = 24 * 3600) -> int:
+        """Deletes the staging files left behind by processes that died mid-fetch
+
+        A staging file is only written to while holding the lock for its URL, so any
+        staging file whose lock can be taken is an orphan. The files of interrupted
+        resumable fetches are kept for the next fetch to resume from, unless they
+        haven't been written to for `stale_partial_age` seconds.
+
+        Returns the number of deleted files
+        """
+        self._check_writable()
+        deleted = 0
+        now = time.time()
+        for path in self.staging_dir.iterdir():
+            if path.name.startswith(self.STAGING_PREFIX):
+                url_hexdigest = path.name[len(self.STAGING_PREFIX) :][:64]
+            elif path.name.startswith(self.PARTIAL_PREFIX):
+                try:
+                    if now - path.stat().st_mtime < stale_partial_age:
+                        continue
+                except FileNotFoundError:
+                    continue
+                url_hexdigest = path.name[len(self.PARTIAL_PREFIX) :][:64]
+            else:
+                continue
+            try:
+                url_digest = UrlDigest.parse(hexdigest=url_hexdigest)
+            except ValueError:
+                continue
+            try:
+                with FileLock(self._lock_path(url_digest), timeout=0):
+                    os.remove(path)
+                    deleted += 1
+            except Timeout:
+                continue  # still being fetched
+            except (FileNotFoundError, PermissionError):
                 continue
+        if deleted:
+            logger.info(
+                f"Deleted {deleted} orphaned staging files in {self.staging_dir}"
+            )
+        return deleted
+
+    def verify(self, *, max_workers: Optional[int] = None) -> FsckReport:
+        """Rehashes every entry file to check that it still matches its digest
+
+        Files are hashed by a pool of `max_workers` processes (by default one per
+        CPU), a chunk at a time and with only a few files queued per process, so
+        memory use doesn't grow with the size of the cache. Files shared by several
+        entries are only hashed once. Nothing is changed; see `repair`.
+        """
+        report = FsckReport()
+        started = time.perf_counter()
+        # entries sharing a file (hard links, or symlinks to one blob) share a verdict
+        entries_by_file: Dict[Tuple[int, int], List[_EntryPath]] = {}
+        for path in self._iter_entry_files():
+            try:
+                entry = _EntryPath.try_from_path(path, cache_dir=self.dir_path)
+                if entry is None:
+                    continue
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if path.is_symlink():  # its blob is gone
+                    report.checked_entries += 1
+                    report.corrupt.append((path, "missing blob"))
+                continue
+            report.checked_entries += 1
+            entries_by_file.setdefault((stat.st_dev, stat.st_ino), []).append(entry)
+
+        workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            max_pending = 2 * workers
+            pending: "Dict[Future[Tuple[Optional[str], int]], List[_EntryPath]]" = {}
+            files = iter(entries_by_file.values())
+            while True:
+                for entries in files:
+                    entry = entries[0]
+                    future = pool.submit(
+                        _check_entry_file,
+                        str(entry.path),
+                        entry.codec_name,
+                        str(entry.content_digest),
+                    )
+                    pending[future] = entries
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entries = pending.pop(future)
+                    try:
+                        reason, size = future.result()
+                    except FileNotFoundError:
+                        continue
+                    report.bytes_hashed += size
+                    if reason is not None:
+                        report.corrupt.extend((e.path, reason) for e in entries)
+        report.seconds = time.perf_counter() - started
+        for path, reason in report.corrupt:
+            logger.warning(f"Corrupt cache entry {path}: {reason}")
+        return report
+
+    def repair(
+        self,
+        *,
+        quarantine: bool = True,
+        stale_lock_age: float = 3600,
+        stale_partial_age: float = 24 * 3600,
+        max_workers: Optional[int] = None,
+    ) -> FsckReport:
+        """Removes the corrupt entries found by `verify`, along with leftovers of
+        processes that crashed
+
+        Corrupt entry files are moved into the `quarantine` subdirectory of the cache,
+        or deleted if `quarantine` is False, and dropped from the index. Entries whose
+        URL is being fetched right now are left alone. Lock files that haven't been
+        touched for `stale_lock_age` seconds and aren't held are deleted, as are
+        orphaned staging files and those of resumable fetches that haven't made
+        progress for `stale_partial_age` seconds (see `clean_staging_dir`).
+        """
+        self._check_writable()
+        report = self.verify(max_workers=max_workers)
+        quarantine_dir = self.dir_path / self.QUARANTINE_DIR_NAME
+        for path, _ in report.corrupt:
+            entry = _EntryPath.try_from_path(
+                path, cache_dir=self.dir_path, timestamp=datetime.now()
+            )
+            assert entry is not None
+            try:
+                with FileLock(self._lock_path(entry.url_digest), timeout=0):
+                    if quarantine:
+                        quarantine_dir.mkdir(exist_ok=True)
+                        os.replace(path, quarantine_dir / path.name)
+                    else:
+                        os.remove(path)
+                    self._index.remove(entry.rel_path)
+            except Timeout:
+                continue  # being refetched right now
+            except FileNotFoundError:
+                continue
+            report.removed_entries += 1
+            if self.use_symlinks:
+                self._collect_blob(entry)
+
+        # before the locks, since cleaning the staging dir takes some of them
+        report.removed_staging_files = self.clean_staging_dir(
+            stale_partial_age=stale_partial_age
+        )
+        now = time.time()
+        lock_paths = list(self.dir_path.glob("downloading_url_*.lock"))
+        if self.sharded:
+            lock_paths += self.dir_path.glob("*/*/downloading_url_*.lock")
+        for lock_path in lock_paths:
+            try:
+                if now - lock_path.stat().st_mtime < stale_lock_age:
+                    continue
+                with FileLock(lock_path, timeout=0):
+                    os.remove(lock_path)
+                report.removed_locks += 1
+            except (Timeout, OSError):
+                continue  # held, or already gone
+        return report
+
+    def _is_bounded(self) -> bool:
+        return self.max_bytes is not None or self.max_entries is not None
+
+    @staticmethod
+    def _exceeds(
+        totals: Tuple[int, int],
+        *,
+        max_entries: Optional[int],
+        max_bytes: Optional[int],
+    ) -> bool:
+        count, size = totals
+        if max_entries is not None and count > max_entries:
+            return True
+        return max_bytes is not None and size > max_bytes
+
+    def evict(self) -> int:
+        """Deletes entries until the cache is within its bounds, minus a headroom of
+        `EVICTION_HEADROOM`
+
+        Only one thread or process evicts at a time; the others return immediately.
+        An entry is only deleted while holding the lock for its URL, so a file that
+        is being fetched or moved into place is skipped, as are files that the OS
+        refuses to delete because they are open (i.e. on Windows). On POSIX, readers
+        that already opened an evicted entry keep reading it normally.
+
+        Entries that have been superseded by a newer fetch of the same URL go first.
+        The bytes kept by interrupted resumable fetches count towards `max_bytes`,
+        but are left for them to resume.
+
+        Returns the number of deleted entries
+        """
+        if not self._is_bounded():
+            return 0
+        partial_bytes = self._partial_bytes()
+        count, size = self._index.totals()
+        if not self._exceeds(
+            (count, size + partial_bytes),
+            max_entries=self.max_entries,
+            max_bytes=self.max_bytes,
+        ):
+            return 0
+        try:
+            with FileLock(self.dir_path / "eviction.lock", timeout=0):
+                evicted = self._evict_locked(partial_bytes=partial_bytes)
+        except Timeout:
+            return 0  # someone else is already evicting
+        self.metrics.record_evictions(evicted)
+        logger.debug(f"Evicted {evicted} entries from {self.dir_path}")
+        return evicted
+
+    def _partial_bytes(self) -> int:
+        """The size of the files kept by interrupted resumable fetches"""
+        total = 0
+        for path in self.staging_dir.glob(f"{self.PARTIAL_PREFIX}*"):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                continue
+        return total
+
+    def _evict_locked(self, *, partial_bytes: int) -> int:
+        def low_watermark(bound: Optional[int]) -> Optional[int]:
+            return (
+                None if bound is None else bound - int(bound * self.EVICTION_HEADROOM)
+            )
+
+        max_entries = low_watermark(self.max_entries)
+        max_bytes = low_watermark(self.max_bytes)
+        self._index.flush_accesses()  # so that the policy sees recent hits
+        evicted = 0
+        skipped = 0  # rows that couldn't be deleted stay ahead of the others
+        while True:
+            rows = self._index.eviction_candidates(
+                self.eviction_policy.order_by, skip=skipped, limit=64
+            )
+            for row in rows:
+                # shared contents are only freed along with the last entry using them
+                count, size = self._index.totals()
+                if not self._exceeds(
+                    (count, size + partial_bytes),
+                    max_entries=max_entries,
+                    max_bytes=max_bytes,
+                ):
+                    return evicted
+                if self._try_delete_entry(row):
+                    evicted += 1
+                else:
+                    skipped += 1
+            if not rows:
+                return evicted
+
+    def _try_delete_entry(self, row: IndexRow) -> bool:
+        try:
+            with FileLock(self._lock_path(row.url_digest), timeout=0):
+                try:
+                    os.remove(self.dir_path / row.rel_path)
+                except FileNotFoundError:
+                    pass
+                except PermissionError:
+                    return False  # still open by some reader
+                self._index.remove(row.rel_path)
+        except Timeout:
+            return False  # being fetched right now
+        if self.use_symlinks:
+            self._collect_blob(_EntryPath.from_index_row(row, cache_dir=self.dir_path))
+        with self._instance_lock:
+            dl_fut = self._ongoing_downloads.get(row.url_digest)
+            if dl_fut and dl_fut.done():
+                result = dl_fut.result()
+                if isinstance(result, _EntryPath) and result.rel_path == row.rel_path:
+                    del self._ongoing_downloads[row.url_digest]
+        return True
+
+    def _wait_for_url(
+        self, url_digest: UrlDigest, *, force_refetch: "bool | ContentDigest"
+    ) -> "FileLock | _EntryPath":
+        """Acquires the lock for `url_digest`, unless the process holding it fetches an
+        entry that satisfies `force_refetch` first
+
+        Rather than having every waiting process poll the lock, waiters watch the
+        directory the entry will be moved into, and look it up in the index as soon as
+        it lands. The lock is only polled now and then, with a backoff, in case its
+        holder fails. Where the directory can't be watched, the index is polled instead.
+
+        Raises `Timeout` after `wait_timeout` seconds
+        """
+        lock_path = self._lock_path(url_digest)
+        lock = FileLock(lock_path)
+        deadline = (
+            None if self.wait_timeout is None else time.monotonic() + self.wait_timeout
+        )
+        waiting_since = time.time()
+
+        def satisfies(entry: _EntryPath) -> bool:
             if entry.url_digest != url_digest:
+                return False
+            if force_refetch is True:
+                return entry.timestamp.timestamp() >= waiting_since
+            return force_refetch is False or entry.content_digest == force_refetch
+
+        watcher: Optional[DirWatcher] = None
+        poll_interval = 0.05
+        try:
+            while True:
+                try:
+                    # the returned proxy is only useful in `with` statements
+                    _ = cast(object, lock.acquire(timeout=0))
+                    return lock
+                except Timeout:
+                    pass
+                if watcher is None:
+                    watcher = watch_dir(lock_path.parent)
+                indexed = self._get_entry_by_url(url_digest=url_digest)
+                if indexed and satisfies(indexed) and indexed.path.exists():
+                    return indexed
+                remaining = (
+                    math.inf if deadline is None else deadline - time.monotonic()
+                )
+                if remaining <= 0:
+                    raise Timeout(str(lock_path))
+                landed = False
+                for name in watcher.wait(min(poll_interval, remaining)):
+                    try:
+                        entry = _EntryPath.try_from_path(
+                            lock_path.parent / name, cache_dir=self.dir_path
+                        )
+                    except FileNotFoundError:
+                        continue
+                    if entry is None or entry.url_digest != url_digest:
+                        continue
+                    # its row, with the time it was fetched at, rather than the mtime
+                    # of a file that may be shared with older identical entries
+                    row = self._index.newest_by_url(url_digest)
+                    if row is not None and row.rel_path == entry.rel_path:
+                        indexed = _EntryPath.from_index_row(
+                            row, cache_dir=self.dir_path
+                        )
+                        if satisfies(indexed):
+                            return indexed
+                    landed = True
+                # the fetching process indexes the entry right after moving it into
+                # place, so a landed entry is looked up again shortly
+                poll_interval = 0.05 if landed else min(poll_interval * 2, 1.0)
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def _recent_failure(
+        self, url: U, url_digest: UrlDigest
+    ) -> "Optional[RecentlyFailed[U]]":
+        """The failure of the last fetch of `url`, if it is still to be remembered"""
+        if self.negative_caching is None:
+            return None
+        failure = self._index.failure(url_digest)
+        if failure is None:
+            return None
+        failed_at, reason = failure
+        retry_after = failed_at + self.negative_caching.ttl
+        if time.time() >= retry_after:
+            return None
+        return RecentlyFailed(
+            url=url, failed_at=failed_at, retry_after=retry_after, reason=reason
+        )
+
+    def _open(self, entry: _EntryPath) -> CacheEntry:
+        """Opens a cached entry, verifying its contents as configured by `verify_reads`"""
+        verify = self.verify_reads > 0 and (
+            next(self._opened_entries) % self.verify_reads == 0
+        )
+        return entry.open(self.metrics, verify=verify)
+
+    def _record_access(self, entry: _EntryPath) -> None:
+        if self._is_bounded():
+            self._index.touch(entry.rel_path)
+
+    def hits(self) -> int:
+        return self.metrics.hits.value
+
+    def misses(self) -> int:
+        return self.metrics.misses.value
+
+    def _iter_entry_files(self) -> Iterable[Path]:
+        """Yields candidate entry files of both the flat and the sharded layouts"""
+        for path in self.dir_path.iterdir():
+            if not _is_shard_dir_name(path.name) or not path.is_dir():
+                yield path
                 continue
-            if not out:
-                out = entry
-            elif entry.timestamp > out.timestamp:
-                out = entry
-        return out
+            for sub_dir in path.iterdir():
+                if _is_shard_dir_name(sub_dir.name) and sub_dir.is_dir():
+                    yield from sub_dir.iterdir()
+
+    def _scan_index_rows(self) -> Iterable[IndexRow]:
+        for entry_path in self._iter_entry_files():
+            try:
+                entry = _EntryPath.try_from_path(entry_path, cache_dir=self.dir_path)
+                if entry:
+                    stat = entry_path.stat()
+                    yield entry.to_index_row(
+                        size=stat.st_size,
+                        inode=stat.st_ino,
+                        last_access=stat.st_atime,
+                    )
+            except FileNotFoundError:
+                continue  # a symlink whose blob was collected, or a deleted entry
+
+    def _get_entry_by_url(self, *, url_digest: UrlDigest) -> Optional[_EntryPath]:
+        """The newest entry for `url_digest`, remembered until the index changes
+
+        So repeated lookups of a URL only read the generation of the index
+        """
+        # read before querying, so a result is never remembered for a newer generation
+        generation = self._index.generation()
+        with self._entries_lock:
+            if generation != self._entries_generation:
+                self._entries_by_url.clear()
+                self._entries_generation = generation
+            elif url_digest in self._entries_by_url:
+                return self._entries_by_url[url_digest]
+        row = self._index.newest_by_url(url_digest)
+        entry = (
+            None
+            if row is None
+            else _EntryPath.from_index_row(row, cache_dir=self.dir_path)
+        )
+        with self._entries_lock:
+            if (
+                generation == self._entries_generation
+                and len(self._entries_by_url) < self.MAX_REMEMBERED_ENTRIES
+            ):
+                self._entries_by_url[url_digest] = entry
+        return entry
+
+    def _open_indexed(
+        self, find: "Callable[[], Optional[_EntryPath]]"
+    ) -> Optional[CacheEntry]:
+        started = time.perf_counter()
+        try:
+            while True:
+                entry = find()
+                if entry is None:
+                    return None
+                try:
+                    out = self._open(entry)
+                    self._record_access(entry)
+                    return out
+                except FileNotFoundError:
+                    # file was deleted behind the index's back; drop the row and retry
+                    self._index.remove(entry.rel_path)
+        finally:
+            self.metrics.record_lookup(time.perf_counter() - started)
 
     def get_by_url(self, *, url: U) -> Optional[CacheEntry]:
-        out = self._get_entry_by_url(url=url)
-        if not out:
-            return None
-        return out.open()
+        return self.get_by_url_digest(url_digest=self._hash_url(url))
+
+    def get_by_url_digest(self, *, url_digest: UrlDigest) -> Optional[CacheEntry]:
+        """Like `get_by_url`, for callers that only know the digest of the URL"""
+        return self._open_indexed(lambda: self._get_entry_by_url(url_digest=url_digest))
 
     def get(self, *, digest: ContentDigest) -> Optional[CacheEntry]:
-        for entry_path in self.dir_path.iterdir():
-            entry = _EntryPath.try_from_path(entry_path)
-            if entry and entry.content_digest == digest:
-                return entry.open()
-        return None
+        def find() -> Optional[_EntryPath]:
+            row = self._index.any_by_content(digest)
+            if row is None:
+                return None
+            return _EntryPath.from_index_row(row, cache_dir=self.dir_path)
+
+        return self._open_indexed(find)
+
+    def fetch_many(
+        self,
+        urls: Iterable[U],
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        *,
+        max_concurrency: int = 8,
+        force_refetch: bool = False,
+        retries: int = 3,
+        retry_policy: "Optional[RetryPolicy]" = None,
+        freshness: Optional[FreshnessPolicy] = None,
+    ) -> "Iterator[Tuple[U, CacheEntry | FetchInterrupted[U] | DigestMismatch[U]]]":
+        """Like `Cache.fetch_many`, but fresh cached URLs are all looked up in a single
+        pass over the index and served straight away, without taking their locks
+        """
+        policy = freshness or self.freshness
+        unique_urls: Dict[UrlDigest, U] = {}
+        for url in urls:
+            _ = unique_urls.setdefault(self._hash_url(url), url)
+        if force_refetch is False:
+            rows = self._index.newest_by_urls(list(unique_urls.keys()))
+            now = time.time()
+            for url_digest, row in rows.items():
+                if policy.judge(age=now - row.timestamp) is not Freshness.FRESH:
+                    continue  # left to `Cache.fetch_many` to refetch or revalidate
+                entry = _EntryPath.from_index_row(row, cache_dir=self.dir_path)
+                try:
+                    reader = self._open(entry)
+                except FileNotFoundError:
+                    continue  # try_fetch will clean up the stale row
+                self.metrics.record_hit()
+                self._record_access(entry)
+                yield (unique_urls.pop(url_digest), reader)
+        yield from super().fetch_many(
+            unique_urls.values(),
+            fetcher,
+            max_concurrency=max_concurrency,
+            force_refetch=force_refetch,
+            retries=retries,
+            retry_policy=retry_policy,
+            freshness=policy,
+        )
+
+    def fetch_streaming(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        force_refetch: "bool | ContentDigest" = False,
+        freshness: Optional[FreshnessPolicy] = None,
+    ) -> "CacheEntry | StreamingEntry[U]":
+        """Like `fetch`, but returns a reader that follows the temporary file as it is
+        being written to, so bytes can be consumed while the fetch is still going on
+
+        Concurrent streaming fetches of the same URL in this process follow the same
+        temporary file. Other processes still wait for the whole entry to be fetched.
+        Entries that are already cached are opened and returned as they are.
+        """
+        url_digest = self._hash_url(url)
+        if (
+            force_refetch is False
+            and url_digest not in self._streams  # which would be joined anyway
+            and self._must_refetch(url, fetcher, freshness or self.freshness)
+        ):
+            force_refetch = True
+        if force_refetch is False:
+            cached = self.open_if_cached(url=url)
+            if cached is not None:
+                return cached
+        expected = force_refetch if isinstance(force_refetch, ContentDigest) else None
+        with self._instance_lock:
+            stream = self._streams.get(url_digest)
+            if stream is not None and force_refetch is not True:
+                self.metrics.record_hit()
+                self.metrics.record_join()
+                return StreamingEntry(
+                    url=url,
+                    url_digest=url_digest,
+                    stream=stream,
+                    expected_content_digest=expected,
+                )
+            stream = self._streams[url_digest] = _FileStream()
+
+        def forget_stream() -> None:
+            with self._instance_lock:
+                if self._streams.get(url_digest) is stream:
+                    del self._streams[url_digest]
+
+        stream.fetch_in_background(
+            url,
+            lambda: self._try_fetch(url, fetcher, force_refetch, stream=stream),
+            on_done=forget_stream,
+        )
+        return StreamingEntry(
+            url=url,
+            url_digest=url_digest,
+            stream=stream,
+            expected_content_digest=expected,
+        )
 
     def try_fetch(
         self,
@@ -211,26 +1455,122 @@ class DiskCache(Cache[U]):
         fetcher: "Callable[[U], Iterable[bytes]]",
         force_refetch: "bool | ContentDigest",
     ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
-        url_digest = self.url_hasher(url)
+        return self._try_fetch(url, fetcher, force_refetch, stream=None)
+
+    def fetched_at(self, *, url: U) -> Optional[datetime]:
+        entry = self._get_entry_by_url(url_digest=self._hash_url(url))
+        return None if entry is None else entry.timestamp
+
+    def open_if_cached(self, *, url: U) -> Optional[CacheEntry]:
+        cached = self._open_cached(self._hash_url(url))
+        return None if cached is None else cached[1]
+
+    def _open_cached(
+        self, url_digest: UrlDigest
+    ) -> "Optional[Tuple[_EntryPath, CacheEntry]]":
+        """Opens the entry of `url_digest` as a hit, unless this process is fetching it
+
+        Entries never change once indexed, so serving one needs no lock
+        """
+        in_flight = self._ongoing_downloads.get(url_digest)
+        if in_flight is not None and not in_flight.done():
+            return None
+        cached = self._get_entry_by_url(url_digest=url_digest)
+        if cached is None:
+            return None
+        try:
+            reader = self._open(cached)
+        except FileNotFoundError:
+            return None  # evicted; cleaned up by the next fetch, under the lock
+        self.metrics.record_hit()
+        self._record_access(cached)
+        return (cached, reader)
+
+    def _try_fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        force_refetch: "bool | ContentDigest",
+        *,
+        stream: Optional[_FileStream],
+        fetched_at: "Optional[Callable[[], datetime]]" = None,
+        uncached_errors: "Tuple[Type[Exception], ...]" = (),
+    ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+        """`fetched_at` tells when contents copied from another cache were fetched
+
+        Failures raising any of `uncached_errors` are never negatively cached, as
+        they aren't failures of the URL itself
+        """
+        url_digest = self._hash_url(url)
+
+        in_flight = self._ongoing_downloads.get(url_digest)
+        if force_refetch is False:
+            cached = self._open_cached(url_digest)
+            if cached is not None:
+                entry, reader = cached
+                if stream is not None:
+                    stream.finish_at(entry)
+                return reader
+        if isinstance(force_refetch, bool) and (in_flight is None or in_flight.done()):
+            # about to fetch, unless the URL failed recently
+            failed = self._recent_failure(url, url_digest)
+            if failed is not None:
+                return failed
 
         _ = self._instance_lock.acquire()  # <<<<<<<<<
         dl_fut = self._ongoing_downloads.get(url_digest)
+        if dl_fut and dl_fut.done() and force_refetch is not False:
+            done_result = dl_fut.result()
+            if force_refetch is True or (
+                isinstance(done_result, _EntryPath)
+                and done_result.content_digest != force_refetch
+            ):
+                dl_fut = None  # a finished download doesn't satisfy a forced refetch
         if dl_fut:  # some other thread IN THIS PROCESS is downloading it
             self._instance_lock.release()  # >>>>>>>
-            result = dl_fut.result()
+            joined = not dl_fut.done()
+            waiting_since = time.perf_counter()
+            try:
+                result = dl_fut.result(timeout=self.wait_timeout)
+            except FutureTimeoutError as e:
+                return FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            finally:
+                if joined:
+                    self.metrics.record_join()
+                    self.metrics.record_future_wait(time.perf_counter() - waiting_since)
             if isinstance(result, Exception):
                 return result
-            self._hits += 1
             if (
                 isinstance(force_refetch, ContentDigest)
                 and result.content_digest != force_refetch
             ):
+                self.metrics.record_hit()
+                if stream is not None:
+                    stream.finish_at(result)
                 return DigestMismatch(
                     url=url,
                     expected_content_digest=force_refetch,
                     actual_content_digest=result.content_digest,
                 )
-            return result.open()
+            try:
+                reader = self._open(result)
+            except FileNotFoundError:  # evicted since it was fetched; fetch it again
+                with self._instance_lock:
+                    if self._ongoing_downloads.get(url_digest) is dl_fut:
+                        del self._ongoing_downloads[url_digest]
+                return self._try_fetch(
+                    url,
+                    fetcher,
+                    force_refetch,
+                    stream=stream,
+                    fetched_at=fetched_at,
+                    uncached_errors=uncached_errors,
+                )
+            self.metrics.record_hit()
+            self._record_access(result)
+            if stream is not None:
+                stream.finish_at(result)
+            return reader
 
         dl_fut = self._ongoing_downloads[url_digest] = (
             Future()
@@ -238,62 +1578,240 @@ class DiskCache(Cache[U]):
         _ = dl_fut.set_running_or_notify_cancel()
         self._instance_lock.release()  # >>>>>>
 
-        interproc_lock = FileLock(self.dir_path / f"downloading_url_{url_digest}.lock")
-        with interproc_lock:
+        waiting_since = time.perf_counter()
+        try:
+            lock_or_entry = self._wait_for_url(url_digest, force_refetch=force_refetch)
+        except Timeout as e:
+            with self._instance_lock:
+                del self._ongoing_downloads[url_digest]
+            error = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            dl_fut.set_result(error)
+            return error
+        finally:
+            self.metrics.record_file_lock_wait(time.perf_counter() - waiting_since)
+        if isinstance(lock_or_entry, _EntryPath):
+            logger.debug(
+                f"pid{os.getpid()}:{threading.get_ident()} uses file {lock_or_entry.path} fetched by another process"
+            )
+            dl_fut.set_result(lock_or_entry)
+            try:
+                reader = self._open(lock_or_entry)
+            except FileNotFoundError:  # evicted since it landed; fetch it again
+                with self._instance_lock:
+                    if self._ongoing_downloads.get(url_digest) is dl_fut:
+                        del self._ongoing_downloads[url_digest]
+                return self._try_fetch(
+                    url,
+                    fetcher,
+                    force_refetch,
+                    stream=stream,
+                    fetched_at=fetched_at,
+                    uncached_errors=uncached_errors,
+                )
+            self.metrics.record_hit()
+            self._record_access(lock_or_entry)
+            if stream is not None:
+                stream.finish_at(lock_or_entry)
+            return reader
+
+        interproc_lock = lock_or_entry
+        resumable = isinstance(fetcher, ResumableFetcher)
+        staging_path: Optional[Path] = None
+        temp_file: Optional[IO[bytes]] = None
+        try:
             logger.debug(
                 f"pid{os.getpid()}:tid{threading.get_ident()} gets the file lock for {interproc_lock.lock_file}"
             )
             try:
                 if force_refetch != True:
-                    out = self._get_entry_by_url(url=url)
+                    out = self._get_entry_by_url(url_digest=url_digest)
+                    while out and not out.path.exists():
+                        self._index.remove(out.rel_path)
+                        out = self._get_entry_by_url(url_digest=url_digest)
                     if out and (
                         force_refetch is False or out.content_digest == force_refetch
                     ):
                         logger.debug(
                             f"pid{os.getpid()}:{threading.get_ident()} uses CACHED file {out.path}"
                         )
-                        self._hits += 1
+                        self.metrics.record_hit()
+                        self._record_access(out)
                         dl_fut.set_result(out)
-                        return out.open()
+                        if stream is not None:
+                            stream.finish_at(out)
+                        return self._open(out)
+                failed = self._recent_failure(url, url_digest)
+                if failed is not None:  # e.g. by the process that held the lock
+                    with self._instance_lock:
+                        del self._ongoing_downloads[url_digest]
+                    dl_fut.set_result(failed)
+                    return failed
 
-                self._misses += 1
-                chunks = fetcher(url)
-                temp_file = tempfile.NamedTemporaryFile(delete=False)
-                contents_sha = sha256()
+                self.metrics.record_miss()
+                started = time.perf_counter()
+                contents_hash = PipelinedHash(
+                    hasher_for(force_refetch, self.content_hasher)
+                )
+                size = 0
+                codec = self.compression
+                writer: Optional[FrameWriter] = None
+                if isinstance(fetcher, ResumableFetcher):
+                    staging_path = self._partial_path(url_digest)
+                    # a forced refetch wants the current contents, which the bytes
+                    # fetched before it may not be part of
+                    mode = "a+b" if force_refetch is False else "w+b"
+                    temp_file = partial_file = open(staging_path, mode)
+                    if codec is None:
+                        _ = partial_file.seek(0)
+                        blocks = iter(lambda: partial_file.read(1024 * 1024), b"")
+                    else:
+                        writer = FrameWriter(partial_file, codec)
+                        blocks = writer.recover()
+                    for block in blocks:
+                        contents_hash.update(block)
+                        size += len(block)
+                    if size:
+                        logger.info(f"Resuming fetch of {url} from byte {size}")
+                    resumed_at = size
+                    chunks = fetcher.resume(url, size) if size else fetcher(url)
+                else:
+                    resumed_at = 0
+                    chunks = fetcher(url)
+                    temp_file = tempfile.NamedTemporaryFile(
+                        dir=self.staging_dir,
+                        prefix=f"{self.STAGING_PREFIX}{url_digest}_",
+                        delete=False,
+                    )
+                    staging_path = Path(temp_file.name)
+                    if codec is not None:
+                        writer = FrameWriter(temp_file, codec)
+                if stream is not None:
+                    stream.start(staging_path, codec=codec)
+                    if writer is None:
+                        stream.grow(size)
+                    else:
+                        stream.grow_frames(writer.table.sizes)
                 for chunk in chunks:
-                    contents_sha.update(chunk)
-                    _ = temp_file.write(chunk)  # FIXME: check num bytes written?
+                    contents_hash.update(chunk)
+                    size += len(chunk)
+                    if writer is None:
+                        _ = temp_file.write(chunk)  # FIXME: check num bytes written?
+                        if stream is not None:
+                            temp_file.flush()
+                            stream.grow(len(chunk))
+                        continue
+                    frames = writer.write(chunk)
+                    if stream is not None and frames:
+                        temp_file.flush()
+                        stream.grow_frames(frames)
+                stored_size = size
+                if writer is not None:
+                    frames = writer.finish()
+                    stored_size = os.fstat(temp_file.fileno()).st_size
+                    if stream is not None:
+                        stream.grow_frames(frames)
+                if self.fsync:
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
                 temp_file.close()
-                content_digest = ContentDigest(digest=contents_sha.digest())
+                content_digest = contents_hash.content_digest()
+                timestamp = datetime.now() if fetched_at is None else fetched_at()
+                if fetched_at is not None:  # for when the index is rebuilt
+                    ts = timestamp.timestamp()
+                    os.utime(staging_path, (ts, ts))
 
                 cache_entry_path = _EntryPath(
                     url_digest,
                     content_digest,
                     cache_dir=self.dir_path,
-                    timestamp=datetime.now(),
+                    timestamp=timestamp,
+                    sharded=self.sharded,
+                    codec_name=None if codec is None else codec.name,
+                )
+                logger.debug(f"Moving staging file to {cache_entry_path.path}")
+                # still under the interprocess lock, so no other process can observe
+                # the moved file for this URL before it is indexed
+                self._commit(
+                    staging_path, cache_entry_path, size=stored_size, stream=stream
                 )
-                logger.debug(f"Moving temp file to {cache_entry_path.path}")
-                _ = shutil.move(src=temp_file.name, dst=cache_entry_path.path)
+                staging_path = None
+                if self.fsync:
+                    _fsync_dir(cache_entry_path.path.parent)
+                    if self.use_symlinks:
+                        _fsync_dir(self.blobs_dir)
+                if (
+                    not resumable
+                ):  # a partial fetch may have been left by a resumable fetcher
+                    try:
+                        os.remove(self._partial_path(url_digest))
+                    except FileNotFoundError:
+                        pass
+                self.metrics.record_fetch(
+                    seconds=time.perf_counter() - started, size=size - resumed_at
+                )
+                if self.negative_caching is not None:
+                    self._index.forget_failure(url_digest)
                 dl_fut.set_result(cache_entry_path)
+                if stream is not None:
+                    stream.finish_at(cache_entry_path)
+                # opened before the lock is released, so it can't be evicted first;
+                # unexpected contents are stored but not served
+                mismatched = (
+                    isinstance(force_refetch, ContentDigest)
+                    and content_digest != force_refetch
+                )
+                reader = None if mismatched else cache_entry_path.open(self.metrics)
                 logger.debug(
                     f"pid{os.getpid()}:tid{threading.get_ident()} RELEASES the file lock for {interproc_lock.lock_file}"
                 )
             except Exception as e:
+                if temp_file is not None:
+                    temp_file.close()
+                # only bytes that made it to disk are worth resuming from
+                keeps_partial = False
+                if staging_path is not None and resumable:
+                    try:
+                        keeps_partial = os.path.getsize(staging_path) > 0
+                    except OSError:
+                        pass
+                if staging_path is not None and not keeps_partial:
+                    try:
+                        os.remove(staging_path)
+                    except OSError:
+                        pass  # left for clean_staging_dir
                 with self._instance_lock:
                     del self._ongoing_downloads[
                         url_digest
                     ]  # remove the Event so this download can be retried
-                dl_fut.set_result(
-                    FetchInterrupted(url=url).with_traceback(e.__traceback__)
-                )
+                error = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+                error.__cause__ = e
+                if (
+                    self.negative_caching is not None
+                    and not keeps_partial  # the next attempt resumes instead
+                    and not isinstance(e, uncached_errors)
+                    and self.negative_caching.should_cache(e)
+                ):
+                    # still under the lock, so processes waiting for it will see this
+                    self._index.record_failure(
+                        url_digest,
+                        failed_at=time.time(),
+                        reason=repr(e),
+                        max_count=self.negative_caching.max_entries,
+                    )
+                dl_fut.set_result(error)
+                if keeps_partial:
+                    # the bytes fetched so far are kept, so a retry resumes from there
+                    logger.warning(f"Fetching {url} was interrupted: {e!r}")
+                    return error
                 raise
-        if (
-            isinstance(force_refetch, ContentDigest)
-            and cache_entry_path.content_digest != force_refetch
-        ):
+        finally:
+            interproc_lock.release()
+        if reader is None:
+            assert isinstance(force_refetch, ContentDigest)
             return DigestMismatch(
                 url=url,
                 expected_content_digest=force_refetch,
                 actual_content_digest=cache_entry_path.content_digest,
             )
-        return cache_entry_path.open()
+        _ = self.evict()
+        return reader
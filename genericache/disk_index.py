@@ -0,0 +1,596 @@
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Final,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from filelock import FileLock
+
+from genericache import CacheReadOnly
+from genericache.digest import ContentDigest, UrlDigest
+
+logger = logging.getLogger(__name__)
+
+
+class IndexRow:
+    """A single entry of the index, pointing at a file inside the cache directory
+
+    `rel_path` is relative to the cache directory and always uses forward slashes.
+    `inode` identifies the file holding the contents, which entries that share their
+    contents via links have in common
+    """
+
+    def __init__(
+        self,
+        *,
+        url_digest: UrlDigest,
+        content_digest: ContentDigest,
+        rel_path: str,
+        timestamp: float,
+        size: int,
+        last_access: float,
+        access_count: int,
+        inode: int,
+    ) -> None:
+        super().__init__()
+        self.url_digest: Final[UrlDigest] = url_digest
+        self.content_digest: Final[ContentDigest] = content_digest
+        self.rel_path: Final[str] = rel_path
+        self.timestamp: Final[float] = timestamp
+        self.size: Final[int] = size
+        self.last_access: Final[float] = last_access
+        self.access_count: Final[int] = access_count
+        self.inode: Final[int] = inode
+
+    def to_sql(self) -> Tuple[str, bytes, bytes, str, float, int, float, int, int]:
+        return (
+            self.rel_path,
+            self.url_digest.digest,
+            self.content_digest.digest,
+            self.content_digest.algorithm,
+            self.timestamp,
+            self.size,
+            self.last_access,
+            self.access_count,
+            self.inode,
+        )
+
+    @classmethod
+    def from_sql(cls, values: Sequence[Any]) -> "IndexRow":
+        (
+            rel_path,
+            url_digest,
+            content_digest,
+            content_algorithm,
+            timestamp,
+            size,
+            last_access,
+            access_count,
+            inode,
+        ) = values
+        return IndexRow(
+            rel_path=rel_path,
+            url_digest=UrlDigest(url_digest),
+            content_digest=ContentDigest(content_digest, algorithm=content_algorithm),
+            timestamp=timestamp,
+            size=size,
+            last_access=last_access,
+            access_count=access_count,
+            inode=inode,
+        )
+
+
+_ROW_COLUMNS = (
+    "rel_path, url_digest, content_digest, content_algorithm,"
+    " timestamp, size, last_access, access_count, inode"
+)
+_ROW_PLACEHOLDERS = "?, ?, ?, ?, ?, ?, ?, ?, ?"
+# older SQLite versions refuse statements with more than 999 parameters
+_MAX_SQL_PARAMS = 500
+# fetches that failed recently; see `DiskCache.try_create`'s `negative_caching`
+_CREATE_FAILURES = (
+    "CREATE TABLE IF NOT EXISTS failures ("
+    " url_digest BLOB PRIMARY KEY,"
+    " failed_at REAL NOT NULL,"
+    " reason TEXT NOT NULL"
+    ")"
+)
+# The number of entries and the bytes they take up are kept up to date by triggers,
+# so `totals` doesn't have to scan the whole table. Entries linked to the same file
+# share its data, which `storage` counts once; copies are counted in full. REPLACEs
+# only fire the delete trigger with `recursive_triggers` on
+_CREATE_TOTALS = (
+    "CREATE TABLE storage ("
+    " inode INTEGER PRIMARY KEY,"
+    " size INTEGER NOT NULL,"
+    " refs INTEGER NOT NULL"
+    ")",
+    "CREATE TABLE totals ("
+    " id INTEGER PRIMARY KEY CHECK (id = 0),"
+    " entries INTEGER NOT NULL,"
+    " bytes INTEGER NOT NULL"
+    ")",
+    "INSERT INTO totals (id, entries, bytes) VALUES (0, 0, 0)",
+    "CREATE TRIGGER entry_inserted AFTER INSERT ON entries BEGIN"
+    " UPDATE totals SET entries = entries + 1,"
+    "  bytes = bytes + CASE WHEN EXISTS ("
+    "  SELECT 1 FROM storage WHERE inode = NEW.inode"
+    " ) THEN 0 ELSE NEW.size END;"
+    " INSERT OR IGNORE INTO storage (inode, size, refs)"
+    "  VALUES (NEW.inode, NEW.size, 0);"
+    " UPDATE storage SET refs = refs + 1 WHERE inode = NEW.inode;"
+    " END",
+    "CREATE TRIGGER entry_deleted AFTER DELETE ON entries BEGIN"
+    " UPDATE storage SET refs = refs - 1 WHERE inode = OLD.inode;"
+    " UPDATE totals SET entries = entries - 1,"
+    "  bytes = bytes - COALESCE(("
+    "  SELECT size FROM storage WHERE inode = OLD.inode AND refs <= 0"
+    " ), 0);"
+    " DELETE FROM storage WHERE inode = OLD.inode AND refs <= 0;"
+    " END",
+    # entries with a newer entry of the same URL are flagged, to be evicted first
+    "CREATE TRIGGER supersede_older_entries AFTER INSERT ON entries BEGIN"
+    " UPDATE entries SET superseded = 1"
+    "  WHERE url_digest = NEW.url_digest AND superseded = 0 AND timestamp < ("
+    "   SELECT MAX(timestamp) FROM entries WHERE url_digest = NEW.url_digest"
+    "  );"
+    " END",
+    "CREATE TRIGGER unsupersede_newest_entry AFTER DELETE ON entries BEGIN"
+    " UPDATE entries SET superseded = 0"
+    "  WHERE url_digest = OLD.url_digest AND superseded = 1 AND timestamp = ("
+    "   SELECT MAX(timestamp) FROM entries WHERE url_digest = OLD.url_digest"
+    "  );"
+    " END",
+)
+# the columns that eviction policies may order entries by, see `EvictionPolicy.order_by`
+_ORDERABLE_COLUMNS = ("size", "timestamp", "last_access", "access_count")
+
+
+class DiskIndex:
+    """A persistent, process-safe index of the entries in a cache directory
+
+    The index is an SQLite database living inside the cache directory. It is only
+    ever a lookup accelerator: the file names of the entries remain the source of
+    truth, so if the database goes missing or gets corrupted it is rebuilt by scanning
+    the directory via `scan`.
+
+    Rows are written after the entry file has been moved into place, so a row always
+    points to a file that existed at the time of insertion. Readers that find a row
+    whose file is gone should `remove` it and look again.
+
+    Accesses recorded via `touch` are written in batches, every `ACCESS_BATCH_SIZE`
+    accesses or `ACCESS_BATCH_SECONDS`, whichever comes first, so that hits don't each
+    cost a write. Accesses that are still pending when the process exits are lost,
+    which only makes eviction a little less accurate.
+    """
+
+    SCHEMA_VERSION = 7
+    FILE_NAME = "index.sqlite3"
+    GENERATION_FILE_NAME = "index.generation"
+    ACCESS_BATCH_SIZE = 256
+    ACCESS_BATCH_SECONDS = 5.0
+
+    def __init__(
+        self,
+        *,
+        cache_dir: Path,
+        scan: Callable[[], Iterable[IndexRow]],
+        read_only: bool = False,
+    ) -> None:
+        super().__init__()
+        self.db_path: Final[Path] = cache_dir / self.FILE_NAME
+        # even read-only connections leave files behind in WAL mode, so a read-only
+        # index can't be used at all
+        self.read_only: Final[bool] = read_only
+        self._scan: Final[Callable[[], Iterable[IndexRow]]] = scan
+        self._rebuild_lock_path: Final[Path] = cache_dir / "index.lock"
+        # sqlite3 connections can't be shared by threads by default nor survive a
+        # fork, so a single connection is used behind a lock and reopened on pid change
+        self._lock: Final[threading.RLock] = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: int = -1
+        self._db_inode: int = -1
+        # a token shared by all processes through a mapped file, replaced after every
+        # change to the entries; see `generation`
+        self._generation_path: Final[Path] = cache_dir / self.GENERATION_FILE_NAME
+        self._generation: Optional[mmap.mmap] = None
+        self._seen_generation: bytes = b""
+        # the time and number of accesses of each entry since the last flush
+        self._pending_accesses: Dict[str, Tuple[float, int]] = {}
+        self._accesses_flushed_at: float = time.monotonic()
+
+    @staticmethod
+    def _exec(
+        conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()
+    ) -> List[Any]:
+        # cursors must be closed eagerly, or the statement stays "in progress" and
+        # blocks COMMITs on the same connection
+        cursor = conn.execute(sql, params)
+        try:
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _rebuild_lock(self) -> FileLock:
+        # a new one each time, since FileLocks can't be used across a fork either
+        return FileLock(self._rebuild_lock_path)
+
+    def _open_db(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        _ = self._exec(conn, "PRAGMA journal_mode=WAL")
+        _ = self._exec(conn, "PRAGMA recursive_triggers=ON")
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the connection for this process, creating the database if needed
+
+        Must be called while holding `_lock`
+        """
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+        if self.read_only:
+            raise CacheReadOnly(self.db_path.parent)
+        with self._rebuild_lock():
+            existed = self.db_path.exists()
+            conn = self._open_db()
+            try:
+                version: int = self._exec(conn, "PRAGMA user_version")[0][0]
+                filled = not existed or version != self.SCHEMA_VERSION
+                if filled:
+                    self._create_schema(conn)
+                    self._fill(conn)
+                _ = self._exec(conn, _CREATE_FAILURES)  # older indices lack it
+            except sqlite3.DatabaseError:
+                conn.close()
+                logger.warning(f"Index at {self.db_path} is unusable. Rebuilding it")
+                conn = self._recreate()
+                filled = True
+            self._conn = conn
+            self._conn_pid = os.getpid()
+            self._db_inode = os.stat(self.db_path).st_ino
+            self._map_generation()
+            if filled:
+                self._bump_generation()
+            return conn
+
+    def _map_generation(self) -> None:
+        if self._generation is not None:
+            self._generation.close()
+        with open(self._generation_path, "a+b") as file:
+            if os.fstat(file.fileno()).st_size < 8:
+                _ = file.truncate(8)
+            self._generation = mmap.mmap(file.fileno(), 8)
+
+    def _bump_generation(self) -> None:
+        """Must be called after committing a change to the entries, while holding
+        `_lock`
+        """
+        assert self._generation is not None
+        self._generation[:8] = os.urandom(8)
+
+    def _recreate(self) -> sqlite3.Connection:
+        """Deletes the database files and builds a new index from the directory
+
+        Must be called while holding the `_rebuild_lock()`
+        """
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                os.remove(f"{self.db_path}{suffix}")
+            except FileNotFoundError:
+                pass
+        conn = self._open_db()
+        self._create_schema(conn)
+        self._fill(conn)
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        _ = self._exec(conn, "BEGIN IMMEDIATE")
+        try:
+            for table in ("entries", "storage", "totals"):
+                _ = self._exec(conn, f"DROP TABLE IF EXISTS {table}")
+            _ = self._exec(
+                conn,
+                "CREATE TABLE entries ("
+                " rel_path TEXT PRIMARY KEY,"
+                " url_digest BLOB NOT NULL,"
+                " content_digest BLOB NOT NULL,"
+                " content_algorithm TEXT NOT NULL,"
+                " timestamp REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " access_count INTEGER NOT NULL,"
+                " inode INTEGER NOT NULL,"
+                " superseded INTEGER NOT NULL DEFAULT 0"
+                ")",
+            )
+            _ = self._exec(
+                conn, "CREATE INDEX entries_by_url ON entries (url_digest, timestamp)"
+            )
+            _ = self._exec(
+                conn, "CREATE INDEX entries_by_content ON entries (content_digest)"
+            )
+            for statement in _CREATE_TOTALS:
+                _ = self._exec(conn, statement)
+            _ = self._exec(conn, _CREATE_FAILURES)
+            _ = self._exec(conn, f"PRAGMA user_version={self.SCHEMA_VERSION}")
+            _ = self._exec(conn, "COMMIT")
+        except BaseException:
+            _ = self._exec(conn, "ROLLBACK")
+            raise
+
+    def _fill(self, conn: sqlite3.Connection) -> None:
+        # BEGIN IMMEDIATE takes the write lock *before* scanning, so an entry moved
+        # into place concurrently is either seen by the scan or inserted afterwards
+        _ = self._exec(conn, "BEGIN IMMEDIATE")
+        try:
+            _ = self._exec(conn, "DELETE FROM entries")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO entries ({_ROW_COLUMNS})"
+                f" VALUES ({_ROW_PLACEHOLDERS})",
+                (row.to_sql() for row in self._scan()),
+            ).close()
+            _ = self._exec(conn, "COMMIT")
+        except BaseException:
+            _ = self._exec(conn, "ROLLBACK")
+            raise
+
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> List[Any]:
+        with self._lock:
+            try:
+                return self._exec(self._connect(), sql, params)
+            except sqlite3.OperationalError:
+                raise  # e.g. "database is locked"; not a sign of corruption
+            except sqlite3.DatabaseError:
+                logger.warning(f"Index at {self.db_path} is corrupted. Rebuilding it")
+                self.rebuild()
+                return self._exec(self._connect(), sql, params)
+
+    def rebuild(self) -> None:
+        """Discards the database and rebuilds it from the directory contents"""
+        if self.read_only:
+            raise CacheReadOnly(self.db_path.parent)
+        with self._lock, self._rebuild_lock():
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = self._recreate()
+            self._conn_pid = os.getpid()
+            self._db_inode = os.stat(self.db_path).st_ino
+            self._map_generation()
+            self._bump_generation()
+
+    def _forget_replaced_db(self) -> None:
+        """Drops the connection if another process has rebuilt the database from scratch
+
+        Otherwise rows inserted via the stale connection would land in an unlinked file
+        """
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except FileNotFoundError:
+            inode = -1
+        if inode != self._db_inode and self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def generation(self) -> bytes:
+        """A value that changes whenever rows are added, moved or removed, by any
+        process
+
+        It is read from memory shared with the other processes, without a query.
+        Other writes, like access statistics or failures, don't change it.
+        """
+        with self._lock:
+            if self._conn is None or self._conn_pid != os.getpid():
+                # connects the way queries do, rebuilding a corrupted database
+                _ = self._query("SELECT 1")
+            assert self._generation is not None
+            generation = self._generation[:8]
+            if generation != self._seen_generation:
+                self._forget_replaced_db()  # e.g. rebuilt by another process
+                self._seen_generation = generation
+            return generation
+
+    def newest_by_url(self, url_digest: UrlDigest) -> Optional[IndexRow]:
+        rows = self._query(
+            f"SELECT {_ROW_COLUMNS} FROM entries"
+            " WHERE url_digest = ? ORDER BY timestamp DESC LIMIT 1",
+            (url_digest.digest,),
+        )
+        return IndexRow.from_sql(rows[0]) if rows else None
+
+    def newest_by_urls(
+        self, url_digests: Sequence[UrlDigest]
+    ) -> Dict[UrlDigest, IndexRow]:
+        """Like `newest_by_url`, but for many digests in as few queries as possible"""
+        out: Dict[UrlDigest, IndexRow] = {}
+        for start in range(0, len(url_digests), _MAX_SQL_PARAMS):
+            batch = [d.digest for d in url_digests[start : start + _MAX_SQL_PARAMS]]
+            placeholders = ", ".join("?" * len(batch))
+            for values in self._query(
+                f"SELECT {_ROW_COLUMNS} FROM entries WHERE url_digest IN ({placeholders})",
+                batch,
+            ):
+                row = IndexRow.from_sql(values)
+                newest = out.get(row.url_digest)
+                if newest is None or row.timestamp > newest.timestamp:
+                    out[row.url_digest] = row
+        return out
+
+    def any_by_content(self, content_digest: ContentDigest) -> Optional[IndexRow]:
+        rows = self._query(
+            f"SELECT {_ROW_COLUMNS} FROM entries"
+            " WHERE content_digest = ? AND content_algorithm = ? LIMIT 1",
+            (content_digest.digest, content_digest.algorithm),
+        )
+        return IndexRow.from_sql(rows[0]) if rows else None
+
+    def all_by_content(self, content_digest: ContentDigest) -> List[IndexRow]:
+        return [
+            IndexRow.from_sql(values)
+            for values in self._query(
+                f"SELECT {_ROW_COLUMNS} FROM entries"
+                " WHERE content_digest = ? AND content_algorithm = ?",
+                (content_digest.digest, content_digest.algorithm),
+            )
+        ]
+
+    def eviction_candidates(
+        self, order_by: Sequence[str], *, skip: int, limit: int
+    ) -> List[IndexRow]:
+        """Up to `limit` rows in the order they should be evicted, after the first
+        `skip` ones: entries superseded by a newer entry of the same URL first, and
+        then in ascending order of the `order_by` columns
+
+        The first call for an order creates an index for it, so that later ones only
+        read the rows they return
+        """
+        assert all(column in _ORDERABLE_COLUMNS for column in order_by), order_by
+        columns = ", ".join(["superseded DESC", *order_by])
+        _ = self._query(
+            f"CREATE INDEX IF NOT EXISTS entries_by_{'_'.join(order_by)}"
+            f" ON entries ({columns})"
+        )
+        return [
+            IndexRow.from_sql(values)
+            for values in self._query(
+                f"SELECT {_ROW_COLUMNS} FROM entries"
+                f" ORDER BY {columns} LIMIT ? OFFSET ?",
+                (limit, skip),
+            )
+        ]
+
+    def insert(self, row: IndexRow) -> None:
+        with self._lock:
+            self._forget_replaced_db()
+            _ = self._query(
+                f"INSERT OR REPLACE INTO entries ({_ROW_COLUMNS})"
+                f" VALUES ({_ROW_PLACEHOLDERS})",
+                row.to_sql(),
+            )
+            self._bump_generation()
+
+    def rename(self, old_rel_path: str, new_rel_path: str) -> bool:
+        """Points a row to the new location of its file, keeping its usage stats
+
+        Returns False if there was no row for `old_rel_path`
+        """
+        with self._lock:
+            self._forget_replaced_db()
+            _ = self._query(
+                "UPDATE entries SET rel_path = ? WHERE rel_path = ?",
+                (new_rel_path, old_rel_path),
+            )
+            renamed = self._query("SELECT changes()")[0][0] > 0
+            self._bump_generation()
+            return renamed
+
+    def touch(self, rel_path: str) -> None:
+        """Records an access to an entry, for the benefit of eviction policies
+
+        The access is only written with the next batch; see `flush_accesses`
+        """
+        now = time.time()
+        with self._lock:
+            count = self._pending_accesses.get(rel_path, (now, 0))[1]
+            self._pending_accesses[rel_path] = (now, count + 1)
+            due = (
+                len(self._pending_accesses) >= self.ACCESS_BATCH_SIZE
+                or time.monotonic() - self._accesses_flushed_at
+                >= self.ACCESS_BATCH_SECONDS
+            )
+        if due:
+            self.flush_accesses()
+
+    def flush_accesses(self) -> None:
+        """Writes the accesses recorded by `touch` so far, in a single transaction"""
+        with self._lock:
+            pending = self._pending_accesses.copy()
+            self._pending_accesses.clear()
+            self._accesses_flushed_at = time.monotonic()
+            if not pending:
+                return
+            try:
+                self._forget_replaced_db()
+                conn = self._connect()
+                _ = self._exec(conn, "BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "UPDATE entries SET last_access = MAX(last_access, ?),"
+                        " access_count = access_count + ? WHERE rel_path = ?",
+                        [
+                            (last_access, count, rel_path)
+                            for rel_path, (last_access, count) in pending.items()
+                        ],
+                    ).close()
+                    _ = self._exec(conn, "COMMIT")
+                except BaseException:
+                    _ = self._exec(conn, "ROLLBACK")
+                    raise
+            except sqlite3.DatabaseError as e:
+                # access stats only guide eviction, so they aren't worth a retry
+                logger.debug(f"Could not record accesses in {self.db_path}: {e!r}")
+
+    def totals(self) -> Tuple[int, int]:
+        """Returns the number of entries and the number of bytes they take up
+
+        Entries that share a file (see `IndexRow.inode`) are only counted once
+        """
+        count, size = self._query("SELECT entries, bytes FROM totals")[0]
+        return (count, size)
+
+    def remove(self, rel_path: str) -> None:
+        with self._lock:
+            _ = self._query("DELETE FROM entries WHERE rel_path = ?", (rel_path,))
+            self._bump_generation()
+
+    def record_failure(
+        self, url_digest: UrlDigest, *, failed_at: float, reason: str, max_count: int
+    ) -> None:
+        """Remembers that fetching `url_digest` failed, forgetting the oldest failures
+        beyond `max_count`
+
+        Failures can't be recovered from the directory, so they are lost whenever the
+        index is rebuilt
+        """
+        with self._lock:
+            self._forget_replaced_db()
+            _ = self._query(
+                "INSERT OR REPLACE INTO failures (url_digest, failed_at, reason)"
+                " VALUES (?, ?, ?)",
+                (url_digest.digest, failed_at, reason),
+            )
+            _ = self._query(
+                "DELETE FROM failures WHERE url_digest NOT IN"
+                " (SELECT url_digest FROM failures ORDER BY failed_at DESC LIMIT ?)",
+                (max_count,),
+            )
+
+    def failure(self, url_digest: UrlDigest) -> Optional[Tuple[float, str]]:
+        """When the last remembered failure of `url_digest` happened, and why"""
+        rows = self._query(
+            "SELECT failed_at, reason FROM failures WHERE url_digest = ?",
+            (url_digest.digest,),
+        )
+        return (rows[0][0], rows[0][1]) if rows else None
+
+    def forget_failure(self, url_digest: UrlDigest) -> None:
+        _ = self._query(
+            "DELETE FROM failures WHERE url_digest = ?", (url_digest.digest,)
+        )
@@ -0,0 +1,37 @@
+from typing import Protocol, Sequence
+
+
+class EvictionPolicy(Protocol):
+    @property
+    def order_by(self) -> Sequence[str]:
+        """Index columns that entries are evicted in ascending order of
+
+        Any of the index's `_ORDERABLE_COLUMNS`: `size`, `timestamp` and `last_access`
+        (seconds since the epoch) and `access_count`. The index sorts entries itself,
+        so policies name columns rather than compute sort keys
+        """
+        ...
+
+
+class LruEviction(EvictionPolicy):
+    """Evicts the least recently used entries first"""
+
+    @property
+    def order_by(self) -> Sequence[str]:
+        return ("last_access",)
+
+
+class LfuEviction(EvictionPolicy):
+    """Evicts the least frequently used entries first"""
+
+    @property
+    def order_by(self) -> Sequence[str]:
+        return ("access_count", "last_access")
+
+
+class OldestFirstEviction(EvictionPolicy):
+    """Evicts the entries that were fetched the longest time ago first"""
+
+    @property
+    def order_by(self) -> Sequence[str]:
+        return ("timestamp",)
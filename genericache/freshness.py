@@ -0,0 +1,44 @@
+import enum
+from typing import Final, Protocol
+
+
+class Freshness(enum.Enum):
+    FRESH = "fresh"
+    """Served as is"""
+    STALE = "stale"
+    """Served as is, while it is refetched in the background"""
+    EXPIRED = "expired"
+    """Refetched before anything is served"""
+
+
+class FreshnessPolicy(Protocol):
+    def judge(self, *, age: float) -> Freshness:
+        """How fresh a cached entry that was fetched `age` seconds ago is"""
+        ...
+
+
+class NeverExpire(FreshnessPolicy):
+    """Cached entries are served until they are evicted or refetched explicitly"""
+
+    def judge(self, *, age: float) -> Freshness:
+        return Freshness.FRESH
+
+
+class Ttl(FreshnessPolicy):
+    """Entries expire `seconds` after they were fetched
+
+    With `stale_while_revalidate`, expired entries are still served right away for
+    that many more seconds, while a single background fetch refreshes them.
+    """
+
+    def __init__(self, seconds: float, *, stale_while_revalidate: float = 0) -> None:
+        super().__init__()
+        self.seconds: Final[float] = seconds
+        self.stale_while_revalidate: Final[float] = stale_while_revalidate
+
+    def judge(self, *, age: float) -> Freshness:
+        if age < self.seconds:
+            return Freshness.FRESH
+        if age < self.seconds + self.stale_while_revalidate:
+            return Freshness.STALE
+        return Freshness.EXPIRED
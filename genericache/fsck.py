@@ -0,0 +1,78 @@
+"""Checks the integrity of a `DiskCache` directory, and optionally repairs it
+
+    python -m genericache.fsck <cache dir> [--repair [--delete]] [--workers N]
+
+Without `--repair`, nothing in the directory is changed or created. Exits with 1 if
+corrupt entries were found and left in place, and 0 otherwise.
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from genericache.digest import UrlDigest
+from genericache.disk_cache import DiskCache
+
+
+def _no_url_hasher(url: object) -> UrlDigest:
+    raise RuntimeError("Checking a cache never hashes URLs")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m genericache.fsck",
+        description="Rehashes the entries of a DiskCache directory to find corrupt ones",
+    )
+    _ = parser.add_argument("cache_dir", type=Path)
+    _ = parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="quarantine corrupt entries, and delete stale lock and staging files",
+    )
+    _ = parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="with --repair, delete corrupt entries instead of quarantining them",
+    )
+    _ = parser.add_argument(
+        "--workers", type=int, default=None, help="hashing processes (default: CPUs)"
+    )
+    _ = parser.add_argument(
+        "--stale-lock-age",
+        type=float,
+        default=3600,
+        help="seconds after which unheld lock files are deleted (default: 3600)",
+    )
+    args = parser.parse_args(argv)
+    cache_dir: Path = args.cache_dir
+    if not cache_dir.is_dir():
+        parser.error(f"{cache_dir} is not a directory")
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    if args.repair:
+        # opened the way it was created, so that nothing gets migrated
+        cache = DiskCache[object].create(
+            url_type=object,
+            cache_dir=cache_dir,
+            url_hasher=_no_url_hasher,
+            sharded=(cache_dir / DiskCache.SHARDED_MARKER).exists(),
+            use_symlinks=(cache_dir / DiskCache.SYMLINKS_MARKER).exists(),
+        )
+        report = cache.repair(
+            quarantine=not args.delete,
+            stale_lock_age=args.stale_lock_age,
+            max_workers=args.workers,
+        )
+    else:
+        cache = DiskCache[object].open_read_only(
+            cache_dir=cache_dir, url_hasher=_no_url_hasher
+        )
+        report = cache.verify(max_workers=args.workers)
+    print(report)
+    return 1 if len(report.corrupt) > report.removed_entries else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
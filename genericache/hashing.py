@@ -0,0 +1,159 @@
+"""Hash algorithms for the digests of cached contents, and hashing in the background
+
+Caches hash contents while they are being fetched. `PipelinedHash` moves that work
+to a thread of its own once a fetch grows past a few chunks, so that fetching the
+next chunk overlaps with hashing the previous ones. hashlib (and `blake3`) release
+the GIL while hashing, so the two really do run in parallel.
+"""
+
+import hashlib
+import importlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import ModuleType
+from typing import Any, Deque, Final, Optional, Protocol
+
+from genericache import CacheException
+from genericache.digest import ContentDigest
+
+
+class HasherUnavailable(CacheException):
+    def __init__(self, *, algorithm: str) -> None:
+        self.algorithm: Final[str] = algorithm
+        super().__init__(
+            f"Hash algorithm '{algorithm}' is not available. Digests made with blake3"
+            " need the `blake3` package (`pip install genericache[blake3]`)"
+        )
+
+
+class HashObject(Protocol):
+    def update(self, data: "bytes | bytearray | memoryview", /) -> None: ...
+    def digest(self) -> bytes: ...
+
+
+class ContentHasher(Protocol):
+    @property
+    def name(self) -> str:
+        """Identifies the algorithm in content digests; see `hasher_by_name`"""
+        ...
+
+    def new(self) -> HashObject: ...
+
+
+class Sha256Hasher(ContentHasher):
+    @property
+    def name(self) -> str:
+        return ContentDigest.DEFAULT_ALGORITHM
+
+    def new(self) -> HashObject:
+        return hashlib.sha256()
+
+
+class Blake2bHasher(ContentHasher):
+    """BLAKE2b with 32 byte digests, which is faster than sha256 on 64 bit CPUs"""
+
+    @property
+    def name(self) -> str:
+        return "blake2b"
+
+    def new(self) -> HashObject:
+        return hashlib.blake2b(digest_size=32)
+
+
+class Blake3Hasher(ContentHasher):
+    """Raises `HasherUnavailable` if the `blake3` package is not installed"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        try:
+            module = importlib.import_module("blake3")
+        except ImportError:
+            raise HasherUnavailable(algorithm="blake3")
+        self._module: Final[ModuleType] = module
+
+    @property
+    def name(self) -> str:
+        return "blake3"
+
+    def new(self) -> HashObject:
+        return self._module.blake3()
+
+
+def fastest_hasher() -> ContentHasher:
+    """blake3 if it is installed, BLAKE2b otherwise"""
+    try:
+        return Blake3Hasher()
+    except HasherUnavailable:
+        return Blake2bHasher()
+
+
+def hasher_by_name(name: str) -> ContentHasher:
+    """The hasher that produces digests of the algorithm `name`"""
+    if name == "sha256":
+        return Sha256Hasher()
+    if name == "blake2b":
+        return Blake2bHasher()
+    if name == "blake3":
+        return Blake3Hasher()
+    raise HasherUnavailable(algorithm=name)
+
+
+def hasher_for(
+    expected: "bool | ContentDigest", hasher: ContentHasher
+) -> ContentHasher:
+    """The hasher to check fetched contents against `expected`, which may have been
+    made with a different algorithm than the cache's `hasher`
+    """
+    if isinstance(expected, ContentDigest) and expected.algorithm != hasher.name:
+        return hasher_by_name(expected.algorithm)
+    return hasher
+
+
+class PipelinedHash:
+    """Hashes the data passed to `update` on a background thread
+
+    The first `inline_bytes` are hashed right away, so that small contents don't pay
+    for starting a thread. Past that, at most `max_pending` chunks wait to be hashed
+    before `update` blocks, which bounds the memory held up by a slow hash.
+    """
+
+    def __init__(
+        self,
+        hasher: ContentHasher,
+        *,
+        inline_bytes: int = 1024 * 1024,
+        max_pending: int = 16,
+    ) -> None:
+        super().__init__()
+        self.hasher: Final[ContentHasher] = hasher
+        self.inline_bytes: Final[int] = inline_bytes
+        self.max_pending: Final[int] = max_pending
+        self._hash: Final[HashObject] = hasher.new()
+        self._hashed_inline: int = 0
+        # a single worker keeps the updates in order. It exits once the executor is
+        # garbage collected, so abandoned hashes don't need to be closed
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Final[Deque["Future[Any]"]] = deque()
+
+    def update(self, data: "bytes | bytearray | memoryview") -> None:
+        if self._executor is None:
+            if self._hashed_inline + len(data) <= self.inline_bytes:
+                self._hash.update(data)
+                self._hashed_inline += len(data)
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="genericache-hash"
+            )
+        if not isinstance(data, bytes):  # e.g. a buffer the fetcher will reuse
+            data = bytes(data)
+        self._pending.append(self._executor.submit(self._hash.update, data))
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft().result()
+
+    def content_digest(self) -> ContentDigest:
+        """Waits for the pending chunks to be hashed"""
+        while self._pending:
+            self._pending.popleft().result()
+        if self._executor is not None:
+            self._executor.shutdown()
+        return ContentDigest(self._hash.digest(), algorithm=self.hasher.name)
@@ -1,13 +1,26 @@
+import bisect
 import logging
+from collections import OrderedDict
 from concurrent.futures import Future
 from datetime import datetime
-from hashlib import sha256
-from io import BytesIO
+import time
 from threading import Lock
-from typing import Callable, Dict, Final, Iterable, Optional, TypeVar
+from typing import Callable, Dict, Final, Iterable, List, Optional, Tuple, TypeVar
 
-from genericache import Cache, CacheEntry, DigestMismatch, FetchInterrupted
-from genericache.digest import ContentDigest, UrlDigest
+from genericache import (
+    Cache,
+    CacheEntry,
+    DigestMismatch,
+    FetchInterrupted,
+    ImmutableBytesIO,
+    StreamingEntry,
+    _Stream,  # pyright: ignore[reportPrivateUsage]
+)
+from genericache.digest import ContentDigest, MemoizedUrlHasher, UrlDigest
+from genericache.freshness import FreshnessPolicy, NeverExpire
+from genericache.hashing import ContentHasher, PipelinedHash, Sha256Hasher, hasher_for
+from genericache.metrics import CacheMetrics
+from genericache.negative_caching import NegativeCaching, RecentlyFailed
 
 logger = logging.getLogger(__name__)
 
@@ -20,65 +33,272 @@ class _EntryData:
         self,
         url_digest: UrlDigest,
         content_digest: ContentDigest,
-        contents: bytearray,
+        contents: bytes,
         timestamp: datetime,
     ) -> None:
         super().__init__()
-        self.contents: Final[bytearray] = contents
+        self.contents: Final[bytes] = contents
         self.content_digest: Final[ContentDigest] = content_digest
         self.url_digest: Final[UrlDigest] = url_digest
         self.timestamp: Final[datetime] = timestamp
 
-    def open(self) -> CacheEntry:
+    def open(self, metrics: CacheMetrics) -> CacheEntry:
+        metrics.record_served(len(self.contents))
         return CacheEntry(
             content_digest=self.content_digest,
-            reader=BytesIO(self.contents),
+            reader=ImmutableBytesIO(self.contents),
             timestamp=self.timestamp,
             url_digest=self.url_digest,
         )
 
 
+class _MemoryStream(_Stream):
+    """Keeps the chunks fetched so far, and then the contents of the finished entry"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._chunk_offsets: List[int] = []
+        self._contents: bytes = b""
+
+    def append(self, chunk: bytes) -> None:
+        with self.cond:
+            self._chunks.append(chunk)
+            self._chunk_offsets.append(self.available)
+        self.grow(len(chunk))
+
+    def finish_with(self, entry_data: _EntryData) -> None:
+        with self.cond:
+            self._contents = entry_data.contents
+            self._chunks = []
+            self._chunk_offsets = []
+        self.finish(entry_data.content_digest)
+
+    def read_partial(self, position: int, size: int) -> bytes:
+        chunk_idx = bisect.bisect_right(self._chunk_offsets, position) - 1
+        start = position - self._chunk_offsets[chunk_idx]
+        return self._chunks[chunk_idx][start : start + size]
+
+    def open_finished(self) -> ImmutableBytesIO:
+        return ImmutableBytesIO(self._contents)
+
+
 class MemoryCache(Cache[U]):
+    """A cache that keeps the fetched contents in memory
+
+    If `max_bytes` and/or `max_entries` are set, the least recently used entries are
+    dropped once the cache grows past them. Readers that were already handed out, as
+    well as threads waiting on an in-flight fetch, keep working after their entry
+    is dropped, since they hold references to the contents themselves.
+
+    `fetch_streaming` hands out readers that follow the fetched chunks as they
+    arrive; concurrent streaming fetches of the same URL share a single fetch.
+
+    `fetch` judges cached entries by `freshness` unless told otherwise.
+
+    With `negative_caching`, fetches that fail are remembered for a while, and
+    fetching the same URLs returns `RecentlyFailed` right away in the meantime.
+
+    Contents are hashed with `content_hasher`, on a background thread once they
+    grow large enough for that to pay off.
+    """
+
     url_hasher: Final[Callable[[U], UrlDigest]]
 
     def __init__(
         self,
         *,
         url_hasher: Callable[[U], UrlDigest],
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        metrics: Optional[CacheMetrics] = None,
+        freshness: FreshnessPolicy = NeverExpire(),
+        negative_caching: Optional[NegativeCaching] = None,
+        content_hasher: ContentHasher = Sha256Hasher(),
     ):
         super().__init__()
         self.url_hasher = url_hasher
+        self.content_hasher: Final[ContentHasher] = content_hasher
+        self.freshness: FreshnessPolicy = freshness
+        self.negative_caching: Final[Optional[NegativeCaching]] = negative_caching
+        self._hash_url: Final[MemoizedUrlHasher[U]] = MemoizedUrlHasher(url_hasher)
+        self.max_bytes: Final[Optional[int]] = max_bytes
+        self.max_entries: Final[Optional[int]] = max_entries
         self._instance_lock: Final[Lock] = Lock()
         self._downloads_by_url: Dict[
             UrlDigest, Future["_EntryData | FetchInterrupted[U]"]
         ] = {}
         self._downloads_by_content: Dict[ContentDigest, "_EntryData"] = {}
-        self._hits: int = 0
-        self._misses: int = 0
+        self._streams: Dict[UrlDigest, _MemoryStream] = {}
+        # finished entries, least recently used first
+        self._lru: "OrderedDict[_EntryData, None]" = OrderedDict()
+        self._total_bytes: int = 0
+        # when and why the last fetch of recently failed URLs failed, oldest first
+        self._failures: "OrderedDict[UrlDigest, Tuple[float, str]]" = OrderedDict()
+        self.metrics: Final[CacheMetrics] = metrics or CacheMetrics()
 
     def hits(self) -> int:
-        return self._hits
+        return self.metrics.hits.value
 
     def misses(self) -> int:
-        return self._misses
+        return self.metrics.misses.value
+
+    def _exceeds_bounds(self) -> bool:
+        if self.max_entries is not None and len(self._lru) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self._total_bytes > self.max_bytes
+
+    def _touch(self, entry_data: _EntryData) -> None:
+        with self._instance_lock:
+            if entry_data in self._lru:
+                self._lru.move_to_end(entry_data)
+
+    def _remember(self, entry_data: _EntryData) -> None:
+        """Records a finished entry and evicts others if the cache grew too large
+
+        Must be called while holding `_instance_lock`
+        """
+        self._downloads_by_content[entry_data.content_digest] = entry_data
+        self._lru[entry_data] = None
+        self._total_bytes += len(entry_data.contents)
+        while self._exceeds_bounds():
+            evicted, _ = self._lru.popitem(last=False)
+            self.metrics.record_evictions(1)
+            self._total_bytes -= len(evicted.contents)
+            if self._downloads_by_content.get(evicted.content_digest) is evicted:
+                del self._downloads_by_content[evicted.content_digest]
+            dl_fut = self._downloads_by_url.get(evicted.url_digest)
+            # a newer fetch of the same URL may be in flight; leave that one alone
+            if dl_fut and dl_fut.done() and dl_fut.result() is evicted:
+                del self._downloads_by_url[evicted.url_digest]
+
+    def _recent_failure(
+        self, url: U, url_digest: UrlDigest
+    ) -> "Optional[RecentlyFailed[U]]":
+        """The failure of the last fetch of `url`, if it is still to be remembered
+
+        Must be called while holding `_instance_lock`
+        """
+        failure = self._failures.get(url_digest)
+        if failure is None or self.negative_caching is None:
+            return None
+        failed_at, reason = failure
+        retry_after = failed_at + self.negative_caching.ttl
+        if time.time() >= retry_after:
+            del self._failures[url_digest]
+            return None
+        return RecentlyFailed(
+            url=url, failed_at=failed_at, retry_after=retry_after, reason=reason
+        )
+
+    def _remember_failure(self, url_digest: UrlDigest, error: Exception) -> None:
+        """Must be called while holding `_instance_lock`"""
+        if self.negative_caching is None or not self.negative_caching.should_cache(
+            error
+        ):
+            return
+        self._failures[url_digest] = (time.time(), repr(error))
+        self._failures.move_to_end(url_digest)
+        while len(self._failures) > self.negative_caching.max_entries:
+            _ = self._failures.popitem(last=False)
 
     def get_by_url(self, *, url: U) -> Optional[CacheEntry]:
-        url_digest = self.url_hasher(url)
+        started = time.perf_counter()
+        try:
+            url_digest = self._hash_url(url)
+            with self._instance_lock:
+                dl = self._downloads_by_url.get(url_digest)
+            if not dl:
+                return None
+            result = dl.result()
+            if isinstance(result, Exception):
+                return None
+            self._touch(result)
+            return result.open(self.metrics)
+        finally:
+            self.metrics.record_lookup(time.perf_counter() - started)
+
+    def fetched_at(self, *, url: U) -> Optional[datetime]:
+        with self._instance_lock:
+            dl = self._downloads_by_url.get(self._hash_url(url))
+        if dl is None or not dl.done():
+            return None
+        result = dl.result()
+        return None if isinstance(result, Exception) else result.timestamp
+
+    def open_if_cached(self, *, url: U) -> Optional[CacheEntry]:
+        url_digest = self._hash_url(url)
         with self._instance_lock:
             dl = self._downloads_by_url.get(url_digest)
-        if not dl:
+        if dl is None or not dl.done():
             return None
         result = dl.result()
         if isinstance(result, Exception):
             return None
-        return result.open()
+        self.metrics.record_hit()
+        self._touch(result)
+        return result.open(self.metrics)
 
     def get(self, *, digest: ContentDigest) -> Optional[CacheEntry]:
+        started = time.perf_counter()
+        try:
+            with self._instance_lock:
+                result = self._downloads_by_content.get(digest)
+            if result is None:
+                return None
+            self._touch(result)
+            return result.open(self.metrics)
+        finally:
+            self.metrics.record_lookup(time.perf_counter() - started)
+
+    def fetch_streaming(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        force_refetch: "bool | ContentDigest" = False,
+        freshness: Optional[FreshnessPolicy] = None,
+    ) -> "CacheEntry | StreamingEntry[U]":
+        url_digest = self._hash_url(url)
+        if (
+            force_refetch is False
+            and url_digest not in self._streams  # which would be joined anyway
+            and self._must_refetch(url, fetcher, freshness or self.freshness)
+        ):
+            force_refetch = True
+        if force_refetch is False:
+            cached = self.open_if_cached(url=url)
+            if cached is not None:
+                return cached
+        expected = force_refetch if isinstance(force_refetch, ContentDigest) else None
         with self._instance_lock:
-            result = self._downloads_by_content.get(digest)
-        if result is None:
-            return None
-        return result.open()
+            stream = self._streams.get(url_digest)
+            if stream is not None and force_refetch is not True:
+                self.metrics.record_hit()
+                self.metrics.record_join()
+                return StreamingEntry(
+                    url=url,
+                    url_digest=url_digest,
+                    stream=stream,
+                    expected_content_digest=expected,
+                )
+            stream = self._streams[url_digest] = _MemoryStream()
+
+        def forget_stream() -> None:
+            with self._instance_lock:
+                if self._streams.get(url_digest) is stream:
+                    del self._streams[url_digest]
+
+        stream.fetch_in_background(
+            url,
+            lambda: self._try_fetch(url, fetcher, force_refetch, stream=stream),
+            on_done=forget_stream,
+        )
+        return StreamingEntry(
+            url=url,
+            url_digest=url_digest,
+            stream=stream,
+            expected_content_digest=expected,
+        )
 
     def try_fetch(
         self,
@@ -86,16 +306,42 @@ class MemoryCache(Cache[U]):
         fetcher: Callable[[U], Iterable[bytes]],
         force_refetch: "bool | ContentDigest",
     ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
-        url_digest = self.url_hasher(url)
+        return self._try_fetch(url, fetcher, force_refetch, stream=None)
+
+    def _try_fetch(
+        self,
+        url: U,
+        fetcher: Callable[[U], Iterable[bytes]],
+        force_refetch: "bool | ContentDigest",
+        *,
+        stream: Optional[_MemoryStream],
+        fetched_at: "Optional[Callable[[], datetime]]" = None,
+    ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+        """`fetched_at` tells when contents copied from another cache were fetched"""
+        url_digest = self._hash_url(url)
 
         _ = self._instance_lock.acquire()  # <<<<<<<<<
         dl_fut = self._downloads_by_url.get(url_digest)
+        if dl_fut and dl_fut.done() and force_refetch is not False:
+            done_result = dl_fut.result()
+            if force_refetch is True or (
+                isinstance(done_result, _EntryData)
+                and done_result.content_digest != force_refetch
+            ):
+                dl_fut = None  # a finished download doesn't satisfy a forced refetch
         if dl_fut:  # some other thread IN THIS PROCESS is downloading it
             self._instance_lock.release()  # >>>>>>>
+            joined = not dl_fut.done()
+            waiting_since = time.perf_counter()
             result = dl_fut.result()
+            if joined:
+                self.metrics.record_join()
+                self.metrics.record_future_wait(time.perf_counter() - waiting_since)
             if isinstance(result, Exception):
                 return result
-            self._hits += 1
+            self.metrics.record_hit()
+            if stream is not None:
+                stream.finish_with(result)
             if (
                 isinstance(force_refetch, ContentDigest)
                 and result.content_digest != force_refetch
@@ -105,34 +351,56 @@ class MemoryCache(Cache[U]):
                     expected_content_digest=force_refetch,
                     actual_content_digest=result.content_digest,
                 )
-            return result.open()
+            self._touch(result)
+            return result.open(self.metrics)
 
-        self._misses += 1
+        failed = self._recent_failure(url, url_digest)
+        if failed is not None:
+            self._instance_lock.release()  # >>>>>>>
+            return failed
+        self.metrics.record_miss()
         dl_fut = self._downloads_by_url[url_digest] = Future()
         _ = (
             dl_fut.set_running_or_notify_cancel()
         )  # we still hold the lock, so fut._condition is insta-acquired
         self._instance_lock.release()  # >>>>>>>>>
 
+        started = time.perf_counter()
         try:
             contents = bytearray()
-            contents_sha = sha256()
+            contents_hash = PipelinedHash(
+                hasher_for(force_refetch, self.content_hasher)
+            )
             for chunk in fetcher(url):
-                contents_sha.update(chunk)
+                contents_hash.update(chunk)
                 contents.extend(chunk)
-            content_digest = ContentDigest(digest=contents_sha.digest())
+                if stream is not None:
+                    stream.append(bytes(chunk))
+            content_digest = contents_hash.content_digest()
             entry_data = _EntryData(
-                url_digest, content_digest, contents, datetime.now()
+                url_digest,
+                content_digest,
+                bytes(contents),
+                datetime.now() if fetched_at is None else fetched_at(),
+            )
+            self.metrics.record_fetch(
+                seconds=time.perf_counter() - started, size=len(contents)
             )
-            with self._instance_lock:
-                self._downloads_by_content[content_digest] = entry_data
             dl_fut.set_result(entry_data)
+            if stream is not None:
+                stream.finish_with(entry_data)
+            # after set_result, so evicting this very entry also forgets its Future
+            with self._instance_lock:
+                self._remember(entry_data)
+                _ = self._failures.pop(url_digest, None)
         except Exception as e:
             with self._instance_lock:
                 # remove Future before set_result so failures can be retried
                 del self._downloads_by_url[url_digest]
+                self._remember_failure(url_digest, e)
 
             error = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            error.__cause__ = e
             dl_fut.set_result(error)
             return error
         if (
@@ -144,4 +412,4 @@ class MemoryCache(Cache[U]):
                 expected_content_digest=force_refetch,
                 actual_content_digest=entry_data.content_digest,
             )
-        return entry_data.open()
+        return entry_data.open(self.metrics)
@@ -0,0 +1,198 @@
+import bisect
+import math
+import threading
+from typing import Final, List, Mapping, Sequence, Tuple
+
+# seconds; from a fast in-memory lookup up to a slow download
+DEFAULT_LATENCY_BUCKETS: Final[Tuple[float, ...]] = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    60.0,
+)
+
+OPENMETRICS_CONTENT_TYPE: Final[str] = (
+    "application/openmetrics-text; version=1.0.0; charset=utf-8"
+)
+
+
+class Counter:
+    """A thread-safe, monotonically increasing count"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock: Final[threading.Lock] = threading.Lock()
+        self._value: int = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Histogram:
+    """A thread-safe distribution of observed values over fixed buckets"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        super().__init__()
+        self.buckets: Final[Tuple[float, ...]] = tuple(sorted(buckets))
+        self._lock: Final[threading.Lock] = threading.Lock()
+        self._counts: List[int] = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self._sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[Tuple[float, int]], float, int]:
+        """Returns the cumulative count for each upper bound, the sum and the count"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative: List[Tuple[float, int]] = []
+        running = 0
+        for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+            running += count
+            cumulative.append((upper_bound, running))
+        return cumulative, total, running
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+
+class CacheMetrics:
+    """The instruments describing a single cache
+
+    `MemoryCache`, `DiskCache` and `NoopCache` expose theirs as their `metrics`
+    attribute, which is a new instance unless one is passed to their constructor.
+    Caches report to their metrics through the `record_*` methods, which can be
+    overridden to forward measurements to other monitoring systems as well.
+    A single instance can be shared by several caches to aggregate them.
+    """
+
+    def __init__(self, *, latency_buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__()
+        self.hits: Final[Counter] = Counter()
+        self.misses: Final[Counter] = Counter()
+        self.joined_fetches: Final[Counter] = Counter()
+        self.evictions: Final[Counter] = Counter()
+        self.bytes_fetched: Final[Counter] = Counter()
+        self.bytes_served: Final[Counter] = Counter()
+        self.lookup_seconds: Final[Histogram] = Histogram(latency_buckets)
+        self.fetch_seconds: Final[Histogram] = Histogram(latency_buckets)
+        self.file_lock_wait_seconds: Final[Histogram] = Histogram(latency_buckets)
+        self.future_wait_seconds: Final[Histogram] = Histogram(latency_buckets)
+
+    def record_hit(self) -> None:
+        self.hits.inc()
+
+    def record_miss(self) -> None:
+        self.misses.inc()
+
+    def record_join(self) -> None:
+        """A fetch that was deduplicated into one already in progress"""
+        self.joined_fetches.inc()
+
+    def record_evictions(self, count: int) -> None:
+        self.evictions.inc(count)
+
+    def record_lookup(self, seconds: float) -> None:
+        """The time taken by `get` or `get_by_url`"""
+        self.lookup_seconds.observe(seconds)
+
+    def record_fetch(self, *, seconds: float, size: int) -> None:
+        """A run of the fetcher, from calling it until its contents were stored"""
+        self.fetch_seconds.observe(seconds)
+        self.bytes_fetched.inc(size)
+
+    def record_served(self, size: int) -> None:
+        """An entry of `size` bytes handed out to a caller"""
+        self.bytes_served.inc(size)
+
+    def record_file_lock_wait(self, seconds: float) -> None:
+        self.file_lock_wait_seconds.observe(seconds)
+
+    def record_future_wait(self, seconds: float) -> None:
+        self.future_wait_seconds.observe(seconds)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_COUNTERS: Final[Sequence[Tuple[str, str, str]]] = (
+    ("hits", "hits", "Requests served from the cache"),
+    ("misses", "misses", "Requests that had to run the fetcher"),
+    ("joined_fetches", "joined_fetches", "Requests that joined a fetch in progress"),
+    ("evictions", "evictions", "Entries evicted from the cache"),
+    ("bytes_fetched", "fetched_bytes", "Bytes produced by fetchers"),
+    ("bytes_served", "served_bytes", "Bytes of the entries handed out"),
+)
+
+_HISTOGRAMS: Final[Sequence[Tuple[str, str, str]]] = (
+    ("lookup_seconds", "lookup_seconds", "Latency of get and get_by_url"),
+    ("fetch_seconds", "fetch_seconds", "Duration of fetches"),
+    (
+        "file_lock_wait_seconds",
+        "file_lock_wait_seconds",
+        "Time spent waiting on other processes",
+    ),
+    (
+        "future_wait_seconds",
+        "future_wait_seconds",
+        "Time spent waiting on other threads",
+    ),
+)
+
+
+def render_openmetrics(
+    metrics_by_cache: Mapping[str, CacheMetrics], *, prefix: str = "genericache"
+) -> str:
+    """Renders metrics in the OpenMetrics text format, which Prometheus can scrape
+
+    Each cache is told apart by a `cache` label with its key in `metrics_by_cache`.
+    Serve the result with `OPENMETRICS_CONTENT_TYPE`.
+    """
+    lines: List[str] = []
+    for attr, name, help in _COUNTERS:
+        lines.append(f"# TYPE {prefix}_{name} counter")
+        lines.append(f"# HELP {prefix}_{name} {help}.")
+        for cache_name, metrics in metrics_by_cache.items():
+            counter: Counter = getattr(metrics, attr)
+            label = f'cache="{_escape_label(cache_name)}"'
+            lines.append(f"{prefix}_{name}_total{{{label}}} {counter.value}")
+    for attr, name, help in _HISTOGRAMS:
+        lines.append(f"# TYPE {prefix}_{name} histogram")
+        lines.append(f"# HELP {prefix}_{name} {help}.")
+        for cache_name, metrics in metrics_by_cache.items():
+            histogram: Histogram = getattr(metrics, attr)
+            buckets, total, count = histogram.snapshot()
+            label = f'cache="{_escape_label(cache_name)}"'
+            for upper_bound, cumulative in buckets:
+                lines.append(
+                    f'{prefix}_{name}_bucket{{{label},le="{_format_value(upper_bound)}"}} {cumulative}'
+                )
+            lines.append(f"{prefix}_{name}_sum{{{label}}} {_format_value(total)}")
+            lines.append(f"{prefix}_{name}_count{{{label}}} {count}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
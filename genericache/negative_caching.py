@@ -0,0 +1,51 @@
+import time
+from typing import Callable, Final, Generic, TypeVar
+
+from genericache import FetchInterrupted
+
+U = TypeVar("U")
+
+
+class RecentlyFailed(FetchInterrupted[U], Generic[U]):
+    """Returned instead of fetching a URL whose last fetch failed less than
+    `NegativeCaching.ttl` seconds ago
+
+    Times are seconds since the epoch, as returned by `time.time()`
+    """
+
+    def __init__(self, *, url: U, failed_at: float, retry_after: float, reason: str):
+        super().__init__(url=url)
+        self.failed_at: Final[float] = failed_at
+        self.retry_after: Final[float] = retry_after
+        self.reason: Final[str] = reason
+        self.args = (
+            f"Fetching '{url}' failed {time.time() - failed_at:.1f}s ago ({reason}),"
+            f" not fetching it again for {retry_after - time.time():.1f}s",
+        )
+
+
+def _always(error: Exception) -> bool:
+    return True
+
+
+class NegativeCaching:
+    """Remembers the URLs whose fetch failed, so they aren't fetched again for `ttl`
+    seconds. At most `max_entries` failures are remembered, the oldest being
+    forgotten first.
+
+    Only errors for which `should_cache` returns True are remembered, e.g. to only
+    remember "404 Not Found"s. Retrying an error that was remembered is pointless, so
+    `fetch` stops retrying as soon as an attempt fails that way.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float,
+        max_entries: int = 1024,
+        should_cache: "Callable[[Exception], bool]" = _always,
+    ) -> None:
+        super().__init__()
+        self.ttl: Final[float] = ttl
+        self.max_entries: Final[int] = max_entries
+        self.should_cache: Final[Callable[[Exception], bool]] = should_cache
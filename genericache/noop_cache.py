@@ -1,11 +1,13 @@
 from datetime import datetime
-from hashlib import sha256
-from typing import Callable, Iterable, Optional, TypeVar
-from io import BytesIO
+from typing import Callable, Final, Iterable, Optional, TypeVar
 import logging
+import time
 
-from genericache import Cache, CacheEntry, FetchInterrupted
+from genericache import Cache, CacheEntry, FetchInterrupted, ImmutableBytesIO
 from genericache.digest import ContentDigest, UrlDigest
+from genericache.freshness import FreshnessPolicy, NeverExpire
+from genericache.hashing import ContentHasher, PipelinedHash, Sha256Hasher, hasher_for
+from genericache.metrics import CacheMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -13,16 +15,24 @@ U = TypeVar("U")
 
 
 class NoopCache(Cache[U]):
-    def __init__(self, *, url_hasher: "Callable[[U], UrlDigest]"):
+    def __init__(
+        self,
+        *,
+        url_hasher: "Callable[[U], UrlDigest]",
+        metrics: Optional[CacheMetrics] = None,
+        content_hasher: ContentHasher = Sha256Hasher(),
+    ):
         super().__init__()
-        self._misses: int = 0
         self.url_hasher = url_hasher
+        self.content_hasher: Final[ContentHasher] = content_hasher
+        self.freshness: FreshnessPolicy = NeverExpire()  # never serves old entries
+        self.metrics: Final[CacheMetrics] = metrics or CacheMetrics()
 
     def hits(self) -> int:
         return 0
 
     def misses(self) -> int:
-        return self._misses
+        return self.metrics.misses.value
 
     def get_by_url(self, *, url: U) -> Optional[CacheEntry]:
         return None
@@ -36,19 +46,28 @@ class NoopCache(Cache[U]):
         fetcher: Callable[[U], Iterable[bytes]],
         force_refetch: "bool | ContentDigest",
     ) -> "CacheEntry | FetchInterrupted[U]":
-        self._misses += 1
+        self.metrics.record_miss()
+        started = time.perf_counter()
         try:
             chunks = fetcher(url)
             contents = bytearray()
-            contents_sha = sha256()
+            contents_hash = PipelinedHash(
+                hasher_for(force_refetch, self.content_hasher)
+            )
             for chunk in chunks:
                 contents.extend(chunk)
-                contents_sha.update(chunk)
+                contents_hash.update(chunk)
+            self.metrics.record_fetch(
+                seconds=time.perf_counter() - started, size=len(contents)
+            )
+            self.metrics.record_served(len(contents))
             return CacheEntry(
-                reader=BytesIO(contents),
+                reader=ImmutableBytesIO(bytes(contents)),
                 url_digest=self.url_hasher(url),
-                content_digest=ContentDigest(digest=contents_sha.digest()),
+                content_digest=contents_hash.content_digest(),
                 timestamp=datetime.now(),
             )
         except Exception as e:
-            return FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            error = FetchInterrupted(url=url).with_traceback(e.__traceback__)
+            error.__cause__ = e
+            return error
@@ -0,0 +1,361 @@
+"""Sharing the entries of `DiskCache`s between hosts
+
+Each host serves its `DiskCache` to the others with a `PeerServer`, and fetches
+through a `PeerCache`, which asks those servers for anything it doesn't have before
+falling back to the real fetcher. Peers only ever serve their own entries, so a
+request never bounces from one peer to another.
+
+Peers are addressed as `http://host:port` and answer:
+
+* `GET /content/<hex content digest>` with the entry having that content digest
+* `GET /url/<hex url digest>` with the newest entry of the URL with that digest
+
+with a `200` whose body is the (uncompressed) entry, or a `404` if there is none.
+`X-Content-Digest` holds the hex content digest of the body, and `X-Fetched-At` the
+time the entry was fetched, in seconds since the epoch.
+"""
+
+import http.client
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+from urllib.parse import urlsplit
+
+from genericache import (
+    Cache,
+    CacheEntry,
+    CacheException,
+    DigestMismatch,
+    FetchInterrupted,
+)
+from genericache.digest import ContentDigest, UrlDigest
+from genericache.disk_cache import DiskCache
+from genericache.freshness import Freshness, FreshnessPolicy, NeverExpire
+from genericache.hashing import PipelinedHash, hasher_by_name
+
+logger = logging.getLogger(__name__)
+
+U = TypeVar("U")
+
+_CHUNK_SIZE = 1024 * 1024
+_CONTENT_DIGEST_HEADER = "X-Content-Digest"
+_FETCHED_AT_HEADER = "X-Fetched-At"
+
+
+class PeerFailed(CacheException):
+    """A peer failed while sending the contents of an entry"""
+
+    def __init__(self, *, peer: str, message: str = "") -> None:
+        self.peer: Final[str] = peer
+        super().__init__(message or f"Peer {peer} failed to send an entry")
+
+
+class PeerDigestMismatch(PeerFailed):
+    """A peer sent contents that don't match the digest it announced for them"""
+
+    def __init__(
+        self, *, peer: str, expected: ContentDigest, actual: ContentDigest
+    ) -> None:
+        self.expected: Final[ContentDigest] = expected
+        self.actual: Final[ContentDigest] = actual
+        super().__init__(
+            peer=peer,
+            message=f"Peer {peer} sent contents with digest {actual} instead of {expected}",
+        )
+
+
+class PeerServer:
+    """Serves the entries of `cache` to `PeerCache`s on other hosts
+
+    Requests are handled by a background thread each, from `start()` until `close()`.
+    Pass `port=0` to listen on any free port; `address` is the one to give to peers.
+    """
+
+    def __init__(
+        self, cache: "DiskCache[Any]", *, host: str = "127.0.0.1", port: int = 0
+    ) -> None:
+        super().__init__()
+        self.cache: Final[DiskCache[Any]] = cache
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug(format, *args)
+
+            def do_GET(self) -> None:
+                entry = _find_entry(cache, self.path)
+                if entry is None:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+                    return
+                with entry:
+                    size = entry.seek(0, os.SEEK_END)
+                    _ = entry.seek(0)
+                    self.send_response(HTTPStatus.OK)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(size))
+                    self.send_header(_CONTENT_DIGEST_HEADER, str(entry.content_digest))
+                    self.send_header(
+                        _FETCHED_AT_HEADER, str(entry.timestamp.timestamp())
+                    )
+                    self.end_headers()
+                    for chunk in iter(lambda: entry.read(_CHUNK_SIZE), b""):
+                        _ = self.wfile.write(chunk)
+
+        self._server: Final[ThreadingHTTPServer] = ThreadingHTTPServer(
+            (host, port), Handler
+        )
+        self._server.daemon_threads = True
+        self._thread: Final[threading.Thread] = threading.Thread(
+            target=self._server.serve_forever, name=f"genericache-peer-{host}:{port}"
+        )
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "PeerServer":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "PeerServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def _find_entry(cache: "DiskCache[Any]", path: str) -> Optional[CacheEntry]:
+    """The entry requested by `path`, which is any of the paths `PeerServer` serves"""
+    kind, _, hexdigest = path.strip("/").partition("/")
+    try:
+        if kind == "content":
+            return cache.get(digest=ContentDigest.parse(hexdigest=hexdigest))
+        if kind == "url":
+            return cache.get_by_url_digest(
+                url_digest=UrlDigest.parse(hexdigest=hexdigest)
+            )
+    except ValueError:
+        pass
+    return None
+
+
+class _PeerResponse:
+    def __init__(
+        self,
+        *,
+        peer: str,
+        connection: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+        content_digest: ContentDigest,
+        fetched_at: datetime,
+    ) -> None:
+        super().__init__()
+        self.peer: Final[str] = peer
+        self.connection: Final[http.client.HTTPConnection] = connection
+        self.response: Final[http.client.HTTPResponse] = response
+        self.content_digest: Final[ContentDigest] = content_digest
+        self.fetched_at: Final[datetime] = fetched_at
+
+
+class PeerCache(Cache[U]):
+    """A `DiskCache` that fills its misses from the `DiskCache`s of its peers
+
+    On a miss, `peers` (the `address`es of their `PeerServer`s) are asked in order
+    for the entry of the URL, or for the expected contents if `force_refetch` is a
+    `ContentDigest`. Only when none of them has it is `fetcher` called. A forced
+    refetch (`force_refetch=True`) always calls `fetcher`, since peers may hold the
+    same outdated contents.
+
+    Contents are streamed from peers straight into `local` while their digest is
+    computed, and a peer whose contents don't match the digest it announced fails
+    the fetch with `PeerDigestMismatch`, so nothing is stored. Peers that fail or
+    can't be reached are not asked again for `peer_backoff` seconds, and the fetch
+    moves on to the next peer or to `fetcher`. If `local` uses negative caching,
+    `PeerFailed` errors are never remembered, since the URL itself may be fine.
+    Entries that `freshness` would not consider fresh are not taken from peers, and
+    those taken keep the time the peer fetched them at, so they don't get fresher by
+    being passed around.
+
+    `hits()` and `misses()` are those of `local`, so entries filled by peers count as
+    misses; `peer_hits()` counts those.
+    """
+
+    def __init__(
+        self,
+        *,
+        local: DiskCache[U],
+        peers: Sequence[str],
+        timeout: float = 5,
+        peer_backoff: float = 30,
+        freshness: FreshnessPolicy = NeverExpire(),
+    ) -> None:
+        super().__init__()
+        self.local: Final[DiskCache[U]] = local
+        self.peers: Final[Sequence[str]] = peers
+        self.timeout: Final[float] = timeout
+        self.peer_backoff: Final[float] = peer_backoff
+        self.url_hasher: Final[Callable[[U], UrlDigest]] = local.url_hasher
+        self.freshness: FreshnessPolicy = freshness
+        self._lock: Final[threading.Lock] = threading.Lock()
+        self._peer_hits: int = 0
+        self._unavailable_until: Final[Dict[str, float]] = {}
+
+    def hits(self) -> int:
+        return self.local.hits()
+
+    def misses(self) -> int:
+        return self.local.misses()
+
+    def peer_hits(self) -> int:
+        return self._peer_hits
+
+    def get_by_url(self, *, url: U) -> Optional[CacheEntry]:
+        return self.local.get_by_url(url=url)
+
+    def get(self, *, digest: ContentDigest) -> Optional[CacheEntry]:
+        return self.local.get(digest=digest)
+
+    def fetched_at(self, *, url: U) -> Optional[datetime]:
+        return self.local.fetched_at(url=url)
+
+    def open_if_cached(self, *, url: U) -> Optional[CacheEntry]:
+        return self.local.open_if_cached(url=url)
+
+    def _available_peers(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                peer
+                for peer in self.peers
+                if self._unavailable_until.get(peer, 0) <= now
+            ]
+
+    def _back_off(self, peer: str, error: Exception) -> None:
+        logger.warning(f"Not asking peer {peer} for {self.peer_backoff}s: {error!r}")
+        with self._lock:
+            self._unavailable_until[peer] = time.monotonic() + self.peer_backoff
+
+    def _request(self, peer: str, path: str) -> Optional[_PeerResponse]:
+        """Asks `peer` for `path`, returning None if it doesn't have a fresh entry"""
+        address = urlsplit(peer)
+        connection = http.client.HTTPConnection(
+            address.hostname or "127.0.0.1", address.port, timeout=self.timeout
+        )
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            if response.status != HTTPStatus.OK:
+                connection.close()
+                return None
+            content_digest = ContentDigest.parse(
+                hexdigest=response.headers[_CONTENT_DIGEST_HEADER] or ""
+            )
+            fetched_at = float(response.headers[_FETCHED_AT_HEADER] or "")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            connection.close()
+            self._back_off(peer, e)
+            return None
+        if self.freshness.judge(age=time.time() - fetched_at) is not Freshness.FRESH:
+            connection.close()
+            return None
+        return _PeerResponse(
+            peer=peer,
+            connection=connection,
+            response=response,
+            content_digest=content_digest,
+            fetched_at=datetime.fromtimestamp(fetched_at),
+        )
+
+    def _receive(self, peer_response: _PeerResponse) -> Iterator[bytes]:
+        """Yields the body of `peer_response`, raising if it doesn't match its digest"""
+        try:
+            contents_hash = PipelinedHash(
+                hasher_by_name(peer_response.content_digest.algorithm)
+            )
+            for chunk in iter(lambda: peer_response.response.read(_CHUNK_SIZE), b""):
+                contents_hash.update(chunk)
+                yield chunk
+            actual = contents_hash.content_digest()
+            if actual != peer_response.content_digest:
+                raise PeerDigestMismatch(
+                    peer=peer_response.peer,
+                    expected=peer_response.content_digest,
+                    actual=actual,
+                )
+        except Exception as e:
+            self._back_off(peer_response.peer, e)
+            if isinstance(e, PeerFailed):
+                raise
+            raise PeerFailed(peer=peer_response.peer) from e
+        finally:
+            peer_response.connection.close()
+        with self._lock:
+            self._peer_hits += 1
+
+    def try_fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        force_refetch: "bool | ContentDigest",
+    ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+        if force_refetch is True:
+            return self.local.try_fetch(url, fetcher, force_refetch=True)
+
+        # entries taken from a peer keep the time the peer fetched them at
+        peer_fetched_at: Optional[datetime] = None
+
+        def fetch_from_peers(url: U) -> Iterable[bytes]:
+            nonlocal peer_fetched_at
+            peer_fetched_at = None
+            if isinstance(force_refetch, ContentDigest):
+                path = f"/content/{force_refetch}"
+            else:
+                path = f"/url/{self.url_hasher(url)}"
+            for peer in self._available_peers():
+                peer_response = self._request(peer, path)
+                if peer_response is not None:
+                    logger.debug(f"Fetching {url} from peer {peer}")
+                    peer_fetched_at = peer_response.fetched_at
+                    return self._receive(peer_response)
+            return fetcher(url)
+
+        def fetched_at() -> datetime:
+            return datetime.now() if peer_fetched_at is None else peer_fetched_at
+
+        def fetch_locally() -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+            return self.local._try_fetch(  # pyright: ignore[reportPrivateUsage]
+                url,
+                fetch_from_peers,
+                force_refetch,
+                stream=None,
+                fetched_at=fetched_at,
+                uncached_errors=(PeerFailed,),
+            )
+
+        for _ in self.peers:
+            try:
+                return fetch_locally()
+            except PeerFailed:
+                continue  # that peer is backed off now, so the next attempt skips it
+        return fetch_locally()
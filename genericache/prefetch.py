@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Final,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from genericache import (
+    Cache,
+    CacheEntry,
+    ExponentialBackoff,
+    _fetch_with_retries,  # pyright: ignore[reportPrivateUsage]
+)
+from genericache.digest import UrlDigest
+
+if TYPE_CHECKING:
+    from genericache.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+U = TypeVar("U")
+
+
+class _PrefetchJob(Generic[U]):
+    def __init__(
+        self,
+        *,
+        url: U,
+        url_digest: UrlDigest,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        priority: int,
+    ) -> None:
+        super().__init__()
+        self.url: Final[U] = url
+        self.url_digest: Final[UrlDigest] = url_digest
+        self.fetcher: Final[Callable[[U], Iterable[bytes]]] = fetcher
+        self.priority: Final[int] = priority
+        self.future: "Final[Future[None]]" = Future()
+        self.cancelled: bool = False
+
+
+# the prefetcher of each cache, if it has one
+_prefetchers_lock: Final[threading.Lock] = threading.Lock()
+_prefetchers: "weakref.WeakKeyDictionary[Cache[object], Prefetcher[object]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class Prefetcher(Generic[U]):
+    """Fills a cache in the background with URLs that will be needed later
+
+    Prefetched URLs are queued and fetched by up to `max_workers` threads, highest
+    `priority` first, with `retry_policy`. Failures are only logged, since whatever
+    needs the URL later will fetch it again.
+
+    A foreground `fetch` of a URL that is still queued takes it off the queue, and one
+    of a URL that is being prefetched waits for that prefetch instead of starting a
+    second download. Use `Cache.prefetch` rather than creating prefetchers directly,
+    unless the defaults don't fit; a cache has at most one prefetcher at a time.
+    """
+
+    def __init__(
+        self,
+        cache: Cache[U],
+        *,
+        max_workers: int = 4,
+        retry_policy: "Optional[RetryPolicy]" = None,
+    ) -> None:
+        super().__init__()
+        # workers only keep the cache alive while they are prefetching for it
+        self._cache: Final[weakref.ref[Cache[U]]] = weakref.ref(cache)
+        self.max_workers: Final[int] = max_workers
+        self.retry_policy: "Final[RetryPolicy]" = retry_policy or ExponentialBackoff()
+        self._lock: Final[threading.Lock] = threading.Lock()
+        self._queue: List[Tuple[int, int, _PrefetchJob[U]]] = []
+        self._sequence: Final[Iterator[int]] = itertools.count()
+        self._queued: Dict[UrlDigest, _PrefetchJob[U]] = {}
+        self._in_flight: Dict[UrlDigest, _PrefetchJob[U]] = {}
+        self._workers: int = 0
+        self._completed: int = 0
+        self._failed: int = 0
+        self._cancelled: int = 0
+        with _prefetchers_lock:
+            _prefetchers[cache] = self  # pyright: ignore[reportArgumentType]
+
+    @classmethod
+    def of(cls, cache: Cache[U]) -> "Prefetcher[U]":
+        """The prefetcher of `cache`, created with the defaults if it has none yet"""
+        with _prefetchers_lock:
+            prefetcher = _prefetchers.get(cache)  # pyright: ignore[reportArgumentType]
+        if prefetcher is not None:
+            return prefetcher  # pyright: ignore[reportReturnType]
+        return Prefetcher(cache)
+
+    def queue_depth(self) -> int:
+        """How many URLs are waiting to be prefetched"""
+        return len(self._queued)
+
+    def in_flight(self) -> int:
+        """How many URLs are being prefetched right now"""
+        return len(self._in_flight)
+
+    def completed(self) -> int:
+        return self._completed
+
+    def failed(self) -> int:
+        return self._failed
+
+    def cancelled(self) -> int:
+        """How many queued URLs were fetched in the foreground before their turn"""
+        return self._cancelled
+
+    def prefetch(
+        self,
+        urls: Iterable[U],
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        *,
+        priority: int = 0,
+    ) -> None:
+        """Queues `urls` and returns right away
+
+        URLs that are already queued are moved up if `priority` is higher than
+        theirs; those that are being prefetched are left alone.
+        """
+        cache = self._cache()
+        if cache is None:
+            return
+        with self._lock:
+            for url in urls:
+                url_digest = cache.url_hasher(url)
+                if url_digest in self._in_flight:
+                    continue
+                queued = self._queued.get(url_digest)
+                if queued is not None:
+                    if queued.priority >= priority:
+                        continue
+                    queued.cancelled = True  # superseded; skipped when popped
+                job = _PrefetchJob(
+                    url=url, url_digest=url_digest, fetcher=fetcher, priority=priority
+                )
+                self._queued[url_digest] = job
+                heapq.heappush(self._queue, (-priority, next(self._sequence), job))
+            workers_to_start = min(self.max_workers - self._workers, len(self._queued))
+            self._workers += workers_to_start
+        for _ in range(workers_to_start):
+            threading.Thread(target=self._work, name="genericache-prefetch").start()
+
+    def _next_job(self) -> "Optional[_PrefetchJob[U]]":
+        """Moves the next job from the queue to the in-flight ones. Must hold `_lock`"""
+        while self._queue:
+            _, _, job = heapq.heappop(self._queue)
+            if job.cancelled:
+                continue
+            del self._queued[job.url_digest]
+            self._in_flight[job.url_digest] = job
+            return job
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                job = self._next_job()
+                if job is None:
+                    self._workers -= 1
+                    return
+            cache = self._cache()
+            try:
+                if cache is None:
+                    raise RuntimeError("The cache was garbage collected")
+                result = _fetch_with_retries(
+                    cache,
+                    job.url,
+                    job.fetcher,
+                    force_refetch=False,
+                    retry_policy=self.retry_policy,
+                    freshness=cache.freshness,
+                    raise_errors=False,
+                )
+            except Exception as e:
+                result = e
+            del cache
+            if isinstance(result, CacheEntry):
+                result.close()  # the entry is in the cache now, which is all we need
+            else:
+                logger.warning(f"Could not prefetch {job.url}: {result!r}")
+            with self._lock:
+                del self._in_flight[job.url_digest]
+                if isinstance(result, CacheEntry):
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            job.future.set_result(None)
+
+    @classmethod
+    def make_way_for(cls, cache: Cache[U], url: U) -> None:
+        """Called before a foreground fetch of `url` by `cache`: drops its prefetch if
+        it is still queued, or waits for it if it is in flight
+        """
+        if not _prefetchers:
+            return
+        with _prefetchers_lock:
+            prefetcher = _prefetchers.get(cache)  # pyright: ignore[reportArgumentType]
+        if prefetcher is None:
+            return
+        url_digest = cache.url_hasher(url)
+        with prefetcher._lock:
+            in_flight = prefetcher._in_flight.get(url_digest)
+            queued = prefetcher._queued.pop(url_digest, None)
+            if queued is not None:
+                queued.cancelled = True
+                prefetcher._cancelled += 1
+        if in_flight is not None:
+            in_flight.future.result()
@@ -0,0 +1,101 @@
+import random
+from typing import Callable, Final, Generic, Optional, Protocol, Sequence, TypeVar
+
+from genericache import FetchInterrupted
+from genericache.negative_caching import RecentlyFailed
+
+U = TypeVar("U")
+
+
+class FetchAttempt:
+    """A failed attempt at fetching a URL
+
+    Times are in seconds, relative to the start of the first attempt
+    """
+
+    def __init__(self, *, error: Exception, started: float, duration: float) -> None:
+        super().__init__()
+        self.error: Final[Exception] = error
+        self.started: Final[float] = started
+        self.duration: Final[float] = duration
+
+    def __repr__(self) -> str:
+        return f"<attempt at {self.started:.3f}s took {self.duration:.3f}s: {self.error!r}>"
+
+
+class RetriesExhausted(FetchInterrupted[U], RuntimeError, Generic[U]):
+    """Raised once a `RetryPolicy` gives up on a URL. Every failed attempt is in `attempts`"""
+
+    def __init__(self, *, url: U, attempts: Sequence[FetchAttempt]) -> None:
+        super().__init__(url=url)
+        self.attempts: Final[Sequence[FetchAttempt]] = attempts
+        self.args = (
+            f"Giving up on '{url}' after {len(attempts)} attempts: {list(attempts)}",
+        )
+
+
+class RetryPolicy(Protocol):
+    def should_retry(self, error: Exception) -> bool:
+        """Whether `error` is worth another attempt at all. If not, it is raised as is"""
+        ...
+
+    def next_delay(
+        self, *, attempts: Sequence[FetchAttempt], elapsed: float
+    ) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up
+
+        `elapsed` is the time since the first attempt started
+        """
+        ...
+
+
+def _is_interrupted(error: Exception) -> bool:
+    # a remembered failure would only be returned again
+    return isinstance(error, FetchInterrupted) and not isinstance(error, RecentlyFailed)
+
+
+class ExponentialBackoff(RetryPolicy):
+    """Waits for up to `base_delay * multiplier ** n` seconds before the n-th retry
+
+    With `jitter` (the default), each delay is drawn uniformly between zero and that
+    bound ("full jitter"), so that clients that failed together don't retry together.
+    No attempt is started after `deadline` seconds since the first one, if set.
+    By default only `FetchInterrupted` is retried, except for `RecentlyFailed`.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_attempts: int = 3,
+        base_delay: float = 0.1,
+        multiplier: float = 2.0,
+        max_delay: float = 30.0,
+        jitter: bool = True,
+        deadline: Optional[float] = None,
+        retry_on: "Callable[[Exception], bool]" = _is_interrupted,
+    ) -> None:
+        super().__init__()
+        self.max_attempts: Final[int] = max_attempts
+        self.base_delay: Final[float] = base_delay
+        self.multiplier: Final[float] = multiplier
+        self.max_delay: Final[float] = max_delay
+        self.jitter: Final[bool] = jitter
+        self.deadline: Final[Optional[float]] = deadline
+        self.retry_on: Final[Callable[[Exception], bool]] = retry_on
+
+    def should_retry(self, error: Exception) -> bool:
+        return self.retry_on(error)
+
+    def next_delay(
+        self, *, attempts: Sequence[FetchAttempt], elapsed: float
+    ) -> Optional[float]:
+        if len(attempts) >= self.max_attempts:
+            return None
+        delay = min(
+            self.max_delay, self.base_delay * self.multiplier ** (len(attempts) - 1)
+        )
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if self.deadline is not None and elapsed + delay >= self.deadline:
+            return None
+        return delay
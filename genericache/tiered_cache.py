@@ -0,0 +1,134 @@
+import logging
+from datetime import datetime
+from typing import Callable, Final, Iterable, Optional, TypeVar
+
+from genericache import (
+    BytesReaderP,
+    Cache,
+    CacheEntry,
+    DigestMismatch,
+    FetchInterrupted,
+)
+from genericache.digest import ContentDigest, UrlDigest
+from genericache.disk_cache import DiskCache
+from genericache.freshness import FreshnessPolicy, NeverExpire
+from genericache.memory_cache import MemoryCache
+from genericache.negative_caching import RecentlyFailed
+
+logger = logging.getLogger(__name__)
+
+U = TypeVar("U")
+
+
+def _iter_chunks(
+    reader: BytesReaderP, chunk_size: int = 1024 * 1024
+) -> Iterable[bytes]:
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class TieredCache(Cache[U]):
+    """A `MemoryCache` in front of a `DiskCache`
+
+    Lookups check the memory tier first and fall back to the disk tier, promoting
+    whatever is found there into memory. Misses in both tiers are fetched by the disk
+    tier, so a URL is still fetched at most once per cache directory, and the memory
+    tier makes sure that threads of this process only ever wait on a single fetch.
+
+    `hits()` counts requests served by either tier and `misses()` counts actual
+    fetches; the `memory` and `disk` tiers report their own `hits()`/`misses()`.
+    The memory tier should usually be bounded, e.g. via `max_bytes`.
+
+    `fetch` judges cached entries by `freshness` rather than by the policies of the
+    tiers. Entries promoted into memory keep the time they were fetched at.
+    """
+
+    def __init__(
+        self,
+        *,
+        memory: MemoryCache[U],
+        disk: DiskCache[U],
+        freshness: FreshnessPolicy = NeverExpire(),
+    ) -> None:
+        super().__init__()
+        self.memory: Final[MemoryCache[U]] = memory
+        self.disk: Final[DiskCache[U]] = disk
+        self.url_hasher: Final[Callable[[U], UrlDigest]] = memory.url_hasher
+        self.freshness: FreshnessPolicy = freshness
+
+    def hits(self) -> int:
+        return self.memory.hits() + self.disk.hits()
+
+    def misses(self) -> int:
+        return self.disk.misses()
+
+    def get_by_url(self, *, url: U) -> Optional[CacheEntry]:
+        entry = self.memory.get_by_url(url=url)
+        if entry is not None:
+            return entry
+        disk_entry = self.disk.get_by_url(url=url)
+        if disk_entry is None:
+            return None
+        with disk_entry:
+            promoted = self.memory._try_fetch(  # pyright: ignore[reportPrivateUsage]
+                url,
+                lambda _: _iter_chunks(disk_entry),
+                force_refetch=False,
+                stream=None,
+                fetched_at=lambda: disk_entry.timestamp,
+            )
+        if isinstance(promoted, Exception):
+            return None
+        return promoted
+
+    def fetched_at(self, *, url: U) -> Optional[datetime]:
+        return self.memory.fetched_at(url=url) or self.disk.fetched_at(url=url)
+
+    def open_if_cached(self, *, url: U) -> Optional[CacheEntry]:
+        # promoting an entry from the disk tier means copying it
+        return self.memory.open_if_cached(url=url)
+
+    def get(self, *, digest: ContentDigest) -> Optional[CacheEntry]:
+        entry = self.memory.get(digest=digest)
+        if entry is not None:
+            return entry
+        # the memory tier is keyed by URL, so there is nothing to promote here
+        return self.disk.get(digest=digest)
+
+    def try_fetch(
+        self,
+        url: U,
+        fetcher: "Callable[[U], Iterable[bytes]]",
+        force_refetch: "bool | ContentDigest",
+    ) -> "CacheEntry | FetchInterrupted[U] | DigestMismatch[U]":
+        # errors of the disk tier that the memory tier would turn into FetchInterrupted
+        disk_error: "Optional[DigestMismatch[U] | RecentlyFailed[U]]" = None
+        disk_entry: Optional[CacheEntry] = None
+
+        def fetch_via_disk(url: U) -> Iterable[bytes]:
+            nonlocal disk_error, disk_entry
+            result = self.disk.try_fetch(url, fetcher, force_refetch=force_refetch)
+            if isinstance(result, (DigestMismatch, RecentlyFailed)):
+                disk_error = result
+            if isinstance(result, Exception):
+                raise result
+            disk_entry = result
+            return _iter_chunks(result)
+
+        def fetched_at() -> datetime:
+            assert disk_entry is not None
+            return disk_entry.timestamp
+
+        try:
+            result = self.memory._try_fetch(  # pyright: ignore[reportPrivateUsage]
+                url, fetch_via_disk, force_refetch, stream=None, fetched_at=fetched_at
+            )
+        finally:
+            if disk_entry is not None:
+                disk_entry.close()  # its contents were copied into memory
+        if isinstance(result, FetchInterrupted) and disk_error is not None:
+            return disk_error
+        return result
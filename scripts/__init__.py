@@ -6,6 +6,7 @@ from typing import Final, List, Sequence
 PROJECT_ROOT: Final[Path] = Path(__file__).parent.parent
 TESTS_DIR: Final[Path] = PROJECT_ROOT / "tests"
 SOURCE_DIR: Final[Path] = PROJECT_ROOT / "genericache"
+BENCHMARKS_DIR: Final[Path] = PROJECT_ROOT / "benchmarks"
 
 
 @dataclass
@@ -0,0 +1,56 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks import Measurement, contention, fetch, lookup
+
+parser = argparse.ArgumentParser(description="Runs the benchmarks in benchmarks/")
+_ = parser.add_argument(
+    "--output", type=Path, default=None, help="JSON file to write the results to"
+)
+_ = parser.add_argument(
+    "--quick", action="store_true", help="smaller sizes, e.g. to smoke-test in CI"
+)
+args = parser.parse_args()
+quick: bool = args.quick
+output: "Path | None" = args.output
+
+measurements: List[Measurement] = []
+measurements += lookup.run(
+    entry_counts=[10, 100] if quick else [100, 1000, 5000],
+    lookups=100 if quick else 1000,
+)
+measurements += fetch.run(
+    payload_count=4 if quick else 16,
+    payload_size=64 * 1024 if quick else 1024 * 1024,
+    repeats=1 if quick else 5,
+)
+measurements += contention.run(
+    process_counts=[1, 2] if quick else [1, 4, 8],
+    threads=2 if quick else 4,
+    payload_count=4 if quick else 16,
+    payload_size=64 * 1024 if quick else 1024 * 1024,
+    repeats=1 if quick else 3,
+)
+
+for m in measurements:
+    summary = m.to_json()
+    print(
+        f"{m.benchmark:<11}{m.cache:<7}{m.metric:<11}{json.dumps(m.params):<60}"
+        f" median={summary['median']:.6g} {m.unit}"
+    )
+
+if output is not None:
+    report: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": sys.platform,
+        "timestamp": time.time(),
+        "quick": quick,
+        "results": [m.to_json() for m in measurements],
+    }
+    _ = output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
@@ -1,4 +1,10 @@
-from scripts import SOURCE_DIR, SUPPORTED_PYTHON_VERSIONS, TESTS_DIR, pyright_check
+from scripts import (
+    BENCHMARKS_DIR,
+    SOURCE_DIR,
+    SUPPORTED_PYTHON_VERSIONS,
+    TESTS_DIR,
+    pyright_check,
+)
 
 for py_ver in SUPPORTED_PYTHON_VERSIONS:
     result = pyright_check(py_ver=py_ver, no_dev=True, directory=SOURCE_DIR)
@@ -12,3 +18,7 @@ for py_ver in SUPPORTED_PYTHON_VERSIONS:
     )
     if result.returncode != 0:
         exit(result.returncode)
+
+    result = pyright_check(py_ver=py_ver, no_dev=False, directory=BENCHMARKS_DIR)
+    if result.returncode != 0:
+        exit(result.returncode)
@@ -4,7 +4,7 @@ from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import multiprocessing
 from pathlib import Path
-from typing import Any, Callable, Final, Iterable, List
+from typing import Any, Callable, Final, Iterable, List, Optional, Sequence
 import random
 import time
 import logging
@@ -38,6 +38,39 @@ def random_range(*, seed: int, len: int) -> List[int]:
     return sorted(range(len), key=lambda _: rng.random())
 
 
+class PayloadFetcher:
+    """Fetches `payloads[i]` for the URL `"i"`, and for mirrors of it like `"i-mirror"`
+
+    With a single payload, every URL gets it. Payloads are fetched in chunks of
+    `chunk_size` bytes, or in one piece
+    """
+
+    def __init__(
+        self, payloads: Sequence[bytes], *, chunk_size: Optional[int] = None
+    ) -> None:
+        super().__init__()
+        self.payloads: Final[Sequence[bytes]] = payloads
+        self.chunk_size: Final[Optional[int]] = chunk_size
+
+    def payload(self, url: str) -> bytes:
+        if len(self.payloads) == 1:
+            return self.payloads[0]
+        return self.payloads[int(url.split("-")[0])]
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        payload = self.payload(url)
+        if self.chunk_size is None:
+            return [payload]
+        return [
+            payload[start : start + self.chunk_size]
+            for start in range(0, len(payload), self.chunk_size)
+        ]
+
+
+PAYLOADS: List[bytes] = [bytes([i]) * 1000 for i in range(10)]
+fetch_payload: Final = PayloadFetcher(PAYLOADS)
+
+
 @dataclass
 class HitsAndMisses:
     hits: int
@@ -0,0 +1,111 @@
+import asyncio
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator, List, TypeVar
+import tempfile
+import threading
+
+from genericache import MemoryCache, Ttl
+from genericache.async_cache import AsyncCache, AsyncDiskCache, AsyncMemoryCache
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+T = TypeVar("T")
+
+PAYLOADS: List[bytes] = [bytes([i]) * 4096 * 5 for i in range(10)]
+
+
+class AsyncFetcher:
+    def __init__(self) -> None:
+        super().__init__()
+        self.num_fetches = 0
+
+    async def __call__(self, url: str) -> AsyncIterator[bytes]:
+        self.num_fetches += 1
+        payload = PAYLOADS[int(url)]
+        for start in range(0, len(payload), 4096):
+            await asyncio.sleep(0.001)
+            yield payload[start : start + 4096]
+
+
+async def failing_fetcher(url: str) -> AsyncIterator[bytes]:
+    yield b"some bytes"
+    raise RuntimeError("Connection lost")
+
+
+def sync_failing_fetcher(url: str) -> Iterator[bytes]:
+    yield b"some bytes"
+    raise RuntimeError("Connection lost")
+
+
+def off_the_loop(method: "Callable[..., T]") -> "Callable[..., T]":
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        assert threading.current_thread() is not threading.main_thread(), method
+        return method(*args, **kwargs)
+
+    return wrapper
+
+
+async def fetch_and_check(cache: AsyncCache[str], fetcher: AsyncFetcher, idx: int):
+    entry = await cache.fetch(str(idx), fetcher)
+    assert entry.read() == PAYLOADS[idx]
+    assert entry.content_digest == ContentDigest(sha256(PAYLOADS[idx]).digest())
+
+
+async def check_cache(cache: AsyncCache[str]) -> None:
+    fetcher = AsyncFetcher()
+    _ = await asyncio.gather(
+        *[
+            fetch_and_check(cache, fetcher, idx)
+            for _ in range(10)
+            for idx in range(len(PAYLOADS))
+        ]
+    )
+    assert fetcher.num_fetches == len(PAYLOADS)
+    assert cache.misses() == len(PAYLOADS)
+    assert cache.hits() == 9 * len(PAYLOADS)
+
+    entry = await cache.get_by_url(url="0")
+    assert entry is not None and entry.read() == PAYLOADS[0]
+
+    # the wrapped cache, and so its index, is never queried from the event loop
+    looked_up = ("open_if_cached", "fetched_at", "get")
+    for name in looked_up:
+        setattr(cache.cache, name, off_the_loop(getattr(cache.cache, name)))
+    entry = await cache.fetch("1", fetcher, freshness=Ttl(3600))
+    assert entry.read() == PAYLOADS[1]
+    assert cache.hits() == 9 * len(PAYLOADS) + 1
+    refetched = await asyncio.gather(
+        *[cache.fetch("2", fetcher, force_refetch=True) for _ in range(2)]
+    )
+    assert all(entry.read() == PAYLOADS[2] for entry in refetched)
+    for name in looked_up:
+        delattr(cache.cache, name)
+
+    # failures are retried or raised just like by the wrapped cache
+    try:
+        _ = cache.cache.fetch("not cached", sync_failing_fetcher)
+        assert False, "Should have raised"
+    except RuntimeError as e:
+        sync_error = e
+    try:
+        _ = await cache.fetch("not cached", failing_fetcher)
+        assert False, "Should have raised"
+    except RuntimeError as e:
+        assert type(e) is type(sync_error), (e, sync_error)
+    assert await cache.get_by_url(url="not cached") is None
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    asyncio.run(
+        check_cache(
+            AsyncDiskCache(
+                DiskCache[str].create(
+                    url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+                )
+            )
+        )
+    )
+    asyncio.run(check_cache(AsyncMemoryCache(MemoryCache(url_hasher=hash_url))))
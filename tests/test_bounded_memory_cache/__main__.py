@@ -0,0 +1,61 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import sha256
+from threading import Event
+from typing import Iterable, List
+import time
+
+from genericache import MemoryCache
+from genericache.digest import ContentDigest
+from tests import PAYLOADS, fetch_payload, hash_url
+
+PAYLOAD_LEN = len(PAYLOADS[0])
+
+
+def cached_urls(cache: MemoryCache[str]) -> List[int]:
+    return [
+        i
+        for i in range(len(PAYLOADS))
+        if cache.get(digest=ContentDigest(sha256(PAYLOADS[i]).digest()))
+    ]
+
+
+if __name__ == "__main__":
+    cache: MemoryCache[str] = MemoryCache(url_hasher=hash_url, max_entries=3)
+    for idx in (0, 1, 2):
+        _ = cache.fetch(str(idx), fetcher=fetch_payload)
+    _ = cache.fetch("0", fetcher=fetch_payload)
+    reader = cache.get_by_url(url="1")
+    assert reader is not None
+    _ = cache.fetch("0", fetcher=fetch_payload)
+    _ = cache.fetch("2", fetcher=fetch_payload)
+    _ = cache.fetch("3", fetcher=fetch_payload)
+    assert cached_urls(cache) == [0, 2, 3]
+    assert cache.get_by_url(url="1") is None
+    assert reader.read() == PAYLOADS[1]
+    assert cache.fetch("1", fetcher=fetch_payload).read() == PAYLOADS[1]
+    assert cache.misses() == 5
+
+    cache = MemoryCache(url_hasher=hash_url, max_bytes=PAYLOAD_LEN * 2)
+    for idx in range(len(PAYLOADS)):
+        _ = cache.fetch(str(idx), fetcher=fetch_payload)
+    assert cached_urls(cache) == [8, 9]
+
+    # an entry larger than the budget is still delivered to everyone waiting on it
+    cache = MemoryCache(url_hasher=hash_url, max_bytes=PAYLOAD_LEN // 2)
+    release_fetch = Event()
+
+    def slow_fetch(url: str) -> Iterable[bytes]:
+        _ = release_fetch.wait()
+        return fetch_payload(url)
+
+    pool = ThreadPoolExecutor(max_workers=5)
+    futs: "List[Future[bytes]]" = [
+        pool.submit(lambda: cache.fetch("4", fetcher=slow_fetch).read())
+        for _ in range(5)
+    ]
+    time.sleep(0.2)  # let every thread join the in-flight fetch
+    release_fetch.set()
+    assert all(f.result() == PAYLOADS[4] for f in futs)
+    assert cache.misses() == 1
+    assert cached_urls(cache) == []
+    assert cache.get_by_url(url="4") is None
@@ -0,0 +1,179 @@
+from pathlib import Path
+from typing import Iterable, List
+import io
+import os
+import random
+import tempfile
+import zlib
+from hashlib import sha256
+
+from genericache import StreamingEntry
+from genericache.compression import (
+    CodecUnavailable,
+    FrameTable,
+    FrameWriter,
+    FramedReader,
+    LzmaCodec,
+    ZlibCodec,
+    default_codec,
+)
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+rng = random.Random(123)
+# compressible, but not trivially so
+PAYLOAD = b"".join(
+    rng.choice([b"genericache ", b"frames ", b"zlib ", bytes([rng.randrange(256)])])
+    for _ in range(300_000)
+)
+DIGEST = ContentDigest(digest=sha256(PAYLOAD).digest())
+
+
+class CountingCodec(ZlibCodec):
+    def __init__(self) -> None:
+        super().__init__()
+        self.decompressed_frames = 0
+
+    def decompress(self, data: bytes) -> bytes:
+        self.decompressed_frames += 1
+        return super().decompress(data)
+
+
+class FlakyFetcher:
+    """Fails once after yielding `fail_after` bytes, then resumes from where it stopped"""
+
+    def __init__(self, fail_after: int) -> None:
+        super().__init__()
+        self.fail_after = fail_after
+        self.resumed_at: List[int] = []
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        for start in range(0, len(PAYLOAD), 10_000):
+            if start >= self.fail_after:
+                raise RuntimeError("connection reset")
+            yield PAYLOAD[start : start + 10_000]
+
+    def resume(self, url: str, offset: int) -> Iterable[bytes]:
+        self.resumed_at.append(offset)
+        yield PAYLOAD[offset:]
+
+
+def payload_fetcher(url: str) -> Iterable[bytes]:
+    for start in range(0, len(PAYLOAD), 4096):
+        yield PAYLOAD[start : start + 4096]
+
+
+if __name__ == "__main__":
+    # frames can be read back in any order, decompressing only the ones touched
+    for codec in [ZlibCodec(), LzmaCodec(), default_codec()]:
+        buffer = io.BytesIO()
+        writer = FrameWriter(buffer, codec, frame_size=64 * 1024)
+        for start in range(0, len(PAYLOAD), 5000):
+            _ = writer.write(PAYLOAD[start : start + 5000])
+        _ = writer.finish()
+        assert len(buffer.getvalue()) < len(PAYLOAD)
+        _ = buffer.seek(0)
+        reader = FramedReader(buffer, codec)
+        assert reader.size == len(PAYLOAD)
+        assert reader.read() == PAYLOAD
+        for _ in range(50):
+            offset = rng.randrange(len(PAYLOAD))
+            _ = reader.seek(offset)
+            assert reader.read(100_000) == PAYLOAD[offset : offset + 100_000]
+        assert reader.seek(-10, os.SEEK_END) == len(PAYLOAD) - 10
+        assert reader.read(100) == PAYLOAD[-10:] and reader.read() == b""
+
+    counting = CountingCodec()
+    buffer = io.BytesIO()
+    writer = FrameWriter(buffer, counting, frame_size=64 * 1024)
+    _ = writer.write(PAYLOAD)
+    _ = writer.finish()
+    reader = FramedReader(buffer, counting)
+    _ = reader.seek(len(PAYLOAD) - 1000)
+    assert reader.read(1000) == PAYLOAD[-1000:]
+    assert counting.decompressed_frames == 1
+
+    empty = io.BytesIO()
+    _ = FrameWriter(empty, ZlibCodec()).finish()
+    assert FramedReader(empty, ZlibCodec()).read() == b""
+    try:
+        _ = FrameTable.from_trailer(io.BytesIO(b"not compressed at all"))
+        raise AssertionError("should have rejected an uncompressed file")
+    except ValueError:
+        pass
+
+    # entries are compressed on disk, keep the digest of their contents and stay seekable
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir),
+            url_hasher=hash_url,
+            compression=ZlibCodec(),
+        )
+        entry = cache.fetch("payload", payload_fetcher)
+        assert entry.content_digest == DIGEST
+        [entry_file] = list(Path(cache_dir).glob("entry__url_*"))
+        assert entry_file.name.endswith(".zlib")
+        assert entry_file.stat().st_size < len(PAYLOAD)
+        assert entry.read() == PAYLOAD
+        _ = entry.seek(len(PAYLOAD) // 2)
+        assert entry.read(10) == PAYLOAD[len(PAYLOAD) // 2 :][:10]
+        assert bytes(entry.getbuffer()) == PAYLOAD
+        assert cache.metrics.bytes_served.value == len(PAYLOAD)
+
+        found = cache.get(digest=DIGEST)
+        assert found is not None and found.read() == PAYLOAD
+        assert cache._index.totals() == (  # pyright: ignore[reportPrivateUsage]
+            1,
+            entry_file.stat().st_size,
+        )
+
+        # identical contents are still stored once
+        _ = cache.fetch("mirror", payload_fetcher)
+        files = list(Path(cache_dir).glob("entry__url_*"))
+        assert len({os.stat(path).st_ino for path in files}) == 1
+
+        # streaming readers decompress the frames as soon as they are written
+        streamed = cache.fetch_streaming("streamed", payload_fetcher)
+        assert isinstance(streamed, StreamingEntry)
+        chunks: List[bytes] = []
+        for chunk in iter(lambda: streamed.read(10_000), b""):
+            chunks.append(chunk)
+        assert b"".join(chunks) == PAYLOAD
+        assert streamed.wait_content_digest() == DIGEST
+
+        # a resumed fetch picks up the frames that were written before the failure
+        flaky = FlakyFetcher(fail_after=len(PAYLOAD) // 2)
+        entry = cache.fetch("flaky", flaky)
+        assert entry.read() == PAYLOAD and entry.content_digest == DIGEST
+        assert flaky.resumed_at and 0 < flaky.resumed_at[0] <= len(PAYLOAD) // 2
+
+    # caches with other codecs, or none, read each other's entries
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        entry_file = (
+            Path(cache_dir) / f"entry__url_{hash_url('legacy')}_contents_{DIGEST}.lzma"
+        )
+        with open(entry_file, "wb") as f:
+            writer = FrameWriter(f, LzmaCodec())
+            _ = writer.write(PAYLOAD)
+            _ = writer.finish()
+        cache = DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir), url_hasher=hash_url
+        )
+        legacy = cache.get_by_url(url="legacy")
+        assert legacy is not None and legacy.read() == PAYLOAD
+
+        unknown = (
+            Path(cache_dir) / f"entry__url_{hash_url('unknown')}_contents_{DIGEST}.rar"
+        )
+        _ = unknown.write_bytes(zlib.compress(PAYLOAD))
+        cache._index.rebuild()  # pyright: ignore[reportPrivateUsage]
+        assert cache.get_by_url(url="unknown") is None
+
+    try:
+        from genericache.compression import ZstdCodec
+
+        _ = ZstdCodec()
+    except CodecUnavailable:
+        assert isinstance(default_codec(), ZlibCodec)
@@ -0,0 +1,103 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable
+import os
+import tempfile
+import time
+
+from genericache import FetchInterrupted
+from genericache.dir_watch import InotifyWatcher, PollingWatcher, watch_dir
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+PAYLOAD = b"slow payload" * 1000
+
+
+def slow_fetch_in_other_process(
+    cache_dir: Path, started_marker: Path, sharded: bool
+) -> float:
+    def fetcher(url: str) -> Iterable[bytes]:
+        started_marker.touch()
+        time.sleep(1.5)
+        yield PAYLOAD
+
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url, sharded=sharded
+    )
+    _ = cache.fetch("slow", fetcher=fetcher)
+    return time.time()
+
+
+def fail_fetch(url: str) -> Iterable[bytes]:
+    raise AssertionError("should have used the entry fetched by the other process")
+
+
+def wait_for(path: Path) -> None:
+    while not path.exists():
+        time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as watched_dir:
+        watcher = watch_dir(Path(watched_dir))
+        assert isinstance(watcher, (InotifyWatcher, PollingWatcher))
+        if isinstance(watcher, InotifyWatcher):
+            staged = Path(watched_dir) / "staged.tmp"
+            _ = staged.write_bytes(b"")
+            _ = watcher.wait(0)  # drop the event of the write above
+            os.replace(staged, Path(watched_dir) / "landed")
+            assert watcher.wait(1) == ["landed"]
+        watcher.close()
+
+    # a process waiting for another one to fetch the same URL gets its entry, with
+    # the time it was fetched at even if its file is shared with an older entry
+    for sharded in (False, True):
+        cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        started_marker = Path(cache_dir.name) / "fetch_started"
+        cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir.name),
+            url_hasher=hash_url,
+            sharded=sharded,
+        )
+        _ = cache.fetch("mirror", fetcher=lambda url: [PAYLOAD])
+        an_hour_ago = time.time() - 3600
+        for path in Path(cache_dir.name).glob(f"**/entry__url_{hash_url('mirror')}_*"):
+            os.utime(path, (an_hour_ago, an_hour_ago))
+        with ProcessPoolExecutor(max_workers=1) as pp:
+            other_fetch = pp.submit(
+                slow_fetch_in_other_process,
+                Path(cache_dir.name),
+                started_marker,
+                sharded,
+            )
+            wait_for(started_marker)
+            entry = cache.fetch("slow", fetcher=fail_fetch)
+            assert entry.read() == PAYLOAD
+            finished_at = time.time()
+            assert finished_at - other_fetch.result() < 1.0
+            assert entry.timestamp.timestamp() > finished_at - 60, entry.timestamp
+        assert cache.misses() == 1
+        assert cache.hits() == 1
+
+    # waiting on another process gives up after wait_timeout
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    started_marker = Path(cache_dir.name) / "fetch_started"
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        other_fetch = pp.submit(
+            slow_fetch_in_other_process, Path(cache_dir.name), started_marker, False
+        )
+        wait_for(started_marker)
+        cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir.name),
+            url_hasher=hash_url,
+            wait_timeout=0.2,
+        )
+        t0 = time.monotonic()
+        result = cache.try_fetch("slow", fail_fetch, force_refetch=False)
+        assert isinstance(result, FetchInterrupted)
+        assert time.monotonic() - t0 < 1.0
+        _ = other_fetch.result()
+    entry = cache.try_fetch("slow", fail_fetch, force_refetch=False)
+    assert not isinstance(entry, Exception) and entry.read() == PAYLOAD
@@ -0,0 +1,189 @@
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, List, Set
+import gc
+import os
+import tempfile
+import warnings
+
+from genericache import CacheFsLinkUsageMismatch, DigestMismatch
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+PAYLOAD = b"mirrored payload" * 1000
+OTHER_PAYLOAD = b"something else" * 1000
+
+
+def mirror_fetcher(url: str) -> Iterable[bytes]:
+    yield OTHER_PAYLOAD if url.startswith("other") else PAYLOAD
+
+
+def refuse_link(src: "str | Path", dst: "str | Path") -> None:
+    raise PermissionError("hard links are not supported here")
+
+
+def entry_files(cache_dir: Path) -> List[Path]:
+    return sorted(cache_dir.glob("**/entry__url_*"))
+
+
+def fetch_mirrors(cache_dir: Path, process_idx: int, use_symlinks: bool) -> int:
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=cache_dir,
+        url_hasher=hash_url,
+        max_entries=4,
+        use_symlinks=use_symlinks,
+    )
+    for i in range(8):
+        # overlapping URLs, so that processes also contend for the same entries
+        url = f"mirror{(process_idx * 3 + i) % 12}"
+        assert cache.fetch(url, mirror_fetcher).read() == PAYLOAD
+    return cache.misses()
+
+
+def try_opening(cache_dir: Path, use_symlinks: bool) -> bool:
+    result = DiskCache[str].try_create(
+        url_type=str,
+        cache_dir=cache_dir,
+        url_hasher=hash_url,
+        sharded=True,
+        use_symlinks=use_symlinks,
+    )
+    return isinstance(result, CacheFsLinkUsageMismatch)
+
+
+if __name__ == "__main__":
+    # identical contents become hard links to a single file
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        cache = DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir), url_hasher=hash_url
+        )
+        for url in ["mirror0", "mirror1", "mirror2", "other"]:
+            _ = cache.fetch(url, mirror_fetcher)
+        inodes: Set[int] = {
+            os.stat(path).st_ino for path in entry_files(Path(cache_dir))
+        }
+        assert len(entry_files(Path(cache_dir))) == 4
+        assert len(inodes) == 2
+        mirror0 = cache.get_by_url(url="mirror0")
+        assert mirror0 is not None and mirror0.read() == PAYLOAD
+        assert cache.fetch("mirror1", mirror_fetcher).read() == PAYLOAD
+        assert cache._index.totals() == (  # pyright: ignore[reportPrivateUsage]
+            4,
+            len(PAYLOAD) + len(OTHER_PAYLOAD),
+        )
+
+        # contents other than the expected ones are stored, but not handed out
+        served = cache.metrics.bytes_served.value
+        _ = gc.collect()  # the entries left open above
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            mismatch = cache.try_fetch(
+                "other-mirror",
+                mirror_fetcher,
+                force_refetch=ContentDigest(sha256(PAYLOAD).digest()),
+            )
+            _ = gc.collect()
+        assert isinstance(mismatch, DigestMismatch)
+        assert not [w for w in caught if w.category is ResourceWarning], caught
+        assert cache.metrics.bytes_served.value == served
+        assert len(entry_files(Path(cache_dir))) == 5
+
+    # where hard links can't be made, the copies count in full
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        cache = DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir), url_hasher=hash_url
+        )
+        link = os.link
+        os.link = refuse_link
+        try:
+            for url in ["mirror0", "mirror1"]:
+                _ = cache.fetch(url, mirror_fetcher)
+        finally:
+            os.link = link
+        assert len({os.stat(path).st_ino for path in entry_files(Path(cache_dir))}) == 2
+        for _ in range(2):  # as recorded, and as scanned
+            totals = cache._index.totals()  # pyright: ignore[reportPrivateUsage]
+            assert totals == (2, 2 * len(PAYLOAD)), totals
+            cache._index.rebuild()  # pyright: ignore[reportPrivateUsage]
+
+    # bounded caches only free the shared data with its last entry
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir),
+            url_hasher=hash_url,
+            max_bytes=len(PAYLOAD) + len(OTHER_PAYLOAD),
+        )
+        for i in range(10):
+            _ = cache.fetch(f"mirror{i}", mirror_fetcher)
+        assert len(entry_files(Path(cache_dir))) == 10  # still fits
+        _ = cache.fetch("other", mirror_fetcher)
+        assert len(entry_files(Path(cache_dir))) == 11
+        _ = cache.fetch("other2", mirror_fetcher)  # same size as "other", fits
+        assert len(entry_files(Path(cache_dir))) == 12
+
+    # with use_symlinks, entries link to one blob, which goes away with its last entry
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir),
+            url_hasher=hash_url,
+            max_entries=3,
+            use_symlinks=True,
+            sharded=True,
+        )
+        for url in ["mirror0", "mirror1", "mirror2"]:
+            assert cache.fetch(url, mirror_fetcher).read() == PAYLOAD
+        assert all(path.is_symlink() for path in entry_files(Path(cache_dir)))
+        assert len(list(cache.blobs_dir.glob("*.lock"))) == 1
+        blobs = [p for p in cache.blobs_dir.iterdir() if not p.name.endswith(".lock")]
+        assert len(blobs) == 1 and blobs[0].read_bytes() == PAYLOAD
+        for url in ["other0", "other1", "other2"]:
+            assert cache.fetch(url, mirror_fetcher).read() == OTHER_PAYLOAD
+        assert not blobs[0].exists()
+        assert cache.get_by_url(url="mirror0") is None
+        entry = cache.get_by_url(url="other0")
+        assert entry is not None and entry.read() == OTHER_PAYLOAD
+
+        # rebuilding the index from the directory follows the links
+        cache._index.rebuild()  # pyright: ignore[reportPrivateUsage]
+        entry = cache.get_by_url(url="other2")
+        assert entry is not None and entry.read() == OTHER_PAYLOAD
+
+        assert try_opening(Path(cache_dir), use_symlinks=False)
+
+    # the use of symlinks is recorded in the directory for other processes
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        with ProcessPoolExecutor(max_workers=1) as pp:
+            assert not pp.submit(try_opening, Path(cache_dir), True).result()
+        assert try_opening(Path(cache_dir), use_symlinks=False)
+
+    # concurrent processes fetching and evicting identical contents
+    for use_symlinks in (False, True):
+        with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+            with ProcessPoolExecutor(max_workers=4) as pp:
+                futs = [
+                    pp.submit(fetch_mirrors, Path(cache_dir), idx, use_symlinks)
+                    for idx in range(4)
+                ]
+                _ = [f.result() for f in futs]
+            cache = DiskCache[str].create(
+                url_type=str,
+                cache_dir=Path(cache_dir),
+                url_hasher=hash_url,
+                max_entries=4,
+                use_symlinks=use_symlinks,
+            )
+            _ = cache.evict()  # others skip evicting while one of them is at it
+            files = entry_files(Path(cache_dir))
+            assert 0 < len(files) <= 4
+            assert all(path.read_bytes() == PAYLOAD for path in files)
+            assert len({os.stat(path).st_ino for path in files}) == 1
+            if use_symlinks:
+                blobs = [
+                    p for p in cache.blobs_dir.iterdir() if not p.name.endswith(".lock")
+                ]
+                assert len(blobs) == 1
@@ -0,0 +1,98 @@
+from pathlib import Path
+from typing import List
+import tempfile
+import time
+
+from genericache.disk_cache import DiskCache
+from genericache.eviction import LfuEviction, OldestFirstEviction
+from tests import PAYLOADS, fetch_payload, hash_url
+
+PAYLOAD_LEN = len(PAYLOADS[0])
+
+
+def cached_urls(cache: DiskCache[str]) -> List[int]:
+    return [i for i in range(len(PAYLOADS)) if cache.get_by_url(url=str(i))]
+
+
+def entry_files(cache_dir: Path) -> List[Path]:
+    return list(cache_dir.glob("entry__*"))
+
+
+if __name__ == "__main__":
+    # LRU bounded by number of entries
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=Path(cache_dir.name),
+        url_hasher=hash_url,
+        max_entries=3,
+    )
+    for idx in (0, 1, 2):
+        _ = cache.fetch(str(idx), fetcher=fetch_payload)
+        time.sleep(0.01)
+    _ = cache.fetch("0", fetcher=fetch_payload)  # 1 is now the least recently used
+    reader = cache.get_by_url(url="1")
+    assert reader is not None
+    time.sleep(0.01)
+    _ = cache.fetch("0", fetcher=fetch_payload)
+    time.sleep(0.01)
+    _ = cache.fetch("2", fetcher=fetch_payload)
+    time.sleep(0.01)
+    _ = cache.fetch("3", fetcher=fetch_payload)
+    assert len(entry_files(Path(cache_dir.name))) == 3
+    assert cached_urls(cache) == [0, 2, 3]
+    # readers that were already open keep working after eviction
+    assert reader.read() == PAYLOADS[1]
+    # evicted entries are fetched again
+    assert cache.fetch("1", fetcher=fetch_payload).read() == PAYLOADS[1]
+    assert cache.misses() == 5
+
+    # LFU bounded by bytes
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=Path(cache_dir.name),
+        url_hasher=hash_url,
+        max_bytes=PAYLOAD_LEN * 2 + PAYLOAD_LEN // 2,
+        eviction_policy=LfuEviction(),
+    )
+    _ = cache.fetch("0", fetcher=fetch_payload)
+    for _ in range(3):
+        assert cache.get_by_url(url="0") is not None
+    _ = cache.fetch("1", fetcher=fetch_payload)
+    _ = cache.fetch("2", fetcher=fetch_payload)
+    assert cached_urls(cache) == [0, 2]
+
+    # superseded entries of a refetched URL are evicted before anything else
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=Path(cache_dir.name),
+        url_hasher=hash_url,
+        max_entries=2,
+        eviction_policy=OldestFirstEviction(),
+    )
+    _ = cache.fetch("0", fetcher=fetch_payload)
+    time.sleep(0.01)
+    _ = cache.fetch("1", fetcher=fetch_payload)
+    time.sleep(0.01)
+    _ = cache.fetch("1", fetcher=lambda _: [b"new contents"], force_refetch=True)
+    assert len(entry_files(Path(cache_dir.name))) == 2
+    assert cached_urls(cache) == [0, 1]
+    entry = cache.get_by_url(url="1")
+    assert entry is not None and entry.read() == b"new contents"
+
+    # eviction frees some headroom, so that it doesn't run after every fetch
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=Path(cache_dir.name),
+        url_hasher=hash_url,
+        max_entries=len(PAYLOADS),
+    )
+    for idx in range(len(PAYLOADS)):
+        _ = cache.fetch(str(idx), fetcher=fetch_payload)
+    assert cache.evict() == 0
+    _ = cache.fetch("10", fetcher=lambda _: [b"one too many"])
+    assert len(entry_files(Path(cache_dir.name))) == len(PAYLOADS) - 1
+    assert cache.get_by_url(url="10") is not None
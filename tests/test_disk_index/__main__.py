@@ -0,0 +1,80 @@
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable
+import os
+import tempfile
+
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from genericache.disk_index import DiskIndex
+from tests import PAYLOADS, fetch_payload, hash_url
+
+
+def fail_fetch(url: str) -> Iterable[bytes]:
+    raise RuntimeError(f"Should not have fetched {url}")
+
+
+def populate(cache_dir: Path) -> int:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    for idx in range(len(PAYLOADS)):
+        _ = cache.fetch(str(idx), fetcher=fetch_payload)
+    return cache.misses()
+
+
+def check_all_cached(cache_dir: Path) -> int:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    for idx, payload in enumerate(PAYLOADS):
+        entry = cache.get_by_url(url=str(idx))
+        assert entry is not None
+        assert entry.read() == payload
+        digest = ContentDigest(sha256(payload).digest())
+        by_content = cache.get(digest=digest)
+        assert by_content is not None and by_content.read() == payload
+        _ = cache.fetch(str(idx), fetcher=fail_fetch)
+    return cache.hits()
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache_path = Path(cache_dir.name)
+    index_path = cache_path / DiskIndex.FILE_NAME
+
+    # fresh processes so each gets its own DiskCache instance, as after a restart
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(populate, cache_path).result() == len(PAYLOADS)
+    assert index_path.exists()
+
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(check_all_cached, cache_path).result() == len(PAYLOADS)
+
+    # a missing index is rebuilt from the file names
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(f"{index_path}{suffix}"):
+            os.remove(f"{index_path}{suffix}")
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(check_all_cached, cache_path).result() == len(PAYLOADS)
+
+    # and so is a corrupted one
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(f"{index_path}{suffix}"):
+            os.remove(f"{index_path}{suffix}")
+    _ = index_path.write_bytes(b"this is not an sqlite database" * 100)
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(check_all_cached, cache_path).result() == len(PAYLOADS)
+
+    # entries deleted behind the index's back are treated as misses
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_path, url_hasher=hash_url
+    )
+    entry = cache.get_by_url(url="0")
+    assert entry is not None
+    entry_name = f"entry__url_{entry.url_digest}_contents_{entry.content_digest}"
+    os.remove(cache_path / entry_name)
+    assert cache.get_by_url(url="0") is None
+    assert cache.fetch("0", fetcher=fetch_payload).read() == PAYLOADS[0]
+    assert cache.misses() == 1
@@ -0,0 +1,33 @@
+from pathlib import Path
+from typing import List
+import tempfile
+
+from genericache import Cache, MemoryCache, NoopCache
+from genericache.disk_cache import DiskCache
+from tests import PayloadFetcher, hash_url
+
+PAYLOADS: List[bytes] = [b"", b"some payload" * 1000]
+fetch_payload = PayloadFetcher(PAYLOADS)
+
+
+def check_buffers(cache: Cache[str]) -> None:
+    for idx, payload in enumerate(PAYLOADS):
+        entry = cache.fetch(str(idx), fetcher=fetch_payload)
+        _ = entry.read(3)
+        buffer = entry.getbuffer()
+        assert buffer.readonly
+        assert buffer == payload
+        # getting the buffer doesn't disturb reading
+        assert entry.read() == payload[3:]
+        buffer.release()
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    check_buffers(
+        DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+        )
+    )
+    check_buffers(MemoryCache(url_hasher=hash_url))
+    check_buffers(NoopCache(url_hasher=hash_url))
@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+import tempfile
+import time
+
+from genericache.digest import ContentDigest, MemoizedUrlHasher, UrlDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+OLD_PAYLOAD = b"old payload"
+NEW_PAYLOAD = b"new payload"
+
+
+class CountingHasher:
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def __call__(self, url: str) -> UrlDigest:
+        self.calls += 1
+        return hash_url(url)
+
+
+def old_fetcher(url: str) -> Iterable[bytes]:
+    return [OLD_PAYLOAD]
+
+
+def fail_fetch(url: str) -> Iterable[bytes]:
+    raise AssertionError("should have been served from the cache")
+
+
+def refetch_in_other_process(cache_dir: Path, started_marker: Path, delay: float):
+    def slow_fetcher(url: str) -> Iterable[bytes]:
+        started_marker.touch()
+        time.sleep(delay)
+        return [NEW_PAYLOAD]
+
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    _ = cache.fetch("url", slow_fetcher, force_refetch=True)
+
+
+def record_stats_in_other_process(cache_dir: Path) -> None:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    index = cache._index  # pyright: ignore[reportPrivateUsage]
+    index.record_failure(
+        hash_url("failing"), failed_at=time.time(), reason="test", max_count=10
+    )
+    row = index.newest_by_url(hash_url("url"))
+    assert row is not None
+    index.touch(row.rel_path)
+    index.flush_accesses()
+
+
+def wait_for(path: Path) -> None:
+    while not path.exists():
+        time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    digest = ContentDigest(bytes(range(32)))
+    assert ContentDigest.parse(hexdigest=str(digest)) == digest
+    assert str(digest) == bytes(range(32)).hex()
+    for bad in ["zz" * 32, "00 " * 21 + "0", "0" * 63]:
+        try:
+            _ = UrlDigest.parse(hexdigest=bad)
+            raise AssertionError(f"should have rejected {bad!r}")
+        except ValueError:
+            pass
+
+    counting = CountingHasher()
+    memoized = MemoizedUrlHasher(counting)
+    assert memoized("a") == memoized("a") == hash_url("a")
+    assert counting.calls == 1
+    unhashable_hasher = MemoizedUrlHasher[List[str]](lambda url: hash_url(url[0]))
+    assert unhashable_hasher(["a"]) == hash_url("a")
+
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        counting = CountingHasher()
+        cache = DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir.name), url_hasher=counting
+        )
+        assert cache.fetch("url", old_fetcher).read() == OLD_PAYLOAD
+        for _ in range(10):
+            entry = cache.get_by_url(url="url")
+            assert entry is not None and entry.read() == OLD_PAYLOAD
+        assert counting.calls == 1
+
+        # remembered entries are served without querying the index
+        index = cache._index  # pyright: ignore[reportPrivateUsage]
+        conn = index._conn  # pyright: ignore[reportPrivateUsage]
+        assert conn is not None
+        statements: List[str] = []
+        conn.set_trace_callback(statements.append)
+        for _ in range(10):
+            entry = cache.get_by_url(url="url")
+            assert entry is not None and entry.read() == OLD_PAYLOAD
+        conn.set_trace_callback(None)
+        assert [s for s in statements if s.startswith("SELECT")] == [], statements
+
+        # writes that don't add, move or remove entries keep them remembered
+        generation = index.generation()
+        pp.submit(record_stats_in_other_process, Path(cache_dir.name)).result()
+        assert index.generation() == generation
+
+        # a warm hit doesn't wait on the lock of a URL that is being refetched...
+        started_marker = Path(cache_dir.name) / "refetch_started"
+        refetch = pp.submit(
+            refetch_in_other_process, Path(cache_dir.name), started_marker, 1.5
+        )
+        wait_for(started_marker)
+        start = time.monotonic()
+        assert cache.fetch("url", fail_fetch).read() == OLD_PAYLOAD
+        assert time.monotonic() - start < 1.0
+        refetch.result()
+
+        # ...and sees the new entry once the other process has indexed it
+        entry = cache.get_by_url(url="url")
+        assert entry is not None and entry.read() == NEW_PAYLOAD
+        assert cache.fetch("url", fail_fetch).read() == NEW_PAYLOAD
+
+    # entries deleted behind the cache's back are forgotten
+    for path in Path(cache_dir.name).glob("entry__url_*"):
+        path.unlink()
+    assert cache.get_by_url(url="url") is None
+    assert cache.fetch("url", old_fetcher).read() == OLD_PAYLOAD
+    assert counting.calls == 1
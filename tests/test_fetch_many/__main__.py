@@ -0,0 +1,68 @@
+from collections import Counter
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List
+import tempfile
+
+from genericache import Cache, CacheEntry, FetchInterrupted, MemoryCache
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+PAYLOADS: List[bytes] = [bytes([i]) * 1000 for i in range(10)]
+BROKEN_URL = "7"
+
+
+class CountingFetcher:
+    def __init__(self) -> None:
+        super().__init__()
+        self.counts: "Counter[str]" = Counter()
+        self._lock = Lock()
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        with self._lock:
+            self.counts[url] += 1
+        if url == BROKEN_URL:
+            raise ConnectionError("unreachable")
+        return [PAYLOADS[int(url)]]
+
+
+def check_fetch_many(cache: Cache[str]) -> None:
+    fetcher = CountingFetcher()
+    urls = [str(i % len(PAYLOADS)) for i in range(30)]
+    results: Dict[str, object] = {}
+    for url, result in cache.fetch_many(urls, fetcher, max_concurrency=4, retries=2):
+        assert url not in results, "each distinct url must be yielded once"
+        results[url] = result
+    assert sorted(results.keys()) == sorted(set(urls))
+
+    broken = results.pop(BROKEN_URL)
+    assert isinstance(broken, FetchInterrupted)
+    assert fetcher.counts[BROKEN_URL] == 2
+    for url, result in results.items():
+        assert isinstance(result, CacheEntry)
+        assert result.read() == PAYLOADS[int(url)]
+        assert fetcher.counts[url] == 1
+    assert cache.misses() == sum(fetcher.counts.values())
+
+    # everything but the broken url is a hit now
+    hits_before = cache.hits()
+    again = dict(cache.fetch_many(urls, fetcher, retries=1))
+    assert fetcher.counts[BROKEN_URL] == 3
+    assert all(fetcher.counts[url] == 1 for url in results)
+    assert all(isinstance(again[url], CacheEntry) for url in results)
+    assert cache.hits() - hits_before == len(PAYLOADS) - 1
+
+    # forced refetches go through the fetcher again
+    _ = list(cache.fetch_many(["0", "1"], fetcher, force_refetch=True))
+    assert fetcher.counts["0"] == 2 and fetcher.counts["1"] == 2
+
+
+if __name__ == "__main__":
+    check_fetch_many(MemoryCache(url_hasher=hash_url))
+
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    check_fetch_many(
+        DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+        )
+    )
@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List
+import asyncio
+import tempfile
+import threading
+import time
+
+from genericache import (
+    Cache,
+    CacheEntry,
+    Freshness,
+    MemoryCache,
+    NeverExpire,
+    StreamingEntry,
+    TieredCache,
+    Ttl,
+)
+from genericache.async_cache import AsyncMemoryCache
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+
+class VersionedFetcher:
+    """Serves a new version of every URL on each fetch, after `delay` seconds"""
+
+    def __init__(self, delay: float = 0) -> None:
+        super().__init__()
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.fetches = 0
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        with self.lock:
+            self.fetches += 1
+            version = self.fetches
+        time.sleep(self.delay)
+        return [f"{url} v{version}".encode()]
+
+    async def fetch_async(self, url: str) -> AsyncIterator[bytes]:
+        for chunk in self(url):
+            yield chunk
+
+
+def wait_until_fetched(fetcher: VersionedFetcher, fetches: int) -> None:
+    deadline = time.monotonic() + 5
+    while fetcher.fetches < fetches:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def check_ttl(cache: Cache[str]) -> None:
+    fetcher = VersionedFetcher()
+    assert cache.fetch("a", fetcher).read() == b"a v1"
+    assert cache.fetch("a", fetcher).read() == b"a v1"
+    time.sleep(0.35)
+    hits, misses = cache.hits(), cache.misses()
+    assert cache.fetch("a", fetcher).read() == b"a v2"  # expired, refetched in place
+    assert (cache.hits(), cache.misses()) == (hits, misses + 1)  # not served first
+    assert cache.fetch("a", fetcher).read() == b"a v2"
+    # per-call policies override the cache's
+    assert cache.fetch("a", fetcher, freshness=Ttl(0)).read() == b"a v3"
+    time.sleep(0.35)
+    assert cache.fetch("a", fetcher, freshness=NeverExpire()).read() == b"a v3"
+    assert fetcher.fetches == 3
+
+
+def check_stale_while_revalidate(cache: Cache[str]) -> None:
+    policy = Ttl(0.5, stale_while_revalidate=60)
+    fetcher = VersionedFetcher(delay=0.3)
+    assert cache.fetch("b", fetcher, freshness=policy).read() == b"b v1"
+    time.sleep(0.55)
+
+    def fetch_stale(_: int) -> bytes:
+        return cache.fetch("b", fetcher, freshness=policy).read()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(fetch_stale, range(16))) == [b"b v1"] * 16
+    assert time.monotonic() - started < 0.25  # didn't wait for the refetch
+    wait_until_fetched(fetcher, 2)
+    time.sleep(0.45)
+    assert fetcher.fetches == 2  # a single background refetch
+    assert cache.fetch("b", fetcher, freshness=policy).read() == b"b v2"
+
+    # past the stale window, entries are refetched before being served
+    assert cache.fetch("b", fetcher, freshness=Ttl(0)).read() == b"b v3"
+
+
+async def check_async() -> None:
+    cache = AsyncMemoryCache(MemoryCache[str](url_hasher=hash_url))
+    fetcher = VersionedFetcher()
+    policy = Ttl(0.2, stale_while_revalidate=60)
+    assert (await cache.fetch("c", fetcher.fetch_async, freshness=policy)).read() == (
+        b"c v1"
+    )
+    await asyncio.sleep(0.25)
+    stale = await cache.fetch("c", fetcher.fetch_async, freshness=policy)
+    assert stale.read() == b"c v1"
+    while fetcher.fetches < 2:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    fresh = await cache.fetch("c", fetcher.fetch_async, freshness=policy)
+    assert fresh.read() == b"c v2"
+
+
+if __name__ == "__main__":
+    policy = Ttl(10, stale_while_revalidate=5)
+    assert policy.judge(age=9) is Freshness.FRESH
+    assert policy.judge(age=12) is Freshness.STALE
+    assert policy.judge(age=15) is Freshness.EXPIRED
+    assert NeverExpire().judge(age=1e9) is Freshness.FRESH
+
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        caches: List[Cache[str]] = [
+            MemoryCache(url_hasher=hash_url, freshness=Ttl(0.3)),
+            DiskCache[str].create(
+                url_type=str,
+                cache_dir=Path(cache_dir) / "disk",
+                url_hasher=hash_url,
+                freshness=Ttl(0.3),
+            ),
+            TieredCache(
+                memory=MemoryCache(url_hasher=hash_url),
+                disk=DiskCache[str].create(
+                    url_type=str,
+                    cache_dir=Path(cache_dir) / "tiered",
+                    url_hasher=hash_url,
+                ),
+                freshness=Ttl(0.3),
+            ),
+        ]
+        for cache in caches:
+            check_ttl(cache)
+            check_stale_while_revalidate(cache)
+
+        # entries promoted into memory keep the time they were fetched at
+        tiered = caches[2]
+        assert isinstance(tiered, TieredCache)
+        disk_entry = tiered.disk.get_by_url(url="a")
+        memory_entry = tiered.memory.get_by_url(url="a")
+        assert disk_entry is not None and memory_entry is not None
+        assert memory_entry.timestamp == disk_entry.timestamp
+
+        # streaming fetches and batches judge their entries too
+        disk = caches[1]
+        assert isinstance(disk, DiskCache)
+        fetcher = VersionedFetcher()
+        _ = disk.fetch("d", fetcher)
+        _ = disk.fetch("e", fetcher)
+        time.sleep(0.35)
+        streamed = disk.fetch_streaming("d", fetcher)
+        assert isinstance(streamed, StreamingEntry)
+        assert streamed.read() == b"d v3"
+        # judging a cached entry doesn't leave it open
+        fds = Path("/proc/self/fd")
+        open_fds = len(list(fds.iterdir())) if fds.is_dir() else 0
+        with disk.fetch_streaming("d", fetcher):
+            pass
+        assert (len(list(fds.iterdir())) if fds.is_dir() else 0) == open_fds
+        results = {
+            url: result.read()
+            for url, result in disk.fetch_many(["d", "e"], fetcher)
+            if isinstance(result, CacheEntry)
+        }
+        assert results == {"d": b"d v3", "e": b"e v4"}  # "d" is still fresh
+        assert fetcher.fetches == 4
+
+    asyncio.run(check_async())
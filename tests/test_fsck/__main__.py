@@ -0,0 +1,117 @@
+from pathlib import Path
+from typing import List, Tuple
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from genericache import CacheReadOnly
+from genericache.disk_cache import DiskCache
+from tests import PayloadFetcher, hash_url
+
+PAYLOADS: List[bytes] = [bytes([i]) * (3 * 1024 * 1024 + i) for i in range(4)]
+fetch_payload = PayloadFetcher(PAYLOADS)
+
+
+def entry_file(cache_dir: Path, url: str) -> Path:
+    return next(cache_dir.glob(f"entry__url_{hash_url(url)}_*"))
+
+
+def snapshot(cache_dir: Path) -> List[Tuple[str, int]]:
+    """The paths in `cache_dir`, with their modification times"""
+    return sorted((str(p), p.lstat().st_mtime_ns) for p in cache_dir.rglob("*"))
+
+
+def fsck(cache_dir: Path, *args: str) -> int:
+    return subprocess.run(
+        [sys.executable, "-m", "genericache.fsck", str(cache_dir), *args],
+        stdout=subprocess.DEVNULL,
+    ).returncode
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache_path = Path(cache_dir.name)
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_path, url_hasher=hash_url
+    )
+    for url in ["0", "1", "2", "3", "3-mirror"]:
+        _ = cache.fetch(url, fetch_payload)
+
+    # a healthy cache has nothing to report
+    report = cache.verify(max_workers=2)
+    assert report.checked_entries == 5 and report.corrupt == []
+    # the mirror shares the file of "3", which is only hashed once
+    assert report.bytes_hashed == sum(len(p) for p in PAYLOADS)
+    assert report.throughput > 0
+    assert fsck(cache_path) == 0
+
+    # truncated and emptied files are found, without changing anything
+    with open(entry_file(cache_path, "1"), "r+b") as file:
+        _ = file.truncate(1000)
+    _ = entry_file(cache_path, "3").write_bytes(b"")
+    report = cache.verify(max_workers=2)
+    corrupt = sorted(path.name for path, _ in report.corrupt)
+    expected = sorted(
+        entry_file(cache_path, url).name for url in ["1", "3", "3-mirror"]
+    )
+    assert corrupt == expected, report
+    assert entry_file(cache_path, "1").exists()
+    shutil.rmtree(cache.staging_dir)
+    contents = snapshot(cache_path)
+    assert fsck(cache_path) == 1
+    assert snapshot(cache_path) == contents
+    read_only = DiskCache[str].open_read_only(cache_dir=cache_path, url_hasher=hash_url)
+    assert len(read_only.verify(max_workers=2).corrupt) == 3
+    for write in (
+        lambda: read_only.fetch("4", fetch_payload),
+        lambda: read_only.repair(max_workers=2),
+    ):
+        try:
+            _ = write()
+            raise AssertionError("a read-only cache should refuse to write")
+        except CacheReadOnly:
+            pass
+    assert snapshot(cache_path) == contents
+    cache.staging_dir.mkdir()
+
+    # ...and quarantined by a repair, along with stale locks and staging files
+    stale_lock = cache_path / f"downloading_url_{hash_url('gone')}.lock"
+    stale_lock.touch()
+    os.utime(stale_lock, (time.time() - 7200, time.time() - 7200))
+    staging_file = cache.staging_dir / f"{cache.STAGING_PREFIX}{hash_url('crashed')}_x"
+    staging_file.touch()
+    report = cache.repair(max_workers=2)
+    assert report.removed_entries == 3
+    assert report.removed_locks == 1 and not stale_lock.exists()
+    assert report.removed_staging_files == 1 and not staging_file.exists()
+    assert len(list((cache_path / cache.QUARANTINE_DIR_NAME).iterdir())) == 3
+    assert cache.verify(max_workers=2).corrupt == []
+
+    # repaired entries are fetched again
+    misses = cache.misses()
+    assert cache.fetch("1", fetch_payload).read() == PAYLOADS[1]
+    assert cache.misses() == misses + 1
+
+    # the command line tool repairs too
+    _ = entry_file(cache_path, "2").write_bytes(b"garbage")
+    assert fsck(cache_path, "--repair", "--delete", "--workers", "2") == 0
+    assert fsck(cache_path) == 0
+    assert len(list((cache_path / cache.QUARANTINE_DIR_NAME).iterdir())) == 3
+
+    # entries that link to a corrupt blob are all corrupt, and the blob is collected
+    symlinks_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    symlinks_path = Path(symlinks_dir.name)
+    symlinked = DiskCache[str].create(
+        url_type=str, cache_dir=symlinks_path, url_hasher=hash_url, use_symlinks=True
+    )
+    for url in ["0", "0-mirror", "1"]:
+        _ = symlinked.fetch(url, fetch_payload)
+    blob = entry_file(symlinks_path, "0").resolve()
+    _ = blob.write_bytes(b"garbage")
+    report = symlinked.repair(quarantine=False, max_workers=2)
+    assert report.removed_entries == 2, report
+    assert not blob.exists()
+    assert symlinked.fetch("0-mirror", fetch_payload).read() == PAYLOADS[0]
@@ -0,0 +1,94 @@
+from hashlib import blake2b, sha256
+import subprocess
+import sys
+from pathlib import Path
+from typing import Iterable
+import tempfile
+
+from genericache import Blake2bHasher, MemoryCache, NoopCache
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from genericache.hashing import PipelinedHash, Sha256Hasher
+from tests import PayloadFetcher, hash_url
+
+PAYLOAD = bytes(range(256)) * 16 * 1024  # 4MiB, enough to hash in the background
+fetch_payload = PayloadFetcher([PAYLOAD], chunk_size=64 * 1024)
+
+
+def fetch_reused_buffer(url: str) -> Iterable[bytes]:
+    buffer = bytearray(64 * 1024)
+    for i in range(0, len(PAYLOAD), len(buffer)):
+        buffer[:] = PAYLOAD[i : i + len(buffer)]
+        yield buffer  # pyright: ignore[reportReturnType]
+
+
+BLAKE2B_DIGEST = ContentDigest(blake2b(PAYLOAD, digest_size=32).digest(), "blake2b")
+SHA256_DIGEST = ContentDigest(sha256(PAYLOAD).digest())
+
+
+def fetch_with_sha256(cache_dir: Path) -> None:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    # entries hashed with blake2b by the parent process are served as they are
+    assert cache.fetch("a", fetch_payload).content_digest == BLAKE2B_DIGEST
+    assert cache.hits() == 1
+    assert cache.fetch("b", fetch_payload).content_digest == SHA256_DIGEST
+
+
+if __name__ == "__main__":
+    # sha256 digests look like they always did, others name their algorithm
+    assert str(SHA256_DIGEST) == sha256(PAYLOAD).hexdigest()
+    assert str(BLAKE2B_DIGEST).startswith("blake2b-")
+    for digest in [SHA256_DIGEST, BLAKE2B_DIGEST]:
+        assert ContentDigest.parse(hexdigest=str(digest)) == digest
+    assert ContentDigest(BLAKE2B_DIGEST.digest) != BLAKE2B_DIGEST
+    for bad in ["abc", "blake2b-", "blake2b-xyz", "b-l-ake2b-ab", "sha256-" + "a" * 63]:
+        try:
+            _ = ContentDigest.parse(hexdigest=bad)
+            raise AssertionError(f"should have rejected {bad}")
+        except ValueError:
+            pass
+
+    # pipelined hashes keep the chunks in order, with or without a thread
+    for inline_bytes in [0, 100_000, len(PAYLOAD)]:
+        contents_hash = PipelinedHash(
+            Sha256Hasher(), inline_bytes=inline_bytes, max_pending=2
+        )
+        for chunk in fetch_reused_buffer("x"):
+            contents_hash.update(chunk)
+        assert contents_hash.content_digest() == SHA256_DIGEST
+
+    memory = MemoryCache[str](url_hasher=hash_url, content_hasher=Blake2bHasher())
+    assert memory.fetch("a", fetch_reused_buffer).content_digest == BLAKE2B_DIGEST
+    noop = NoopCache[str](url_hasher=hash_url, content_hasher=Blake2bHasher())
+    assert noop.fetch("a", fetch_payload).content_digest == BLAKE2B_DIGEST
+
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache_path = Path(cache_dir.name)
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=cache_path,
+        url_hasher=hash_url,
+        content_hasher=Blake2bHasher(),
+    )
+    assert cache.fetch("a", fetch_payload).content_digest == BLAKE2B_DIGEST
+    assert len(list(cache_path.glob(f"entry__url_*_contents_{BLAKE2B_DIGEST}"))) == 1
+
+    # expected digests are checked with their own algorithm
+    entry = cache.fetch("c", fetch_payload, force_refetch=SHA256_DIGEST)
+    assert entry.content_digest == SHA256_DIGEST
+
+    # caches hashing with different algorithms share a directory. The other one
+    # lives in another process, which is the only place it can be created
+    script = (
+        "import sys; from pathlib import Path;"
+        " from tests.test_hashing.__main__ import fetch_with_sha256;"
+        " fetch_with_sha256(Path(sys.argv[1]))"
+    )
+    _ = subprocess.run([sys.executable, "-c", script, str(cache_path)], check=True)
+    assert cache.fetch("b", fetch_payload).content_digest == SHA256_DIGEST
+    assert cache.get(digest=SHA256_DIGEST) is not None
+
+    report = cache.verify(max_workers=2)
+    assert report.checked_entries == 3 and report.corrupt == [], report
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+import tempfile
+import threading
+import time
+
+from genericache import CacheMetrics, MemoryCache, render_openmetrics
+from genericache.disk_cache import DiskCache
+from genericache.metrics import Counter, Histogram
+from tests import hash_url
+
+
+def slow_fetcher(url: str) -> Iterable[bytes]:
+    time.sleep(0.2)
+    return [url.encode("utf8"), b"-", url.encode("utf8")]
+
+
+if __name__ == "__main__":
+    counter = Counter()
+
+    def increment_many(_: int) -> None:
+        for _ in range(1000):
+            counter.inc()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        _ = list(executor.map(increment_many, range(8)))
+    assert counter.value == 8000
+
+    histogram = Histogram(buckets=[1, 0.1])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    buckets, total, count = histogram.snapshot()
+    assert buckets == [(0.1, 2), (1, 3), (float("inf"), 4)]
+    assert total == 3.65 and count == 4 and histogram.count == 4
+
+    memory_metrics = CacheMetrics()
+    memory_cache = MemoryCache(
+        url_hasher=hash_url, max_entries=1, metrics=memory_metrics
+    )
+    assert memory_cache.metrics is memory_metrics
+    barrier = threading.Barrier(4)
+
+    def fetch_after_barrier(url: str) -> int:
+        _ = barrier.wait()
+        return len(memory_cache.fetch(url, slow_fetcher).read())
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        sizes = list(executor.map(fetch_after_barrier, ["a"] * 4))
+    assert sizes == [3] * 4
+    assert memory_cache.hits() == 3 and memory_cache.misses() == 1
+    assert memory_metrics.joined_fetches.value == 3
+    assert memory_metrics.future_wait_seconds.count == 3
+    assert memory_metrics.fetch_seconds.count == 1
+    assert memory_metrics.bytes_fetched.value == 3
+    assert memory_metrics.bytes_served.value == 12
+
+    assert memory_cache.get_by_url(url="a") is not None
+    assert memory_cache.get_by_url(url="nope") is None
+    assert memory_metrics.lookup_seconds.count == 2
+    _ = memory_cache.fetch("b", slow_fetcher)
+    assert memory_metrics.evictions.value == 1
+
+    disk_metrics = CacheMetrics()
+    with tempfile.TemporaryDirectory(suffix="_cache") as cache_dir:
+        disk_cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir),
+            url_hasher=hash_url,
+            max_entries=2,
+            metrics=disk_metrics,
+        )
+        for url in ["x", "y", "z", "x"]:
+            _ = disk_cache.fetch(url, slow_fetcher)
+        assert disk_cache.misses() == 4 and disk_cache.hits() == 0
+        assert disk_metrics.evictions.value == 2
+        assert disk_metrics.file_lock_wait_seconds.count == 4
+        assert disk_metrics.bytes_fetched.value == 12
+        assert disk_metrics.bytes_served.value == 12
+        assert disk_metrics.fetch_seconds.snapshot()[1] >= 0.8
+        assert disk_cache.get_by_url(url="x") is not None
+        assert disk_metrics.lookup_seconds.count == 1
+        assert disk_metrics.bytes_served.value == 15
+
+    text = render_openmetrics({"memory": memory_metrics, 'odd"name': disk_metrics})
+    lines: List[str] = text.splitlines()
+    assert lines[-1] == "# EOF"
+    assert "# TYPE genericache_hits counter" in lines
+    assert 'genericache_hits_total{cache="memory"} 3' in lines
+    assert 'genericache_misses_total{cache="odd\\"name"} 4' in lines
+    assert 'genericache_evictions_total{cache="memory"} 1' in lines
+    assert "# TYPE genericache_fetch_seconds histogram" in lines
+    assert 'genericache_fetch_seconds_bucket{cache="memory",le="0.1"} 0' in lines
+    assert 'genericache_fetch_seconds_bucket{cache="memory",le="+Inf"} 2' in lines
+    assert 'genericache_fetch_seconds_count{cache="odd\\"name"} 4' in lines
+    assert all(
+        line.startswith("#") or line.startswith("genericache_") for line in lines
+    )
@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+import tempfile
+import time
+
+from genericache import (
+    FetchInterrupted,
+    MemoryCache,
+    NegativeCaching,
+    RecentlyFailed,
+    TieredCache,
+)
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+
+class NotFound(Exception):
+    pass
+
+
+class FailingFetcher:
+    def __init__(self, error: Exception, delay: float = 0) -> None:
+        super().__init__()
+        self.error = error
+        self.delay = delay
+        self.calls: List[str] = []
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        self.calls.append(url)
+        time.sleep(self.delay)
+        raise self.error
+
+
+def unexpected_fetch(url: str) -> Iterable[bytes]:
+    raise AssertionError(f"{url} should not have been fetched")
+
+
+def is_not_found(error: Exception) -> bool:
+    return isinstance(error, NotFound)
+
+
+def create_disk_cache(cache_dir: Path) -> "DiskCache[str]":
+    return DiskCache[str].create(
+        url_type=str,
+        cache_dir=cache_dir,
+        url_hasher=hash_url,
+        negative_caching=NegativeCaching(ttl=60),
+    )
+
+
+def fail_slowly_in_other_process(cache_dir: Path, started_marker: Path) -> None:
+    cache = create_disk_cache(cache_dir)
+    started_marker.touch()
+    try:
+        _ = cache.try_fetch("slow", FailingFetcher(NotFound("404"), delay=0.5), False)
+        raise AssertionError("should have failed")
+    except NotFound:
+        pass
+
+
+def try_in_other_process(cache_dir: Path, url: str) -> bool:
+    cache = create_disk_cache(cache_dir)
+    result = cache.try_fetch(url, unexpected_fetch, force_refetch=False)
+    return isinstance(result, RecentlyFailed)
+
+
+if __name__ == "__main__":
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        # failures are remembered until the ttl runs out, and not retried meanwhile
+        memory = MemoryCache[str](
+            url_hasher=hash_url,
+            negative_caching=NegativeCaching(ttl=0.3, max_entries=2),
+        )
+        fetcher = FailingFetcher(NotFound("404"))
+        first = memory.try_fetch("a", fetcher, force_refetch=False)
+        assert isinstance(first, FetchInterrupted)
+        assert not isinstance(first, RecentlyFailed)
+        again = memory.try_fetch("a", fetcher, force_refetch=True)
+        assert isinstance(again, RecentlyFailed) and "NotFound" in again.reason
+        started = time.monotonic()
+        try:
+            _ = memory.fetch("a", fetcher, retries=5)
+            raise AssertionError("should have failed")
+        except RecentlyFailed:
+            pass
+        assert time.monotonic() - started < 0.1
+        assert fetcher.calls == ["a"]
+        assert memory.misses() == 1
+        time.sleep(0.35)
+        assert not isinstance(
+            memory.try_fetch("a", fetcher, force_refetch=False), RecentlyFailed
+        )
+        assert fetcher.calls == ["a", "a"]
+
+        # only the most recent failures are remembered
+        for url in ["b", "c"]:
+            _ = memory.try_fetch(url, fetcher, force_refetch=False)
+        assert not isinstance(
+            memory.try_fetch("a", fetcher, force_refetch=False), RecentlyFailed
+        )
+
+        # errors that aren't worth remembering are retried as usual
+        picky = MemoryCache[str](
+            url_hasher=hash_url,
+            negative_caching=NegativeCaching(ttl=60, should_cache=is_not_found),
+        )
+        flaky = FailingFetcher(ConnectionError("reset"))
+        _ = picky.try_fetch("d", flaky, force_refetch=False)
+        _ = picky.try_fetch("d", flaky, force_refetch=False)
+        assert flaky.calls == ["d", "d"]
+
+        # failures are shared with other processes via the cache directory...
+        cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        disk = create_disk_cache(Path(cache_dir.name))
+        try:
+            _ = disk.try_fetch("e", FailingFetcher(NotFound("404")), False)
+            raise AssertionError("should have failed")
+        except NotFound:  # DiskCache raises the errors of non-resumable fetchers
+            pass
+        assert pp.submit(try_in_other_process, Path(cache_dir.name), "e").result()
+
+        # ...including those that are waiting for the failing process' lock
+        started_marker = Path(cache_dir.name) / "started"
+        failing = pp.submit(
+            fail_slowly_in_other_process, Path(cache_dir.name), started_marker
+        )
+        while not started_marker.exists():
+            time.sleep(0.01)
+        time.sleep(0.1)
+        result = disk.try_fetch("slow", unexpected_fetch, force_refetch=False)
+        assert isinstance(result, RecentlyFailed), result
+        failing.result()
+
+        # tiered caches pass the failures of their disk tier on
+        tiered = TieredCache(memory=MemoryCache(url_hasher=hash_url), disk=disk)
+        result = tiered.try_fetch("e", unexpected_fetch, force_refetch=False)
+        assert isinstance(result, RecentlyFailed)
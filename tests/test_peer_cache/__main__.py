@@ -0,0 +1,136 @@
+from datetime import datetime
+from hashlib import sha256
+from multiprocessing import Event, Process, Queue
+from multiprocessing.synchronize import Event as EventType
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import socket
+import tempfile
+
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from genericache.negative_caching import NegativeCaching
+from genericache.peer_cache import PeerCache, PeerFailed, PeerServer
+from tests import PayloadFetcher, hash_url
+
+PAYLOAD_LEN = 3 * 1024 * 1024
+PAYLOADS: List[bytes] = [bytes([i]) * PAYLOAD_LEN for i in range(4)]
+fetch_payload = PayloadFetcher(PAYLOADS)
+
+
+def unexpected_fetch(url: str) -> Iterable[bytes]:
+    raise AssertionError(f"{url} should have been fetched from a peer")
+
+
+def serve_as_peer(
+    cache_dir: Path,
+    urls: List[str],
+    corrupt: bool,
+    addresses: "Queue[Tuple[bool, str]]",
+    stop: EventType,
+) -> None:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    for url in urls:
+        _ = cache.fetch(url, fetch_payload)
+        if corrupt:  # the contents no longer match the digest in the file name
+            entry_path = next(cache_dir.glob(f"entry__url_{hash_url(url)}_*"))
+            _ = entry_path.write_bytes(b"x" * PAYLOAD_LEN)
+    with PeerServer(cache) as server:
+        addresses.put((corrupt, server.address))
+        _ = stop.wait()
+
+
+def unused_address() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+if __name__ == "__main__":
+    stop = Event()
+    addresses: "Queue[Tuple[bool, str]]" = Queue()
+    peer_dirs = [tempfile.TemporaryDirectory(suffix="_peer") for _ in range(2)]
+    peers = [
+        Process(
+            target=serve_as_peer,
+            args=(Path(peer_dirs[0].name), ["1"], True, addresses, stop),
+        ),
+        Process(
+            target=serve_as_peer,
+            args=(Path(peer_dirs[1].name), ["0", "1"], False, addresses, stop),
+        ),
+    ]
+    for peer in peers:
+        peer.start()
+    peer_by_corruption: Dict[bool, str] = dict(addresses.get(timeout=30) for _ in peers)
+    corrupt_peer, good_peer = peer_by_corruption[True], peer_by_corruption[False]
+    try:
+        cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        local = DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+        )
+        cache = PeerCache(local=local, peers=[unused_address(), good_peer])
+
+        # misses are filled by whichever peer has the entry, skipping unreachable ones
+        asked_at = datetime.now()
+        assert cache.fetch("0", unexpected_fetch).read() == PAYLOADS[0]
+        assert cache.peer_hits() == 1 and cache.misses() == 1
+        fetched_at = cache.fetched_at(url="0")  # by the peer, not by this cache
+        assert fetched_at is not None and fetched_at < asked_at
+        local._index.rebuild()  # pyright: ignore[reportPrivateUsage]
+        assert cache.fetched_at(url="0") == fetched_at
+        assert cache.fetch("0", unexpected_fetch).read() == PAYLOADS[0]
+        assert cache.peer_hits() == 1 and cache.hits() == 1
+
+        # ...and fetched for real when no peer has it
+        assert cache.fetch("2", fetch_payload).read() == PAYLOADS[2]
+        assert cache.peer_hits() == 1
+        fetched_at = cache.fetched_at(url="2")
+        assert fetched_at is not None and fetched_at >= asked_at
+
+        # expected contents are asked for by their digest, whatever the URL
+        digest = ContentDigest(digest=sha256(PAYLOADS[1]).digest())
+        entry = cache.fetch("mirror-of-1", unexpected_fetch, force_refetch=digest)
+        assert entry.content_digest == digest and cache.peer_hits() == 2
+
+        # forced refetches never go to peers
+        _ = cache.fetch("0", fetch_payload, force_refetch=True)
+        assert cache.peer_hits() == 2
+
+        # contents that don't match their digest are never stored, and the retry
+        # goes to the next peer
+        other_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        other = PeerCache(
+            local=DiskCache[str].create(
+                url_type=str, cache_dir=Path(other_dir.name), url_hasher=hash_url
+            ),
+            peers=[corrupt_peer, good_peer],
+        )
+        entry = other.fetch("1", unexpected_fetch)
+        assert entry.read() == PAYLOADS[1] and entry.content_digest == digest
+        assert other.peer_hits() == 1 and other.misses() == 2
+        _ = other.fetch("mirror-of-1", unexpected_fetch, force_refetch=digest)
+        assert other.peer_hits() == 2  # without asking the corrupt peer again
+
+        # peers failing is not remembered as a failure of the URL
+        negative_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        negative = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(negative_dir.name),
+            url_hasher=hash_url,
+            negative_caching=NegativeCaching(ttl=3600),
+        )
+        only_corrupt = PeerCache(local=negative, peers=[corrupt_peer], peer_backoff=0)
+        try:
+            _ = only_corrupt.try_fetch("1", unexpected_fetch, force_refetch=False)
+            assert False, "the corrupt peer should have failed the fetch"
+        except PeerFailed:
+            pass
+        entry = negative.try_fetch("1", fetch_payload, force_refetch=False)
+        assert not isinstance(entry, Exception) and entry.read() == PAYLOADS[1]
+    finally:
+        stop.set()
+        for peer in peers:
+            peer.join()
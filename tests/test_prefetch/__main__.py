@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+import threading
+import time
+
+from genericache import MemoryCache, Prefetcher
+from tests import hash_url
+
+
+class GatedFetcher:
+    """Fetches of `gated_url` block until `gate` is set"""
+
+    def __init__(self, gated_url: str) -> None:
+        super().__init__()
+        self.gated_url = gated_url
+        self.gate = threading.Event()
+        self.calls: List[str] = []
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        self.calls.append(url)
+        if url == self.gated_url:
+            _ = self.gate.wait()
+        return [url.encode("utf8")]
+
+
+def wait_until(condition: "Callable[[], bool]") -> None:
+    deadline = time.monotonic() + 10
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    cache = MemoryCache[str](url_hasher=hash_url)
+    fetcher = GatedFetcher("a")
+    prefetcher = Prefetcher(cache, max_workers=1)
+    assert cache.prefetch(["a"], fetcher) is prefetcher
+    wait_until(lambda: prefetcher.in_flight() == 1)
+
+    # queued by priority, and returning right away
+    _ = cache.prefetch(["b", "c"], fetcher)
+    _ = cache.prefetch(["d"], fetcher, priority=5)
+    _ = cache.prefetch(["b", "d"], fetcher)  # already queued
+    assert prefetcher.queue_depth() == 3
+    assert fetcher.calls == ["a"]
+
+    # foreground fetches take queued URLs off the queue...
+    assert cache.fetch("c", fetcher).read() == b"c"
+    assert prefetcher.queue_depth() == 2 and prefetcher.cancelled() == 1
+
+    # ...and wait for those being prefetched instead of fetching them again
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        waiting = pool.submit(lambda: cache.fetch("a", fetcher).read())
+        time.sleep(0.1)
+        assert not waiting.done()
+        fetcher.gate.set()
+        assert waiting.result() == b"a"
+
+    wait_until(lambda: prefetcher.queue_depth() == 0 and prefetcher.in_flight() == 0)
+    assert fetcher.calls == ["a", "c", "d", "b"]
+    assert prefetcher.completed() == 3 and prefetcher.failed() == 0
+    assert cache.misses() == 4
+
+    # prefetched URLs are served from the cache
+    assert cache.fetch("b", fetcher).read() == b"b"
+    assert fetcher.calls == ["a", "c", "d", "b"]
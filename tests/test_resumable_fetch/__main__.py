@@ -0,0 +1,140 @@
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, List
+import tempfile
+
+from genericache import NegativeCaching, RecentlyFailed, ResumableFetcher
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+CHUNK_SIZE = 1000
+PAYLOAD = bytes(range(256)) * 40
+
+
+class FlakyFetcher(ResumableFetcher[str]):
+    """Drops the connection after `chunks_per_attempt` chunks, `failures` times"""
+
+    def __init__(self, *, chunks_per_attempt: int, failures: int) -> None:
+        super().__init__()
+        self.chunks_per_attempt = chunks_per_attempt
+        self.failures = failures
+        self.offsets: List[int] = []
+        self.bytes_served = 0
+
+    def _serve(self, offset: int) -> Iterable[bytes]:
+        self.offsets.append(offset)
+        for served, start in enumerate(range(offset, len(PAYLOAD), CHUNK_SIZE)):
+            if self.failures and served == self.chunks_per_attempt:
+                self.failures -= 1
+                raise ConnectionError("connection reset")
+            chunk = PAYLOAD[start : start + CHUNK_SIZE]
+            self.bytes_served += len(chunk)
+            yield chunk
+
+    def __call__(self, url: str, /) -> Iterable[bytes]:
+        return self._serve(0)
+
+    def resume(self, url: str, offset: int, /) -> Iterable[bytes]:
+        return self._serve(offset)
+
+
+def fail_fetch(url: str) -> Iterable[bytes]:
+    yield PAYLOAD[:CHUNK_SIZE]
+    raise ConnectionError("connection reset")
+
+
+def fetcher_failing_for_good() -> FlakyFetcher:
+    return FlakyFetcher(chunks_per_attempt=1, failures=1000)
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+    )
+
+    # retries of `fetch` continue where the previous attempt stopped
+    fetcher = FlakyFetcher(chunks_per_attempt=3, failures=2)
+    entry = cache.fetch("flaky", fetcher=fetcher, retries=3)
+    assert entry.read() == PAYLOAD
+    assert entry.content_digest == ContentDigest(sha256(PAYLOAD).digest())
+    assert fetcher.offsets == [0, 3 * CHUNK_SIZE, 6 * CHUNK_SIZE]
+    assert fetcher.bytes_served == len(PAYLOAD)
+    assert list(cache.staging_dir.iterdir()) == []
+
+    # progress survives running out of retries, and the next fetch picks it up
+    fetcher = FlakyFetcher(chunks_per_attempt=2, failures=2)
+    try:
+        _ = cache.fetch("flakier", fetcher=fetcher, retries=2)
+        assert False, "retries should have run out"
+    except RuntimeError:
+        pass
+    assert [
+        p.name.startswith(cache.PARTIAL_PREFIX) for p in cache.staging_dir.iterdir()
+    ] == [True]
+    entry = cache.fetch("flakier", fetcher=fetcher)
+    assert entry.read() == PAYLOAD
+    assert fetcher.offsets == [0, 2 * CHUNK_SIZE, 4 * CHUNK_SIZE]
+    assert fetcher.bytes_served == len(PAYLOAD)
+
+    # fetchers that can't resume still start over and don't leave anything behind
+    try:
+        _ = cache.fetch("plain", fetcher=fail_fetch)
+        assert False, "the fetch should have failed"
+    except ConnectionError:
+        pass
+    assert list(cache.staging_dir.iterdir()) == []
+
+    # forced refetches don't resume from bytes fetched before them
+    fetcher = FlakyFetcher(chunks_per_attempt=2, failures=1)
+    try:
+        _ = cache.fetch("forced", fetcher=fetcher, retries=1)
+        assert False, "retries should have run out"
+    except RuntimeError:
+        pass
+    entry = cache.fetch("forced", fetcher=fetcher, force_refetch=True)
+    assert entry.read() == PAYLOAD
+    assert fetcher.offsets == [0, 0]
+
+    # kept partial files count towards the bounds, and are cleaned up once stale
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=Path(cache_dir.name),
+        url_hasher=hash_url,
+        max_bytes=len(PAYLOAD) + 4 * CHUNK_SIZE,
+        negative_caching=NegativeCaching(ttl=60),
+    )
+    _ = cache.fetch("whole", fetcher=FlakyFetcher(chunks_per_attempt=0, failures=0))
+    fetcher = FlakyFetcher(chunks_per_attempt=5, failures=1)
+    try:
+        _ = cache.fetch("partial", fetcher=fetcher, retries=1)
+        assert False, "retries should have run out"
+    except RuntimeError:
+        pass
+    assert cache.evict() == 1
+    assert cache.get_by_url(url="whole") is None
+    # nor are resumable failures remembered, since the next attempt resumes
+    assert cache.fetch("partial", fetcher=fetcher).read() == PAYLOAD
+    assert fetcher.offsets == [0, 5 * CHUNK_SIZE]
+
+    try:
+        _ = cache.fetch("abandoned", fetcher=fetcher_failing_for_good(), retries=1)
+        assert False, "retries should have run out"
+    except RuntimeError:
+        pass
+    assert cache.clean_staging_dir() == 0
+    assert cache.clean_staging_dir(stale_partial_age=0) == 1
+    assert list(cache.staging_dir.iterdir()) == []
+
+    # resumable fetches that fail before any byte arrives are remembered as usual
+    fetcher = FlakyFetcher(chunks_per_attempt=0, failures=1)
+    try:
+        _ = cache.try_fetch("missing", fetcher, force_refetch=False)
+        assert False, "the fetch should have failed"
+    except ConnectionError:
+        pass
+    assert isinstance(cache.try_fetch("missing", fetcher, False), RecentlyFailed)
+    assert fetcher.offsets == [0]
+    assert list(cache.staging_dir.iterdir()) == []
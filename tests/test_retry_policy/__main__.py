@@ -0,0 +1,125 @@
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+import tempfile
+import time
+
+from genericache import (
+    DigestMismatch,
+    ExponentialBackoff,
+    FetchAttempt,
+    FetchInterrupted,
+    MemoryCache,
+    RetriesExhausted,
+    RetryPolicy,
+)
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+PAYLOAD = b"retried payload"
+
+
+class FailingFetcher:
+    def __init__(self, failures: int) -> None:
+        super().__init__()
+        self.failures = failures
+        self.calls: List[float] = []
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        self.calls.append(time.monotonic())
+        if len(self.calls) <= self.failures:
+            raise ConnectionError(f"attempt {len(self.calls)} failed")
+        return [PAYLOAD]
+
+
+class RecordingPolicy(RetryPolicy):
+    def __init__(self) -> None:
+        super().__init__()
+        self.seen: List[Sequence[FetchAttempt]] = []
+
+    def should_retry(self, error: Exception) -> bool:
+        return True
+
+    def next_delay(
+        self, *, attempts: Sequence[FetchAttempt], elapsed: float
+    ) -> Optional[float]:
+        self.seen.append(list(attempts))
+        return 0 if len(attempts) < 4 else None
+
+
+if __name__ == "__main__":
+    no_jitter = ExponentialBackoff(
+        max_attempts=5, base_delay=0.1, max_delay=0.3, jitter=False
+    )
+    attempt = FetchAttempt(error=FetchInterrupted(url="x"), started=0, duration=0)
+    delays = [
+        no_jitter.next_delay(attempts=[attempt] * n, elapsed=0) for n in range(1, 6)
+    ]
+    assert delays == [0.1, 0.2, 0.3, 0.3, None]
+    jittered = ExponentialBackoff(base_delay=1)
+    for _ in range(100):
+        delay = jittered.next_delay(attempts=[attempt, attempt], elapsed=0)
+        assert delay is not None and 0 <= delay <= 2
+    with_deadline = ExponentialBackoff(base_delay=1, jitter=False, deadline=1.5)
+    assert with_deadline.next_delay(attempts=[attempt], elapsed=0) == 1
+    assert with_deadline.next_delay(attempts=[attempt], elapsed=0.6) is None
+
+    # retries are spread out by the policy
+    cache: MemoryCache[str] = MemoryCache(url_hasher=hash_url)
+    fetcher = FailingFetcher(failures=2)
+    policy = ExponentialBackoff(max_attempts=3, base_delay=0.05, jitter=False)
+    assert cache.fetch("a", fetcher, retry_policy=policy).read() == PAYLOAD
+    gaps = [b - a for a, b in zip(fetcher.calls, fetcher.calls[1:])]
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1
+
+    # giving up reports every attempt
+    fetcher = FailingFetcher(failures=10)
+    try:
+        _ = cache.fetch("b", fetcher, retry_policy=policy)
+        assert False, "retries should have run out"
+    except Exception as e:
+        assert isinstance(e, RetriesExhausted)
+        assert isinstance(e, FetchInterrupted) and isinstance(e, RuntimeError)
+        assert len(e.attempts) == 3
+        assert all(isinstance(a.error, FetchInterrupted) for a in e.attempts)
+        assert [a.started for a in e.attempts] == sorted(a.started for a in e.attempts)
+        assert "attempt 3 failed" in repr(e.attempts[-1].error.__cause__)
+    assert len(fetcher.calls) == 3
+
+    # DiskCache raises fetcher errors, which are only retried if the policy says so
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    disk = DiskCache[str].create(
+        url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+    )
+    fetcher = FailingFetcher(failures=1)
+    try:
+        _ = disk.fetch("c", fetcher)
+        assert False, "ConnectionError is not retried by default"
+    except ConnectionError:
+        pass
+    retry_connection_errors = ExponentialBackoff(
+        base_delay=0.01, retry_on=lambda e: isinstance(e, (FetchInterrupted, OSError))
+    )
+    fetcher = FailingFetcher(failures=2)
+    entry = disk.fetch("c", fetcher, retry_policy=retry_connection_errors)
+    assert entry.read() == PAYLOAD
+
+    # errors that aren't retried are raised as they are
+    fetcher = FailingFetcher(failures=0)
+    try:
+        _ = cache.fetch(
+            "d", fetcher, force_refetch=ContentDigest(sha256(b"other").digest())
+        )
+        assert False, "digest should not match"
+    except DigestMismatch:
+        pass
+    assert len(fetcher.calls) == 1
+
+    recording = RecordingPolicy()
+    fetcher = FailingFetcher(failures=10)
+    try:
+        _ = cache.fetch("e", fetcher, retry_policy=recording)
+    except RetriesExhausted:
+        pass
+    assert [len(attempts) for attempts in recording.seen] == [1, 2, 3, 4]
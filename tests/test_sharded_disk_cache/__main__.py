@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+import tempfile
+
+from genericache import CacheLayoutMismatch
+from genericache.disk_cache import DiskCache
+from tests import PAYLOADS, fetch_payload, hash_url
+
+
+def fail_fetch(url: str) -> Iterable[bytes]:
+    raise RuntimeError(f"Should not have fetched {url}")
+
+
+def populate(cache_dir: Path, sharded: bool, indices: List[int]) -> int:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url, sharded=sharded
+    )
+    for idx in indices:
+        _ = cache.fetch(str(idx), fetcher=fetch_payload)
+    return cache.misses()
+
+
+def check_all_cached(cache_dir: Path) -> int:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url, sharded=True
+    )
+    for idx, payload in enumerate(PAYLOADS):
+        entry = cache.get_by_url(url=str(idx))
+        assert entry is not None
+        assert entry.read() == payload
+        assert cache.fetch(str(idx), fetcher=fail_fetch).read() == payload
+    return cache.hits()
+
+
+def open_flat(cache_dir: Path) -> bool:
+    out = DiskCache[str].try_create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url, sharded=False
+    )
+    return isinstance(out, CacheLayoutMismatch)
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache_path = Path(cache_dir.name)
+
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(populate, cache_path, False, [0, 1, 2, 3, 4]).result() == 5
+    assert len(list(cache_path.glob("entry__*"))) == 5
+
+    # opening with sharding migrates the flat entries and adds new ones to shards
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(populate, cache_path, True, [5, 6, 7, 8, 9]).result() == 5
+    assert len(list(cache_path.glob("entry__*"))) == 0
+    assert len(list(cache_path.glob("*/*/entry__*"))) == len(PAYLOADS)
+    assert len(list(cache_path.glob("*/*/downloading_url_*.lock"))) == 5
+
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(check_all_cached, cache_path).result() == len(PAYLOADS)
+
+    # the index is rebuilt from the sharded layout too
+    for index_file in cache_path.glob("index.sqlite3*"):
+        index_file.unlink()
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(check_all_cached, cache_path).result() == len(PAYLOADS)
+
+    with ProcessPoolExecutor(max_workers=1) as pp:
+        assert pp.submit(open_flat, cache_path).result()
@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+import tempfile
+
+from filelock import FileLock
+
+from genericache import CacheStagingDirMismatch
+from genericache.disk_cache import DiskCache
+from tests import PayloadFetcher, hash_url
+
+PAYLOAD = b"staged" * 1000
+fetch_payload = PayloadFetcher([PAYLOAD])
+
+
+def fail_midway(url: str) -> Iterable[bytes]:
+    yield PAYLOAD
+    raise ConnectionError("connection reset")
+
+
+def staging_files(cache: DiskCache[str]) -> List[Path]:
+    return list(cache.staging_dir.iterdir())
+
+
+def open_cache_and_list_staging(cache_dir: Path) -> List[str]:
+    cache = DiskCache[str].create(
+        url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+    )
+    return [p.name for p in staging_files(cache)]
+
+
+if __name__ == "__main__":
+    for fsync in (False, True):
+        cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+        cache = DiskCache[str].create(
+            url_type=str,
+            cache_dir=Path(cache_dir.name),
+            url_hasher=hash_url,
+            fsync=fsync,
+        )
+        assert cache.staging_dir.parent == Path(cache_dir.name)
+        assert cache.fetch("a", fetcher=fetch_payload).read() == PAYLOAD
+        assert staging_files(cache) == []
+
+        try:
+            _ = cache.try_fetch("b", fail_midway, force_refetch=False)
+            assert False, "the fetch should have failed"
+        except ConnectionError:
+            pass
+        assert staging_files(cache) == []
+        assert cache.get_by_url(url="b") is None
+
+    # staging files of crashed processes are cleaned up, but not those being written
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    staging_dir = Path(cache_dir.name) / DiskCache.STAGING_DIR_NAME
+    staging_dir.mkdir()
+    orphan = staging_dir / f"{DiskCache.STAGING_PREFIX}{hash_url('orphan')}_x1"
+    in_progress = staging_dir / f"{DiskCache.STAGING_PREFIX}{hash_url('busy')}_x2"
+    unrelated = staging_dir / "something_else"
+    for path in (orphan, in_progress, unrelated):
+        _ = path.write_bytes(b"partial")
+    busy_lock = Path(cache_dir.name) / f"downloading_url_{hash_url('busy')}.lock"
+    with FileLock(busy_lock):
+        with ProcessPoolExecutor(max_workers=1) as pp:
+            left = pp.submit(open_cache_and_list_staging, Path(cache_dir.name)).result()
+    assert sorted(left) == sorted([in_progress.name, unrelated.name])
+
+    # staging files must be renamed into place, so they can't be on another device
+    other_device = Path("/dev/shm")
+    if (
+        other_device.is_dir()
+        and other_device.stat().st_dev != staging_dir.stat().st_dev
+    ):
+        with tempfile.TemporaryDirectory(dir=other_device) as other_staging_dir:
+            cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+            out = DiskCache[str].try_create(
+                url_type=str,
+                cache_dir=Path(cache_dir.name),
+                url_hasher=hash_url,
+                staging_dir=Path(other_staging_dir),
+            )
+            assert isinstance(out, CacheStagingDirMismatch), out
@@ -0,0 +1,123 @@
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, List
+import gc
+import tempfile
+import threading
+import warnings
+
+from genericache import (
+    Cache,
+    CacheEntry,
+    DigestMismatch,
+    FetchInterrupted,
+    MemoryCache,
+    StreamingEntry,
+)
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import hash_url
+
+CHUNKS: List[bytes] = [bytes([i]) * 1000 for i in range(5)]
+PAYLOAD = b"".join(CHUNKS)
+PAYLOAD_DIGEST = ContentDigest(sha256(PAYLOAD).digest())
+
+
+class GatedFetcher:
+    """Yields the first chunk right away and the others once `release` is set"""
+
+    def __init__(self, *, fail: bool = False) -> None:
+        super().__init__()
+        self.release = threading.Event()
+        self.fail = fail
+        self.num_fetches = 0
+
+    def __call__(self, url: str) -> Iterable[bytes]:
+        self.num_fetches += 1
+        yield CHUNKS[0]
+        assert self.release.wait(timeout=10)
+        if self.fail:
+            raise ConnectionError("connection reset")
+        yield from CHUNKS[1:]
+
+
+def read_all(reader: "CacheEntry | StreamingEntry[str]") -> bytes:
+    out = bytearray()
+    while True:
+        data = reader.read(700)
+        if not data:
+            return bytes(out)
+        out.extend(data)
+
+
+def check_streaming(cache: Cache[str]) -> None:
+    fetcher = GatedFetcher()
+    first = cache.fetch_streaming("a", fetcher)
+    second = cache.fetch_streaming("a", fetcher)
+    assert isinstance(first, StreamingEntry) and isinstance(second, StreamingEntry)
+    # bytes are served before the fetcher is done
+    assert first.read(1500) == CHUNKS[0]
+    assert second.read(10) == CHUNKS[0][:10]
+    fetcher.release.set()
+    assert first.read() == PAYLOAD[1000:]
+    assert read_all(second) == PAYLOAD[10:]
+    assert first.wait_content_digest() == PAYLOAD_DIGEST
+    assert fetcher.num_fetches == 1
+
+    entry = cache.get(digest=PAYLOAD_DIGEST)
+    assert entry is not None and entry.read() == PAYLOAD
+
+    _ = second.seek(-5, 2)
+    assert second.read() == PAYLOAD[-5:]
+
+    # cached entries are served straight from the cache
+    cached = cache.fetch_streaming("a", fetcher)
+    assert isinstance(cached, CacheEntry)
+    assert read_all(cached) == PAYLOAD
+    assert fetcher.num_fetches == 1
+
+    # the entry that the background fetch ends with is closed, not left to the GC
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        released = GatedFetcher()
+        released.release.set()
+        with cache.fetch_streaming("d", released) as streamed:
+            assert read_all(streamed) == PAYLOAD
+        for thread in threading.enumerate():
+            if thread.name.startswith("genericache-fetch-"):
+                thread.join()
+        _ = gc.collect()
+    assert not [w for w in caught if w.category is ResourceWarning], caught
+
+    failing = GatedFetcher(fail=True)
+    reader = cache.fetch_streaming("b", failing)
+    assert reader.read(1000) == CHUNKS[0]
+    failing.release.set()
+    try:
+        _ = read_all(reader)
+        assert False, "the fetch failed, so reading should fail too"
+    except FetchInterrupted:
+        pass
+    assert cache.get_by_url(url="b") is None
+
+    mismatched = GatedFetcher()
+    mismatched.release.set()
+    reader = cache.fetch_streaming(
+        "c", mismatched, force_refetch=ContentDigest(sha256(b"other").digest())
+    )
+    try:
+        _ = read_all(reader)
+        assert False, "the digest should have been checked at EOF"
+    except DigestMismatch:
+        pass
+
+
+if __name__ == "__main__":
+    check_streaming(MemoryCache(url_hasher=hash_url))
+
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    check_streaming(
+        DiskCache[str].create(
+            url_type=str, cache_dir=Path(cache_dir.name), url_hasher=hash_url
+        )
+    )
@@ -0,0 +1,89 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from typing import List
+import gc
+import tempfile
+import warnings
+
+from genericache import DigestMismatch, MemoryCache, TieredCache
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import PAYLOADS, fetch_payload, hash_url, random_range
+
+PAYLOAD_LEN = len(PAYLOADS[0])
+
+
+def create_tiered_cache(cache_dir: Path, max_entries: int) -> TieredCache[str]:
+    return TieredCache(
+        memory=MemoryCache(url_hasher=hash_url, max_entries=max_entries),
+        disk=DiskCache[str].create(
+            url_type=str, cache_dir=cache_dir, url_hasher=hash_url
+        ),
+    )
+
+
+def fetch_and_read(cache: TieredCache[str], idx: int) -> bytes:
+    return cache.fetch(str(idx), fetch_payload).read()
+
+
+def fetch_all_via_tiered_cache(cache_dir: Path, process_idx: int) -> int:
+    cache = create_tiered_cache(cache_dir, max_entries=3)
+    pool = ThreadPoolExecutor(max_workers=len(PAYLOADS))
+    indices = random_range(seed=process_idx, len=len(PAYLOADS)) * 3
+    futs: "List[Future[bytes]]" = [
+        pool.submit(fetch_and_read, cache, idx) for idx in indices
+    ]
+    for idx, fut in zip(indices, futs):
+        assert fut.result() == PAYLOADS[idx]
+    return cache.misses()
+
+
+if __name__ == "__main__":
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    cache = create_tiered_cache(Path(cache_dir.name), max_entries=2)
+
+    assert cache.fetch("0", fetch_payload).read() == PAYLOADS[0]
+    assert (cache.memory.misses(), cache.disk.misses()) == (1, 1)
+
+    assert cache.fetch("0", fetch_payload).read() == PAYLOADS[0]
+    assert cache.memory.hits() == 1 and cache.disk.hits() == 0
+
+    _ = cache.fetch("1", fetch_payload)
+    _ = cache.fetch("2", fetch_payload)  # pushes "0" out of the memory tier
+    assert cache.memory.get_by_url(url="0") is None
+
+    # served by the disk tier and promoted back into memory
+    assert cache.fetch("0", fetch_payload).read() == PAYLOADS[0]
+    assert cache.disk.hits() == 1
+    assert cache.memory.get_by_url(url="0") is not None
+    assert cache.misses() == 3
+
+    # the disk entries that are copied into memory are closed, not left to the GC
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        promoted = cache.get_by_url(url="1")
+        assert promoted is not None and promoted.read() == PAYLOADS[1]
+        assert cache.fetch("4", fetch_payload).read() == PAYLOADS[4]
+        _ = gc.collect()
+    assert not [w for w in caught if w.category is ResourceWarning], caught
+    assert cache.misses() == 4
+
+    entry = cache.get(digest=ContentDigest(sha256(PAYLOADS[1]).digest()))
+    assert entry is not None and entry.read() == PAYLOADS[1]
+
+    mismatch = cache.try_fetch(
+        "3",
+        fetch_payload,
+        force_refetch=ContentDigest(sha256(PAYLOADS[4]).digest()),
+    )
+    assert isinstance(mismatch, DigestMismatch)
+
+    # one fetch per URL across threads and processes sharing the disk tier
+    cache_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    with ProcessPoolExecutor(max_workers=4) as pp:
+        misses = [
+            pp.submit(fetch_all_via_tiered_cache, Path(cache_dir.name), process_idx)
+            for process_idx in range(4)
+        ]
+        assert sum(f.result() for f in misses) == len(PAYLOADS)
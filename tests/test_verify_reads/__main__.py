@@ -0,0 +1,80 @@
+from hashlib import sha256
+from io import BytesIO
+from pathlib import Path
+import tempfile
+
+from genericache import DigestMismatch, VerifyingReader
+from genericache.digest import ContentDigest
+from genericache.disk_cache import DiskCache
+from tests import PayloadFetcher, hash_url
+
+PAYLOAD = bytes(range(256)) * 1024
+fetch_payload = PayloadFetcher([PAYLOAD])
+
+
+def reads_corrupt(reader: VerifyingReader, chunk_size: int = -1) -> bool:
+    try:
+        while reader.read(chunk_size) and chunk_size > 0:
+            pass
+        return False
+    except DigestMismatch:
+        return True
+
+
+def verifying(contents: bytes) -> VerifyingReader:
+    digest = ContentDigest(digest=sha256(PAYLOAD).digest())
+    return VerifyingReader(BytesIO(contents), url="x", content_digest=digest)
+
+
+def corrupted_cache(cache_dir: Path, verify_reads: int) -> "DiskCache[str]":
+    cache = DiskCache[str].create(
+        url_type=str,
+        cache_dir=cache_dir,
+        url_hasher=hash_url,
+        verify_reads=verify_reads,
+    )
+    _ = cache.fetch("a", fetch_payload)
+    entry_path = next(cache_dir.glob(f"entry__url_{hash_url('a')}_*"))
+    _ = entry_path.write_bytes(b"x" + PAYLOAD[1:])
+    return cache
+
+
+if __name__ == "__main__":
+    # contents are checked when the read that reaches EOF returns
+    assert not reads_corrupt(verifying(PAYLOAD))
+    assert not reads_corrupt(verifying(PAYLOAD), chunk_size=1000)
+    assert reads_corrupt(verifying(PAYLOAD[:-1] + b"x"))
+    assert reads_corrupt(verifying(PAYLOAD[:-1] + b"x"), chunk_size=1000)
+
+    # bytes skipped by a seek are not checked, unless they are read later
+    reader = verifying(PAYLOAD[:-1] + b"x")
+    _ = reader.seek(1000)
+    assert not reads_corrupt(reader, chunk_size=1000)
+    _ = reader.seek(0)
+    _ = reader.read(500)
+    _ = reader.seek(200)  # rereading is fine
+    assert reads_corrupt(reader, chunk_size=1000)
+
+    # caches only verify the entries they are told to
+    unverified_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    unverified = corrupted_cache(Path(unverified_dir.name), verify_reads=0)
+    assert unverified.fetch("a", fetch_payload).read()[0:1] == b"x"
+
+    verified_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    verified = corrupted_cache(Path(verified_dir.name), verify_reads=1)
+    try:
+        _ = verified.fetch("a", fetch_payload).read()
+        raise AssertionError("should have raised")
+    except DigestMismatch:
+        pass
+
+    sampled_dir = tempfile.TemporaryDirectory(suffix="_cache")
+    sampled = corrupted_cache(Path(sampled_dir.name), verify_reads=3)
+    detected = 0
+    for _ in range(6):
+        entry = sampled.fetch("a", fetch_payload)
+        try:
+            _ = entry.read()
+        except DigestMismatch:
+            detected += 1
+    assert detected == 2